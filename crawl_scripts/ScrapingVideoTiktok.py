@@ -2,7 +2,7 @@
 # ===========================
 # 0) CÀI THƯ VIỆN CẦN THIẾT
 # ===========================
-!pip -q install yt-dlp requests pandas xlsxwriter
+!pip -q install yt-dlp requests pandas xlsxwriter aiohttp pyarrow
 print("✅ Đã cài đặt xong các thư viện cần thiết.")
 
 
@@ -173,6 +173,12 @@ def download_tiktok_with_yt_dlp(video_url, out_dir, write_info_json=True, max_fi
 # 5) CRAWL COMMENT (WEB API KHÔNG CHÍNH THỨC) BẰNG session
 #    Lưu ý: Có thể 403/empty trên Colab dù có cookies.
 # ===========================
+import sys
+
+# comment_crawler.py nằm cạnh notebook (Colab: upload cùng thư mục làm việc)
+sys.path.append(ROOT_DIR)
+from comment_crawler import ParquetSink, _comment_item, crawl_comments_dataset
+
 def fetch_comments_web(aweme_id: str, session: requests.Session, max_comments=200, sleep=1.0):
     url = "https://www.tiktok.com/api/comment/list/"
     cursor, out = 0, []
@@ -222,15 +228,7 @@ def fetch_all_comments_with_replies_web(aweme_id: str, session: requests.Session
     comments = fetch_comments_web(aweme_id, session, max_comments=max_comments, sleep=sleep)
     results = []
     for c in comments:
-        item = {
-            "cid": c.get("cid"),
-            "text": c.get("text"),
-            "author": (c.get("user") or {}).get("nickname"),
-            "create_time": c.get("create_time"),
-            "like_count": c.get("digg_count"),
-            "reply_count": c.get("reply_comment_total"),
-            "replies": []
-        }
+        item = _comment_item(c)
         try:
             if item["cid"]:
                 rs = fetch_replies_web(aweme_id, item["cid"], session, max_replies=max_replies_per_comment, sleep=sleep)
@@ -241,6 +239,17 @@ def fetch_all_comments_with_replies_web(aweme_id: str, session: requests.Session
     return results
 
 
+# %%
+# ===========================
+# 5b) CRAWL COMMENT BẤT ĐỒNG BỘ (aiohttp) -> comment_crawler.py (mục 5 đã import)
+#    - Reply của các comment trong 1 trang được tải song song (asyncio.gather),
+#      nhiều video chạy song song; nhịp request giới hạn theo host.
+#    - Comment không có reply (reply_comment_total = 0) -> không gọi API reply.
+#    - Kết quả ghi dần vào 1 Parquet dataset (ParquetSink, mục 7), cursor từng video
+#      lưu ở checkpoint -> chạy lại tiếp từ trang dở.
+# ===========================
+
+
 # %%
 # ===========================
 # 6) HÀM CRAWL 1 VIDEO: oEmbed → yt-dlp → comments → JSON
@@ -357,70 +366,14 @@ def crawl_one_tiktok(video_url, out_dir, use_comments=False, max_comments=200, m
 
 
 # %%
-
-
-def export_comments_to_excel(all_items, aweme_id: str, out_dir: str):
-    import os, pandas as pd
-    os.makedirs(out_dir, exist_ok=True)
-
-    rows = []
-    for c in all_items or []:
-        # Top-level
-        rows.append({
-            "video_id": aweme_id,
-            "cid": c.get("cid"),
-            "parent_cid": None,
-            "is_reply": 0,
-            "author_name": c.get("author"),
-            "text": c.get("text"),
-            "like_count": c.get("like_count"),
-            "reply_count": c.get("reply_count"),
-            "create_time": c.get("create_time"),
-        })
-        # Replies
-        for r in (c.get("replies") or []):
-            ru = r.get("user") or {}
-            rows.append({
-                "video_id": aweme_id,
-                "cid": r.get("cid"),
-                "parent_cid": c.get("cid"),
-                "is_reply": 1,
-                "author_name": ru.get("nickname"),
-                "text": r.get("text"),
-                "like_count": r.get("digg_count") or r.get("like_count"),
-                "reply_count": r.get("reply_comment_total") or r.get("reply_count"),
-                "create_time": r.get("create_time"),
-            })
-
-    df = pd.DataFrame(rows)
-
-    # Epoch -> datetime (tz-aware), rồi bỏ tz để Excel chấp nhận
-    if "create_time" in df.columns:
-        dt_utc = pd.to_datetime(df["create_time"], unit="s", errors="coerce", utc=True)
-        # BẢN NAIVE (không timezone)
-        df["created_at_utc"] = dt_utc.dt.tz_localize(None)
-        df["created_at_vn"]  = dt_utc.dt.tz_convert("Asia/Ho_Chi_Minh").dt.tz_localize(None)
-
-    # Sắp cột
-    cols = ["video_id","cid","parent_cid","is_reply","author_name",
-            "text","like_count","reply_count","create_time",
-            "created_at_utc","created_at_vn"]
-    df = df[[c for c in cols if c in df.columns]]
-
-    xlsx_path = os.path.join(out_dir, f"{aweme_id}_comments.xlsx")
-    with pd.ExcelWriter(xlsx_path, engine="xlsxwriter",
-                        datetime_format="yyyy-mm-dd hh:mm:ss") as writer:
-        df.to_excel(writer, index=False, sheet_name="comments")
-        ws = writer.sheets["comments"]
-        ws.freeze_panes(1, 0)
-        # Auto-width
-        for i, col in enumerate(df.columns):
-            maxlen = min(60, max(10, df[col].astype(str).str.len().max() if not df.empty else 10))
-            ws.set_column(i, i, maxlen + 2)
-
-    print("✅ Saved Excel:", xlsx_path)
-    return xlsx_path, df
-
+# ===========================
+# 7) GHI COMMENT VÀO PARQUET DATASET (thay cho 1 file Excel / video)
+#    comments_parquet/label=<label>/part-*.parquet, cột như bản Excel cũ.
+#    Checkpoint (cursor từng video) chỉ cập nhật sau khi rows đã ghi ra đĩa
+#    (ParquetSink trong comment_crawler.py).
+# ===========================
+COMMENTS_DATASET_DIR = os.path.join(ROOT_DIR, "data_viet", "comments_parquet")
+COMMENTS_CHECKPOINT = os.path.join(CRAWL_DIR, "comments_checkpoint.json")
 
 
 # %%
@@ -498,27 +451,14 @@ else:
         try:
             print(f"   ⬇️ Bắt đầu crawl vào: {video_specific_dir} ...")
 
-            # --- GỌI HÀM CRAWL GỐC ---
+            # --- GỌI HÀM CRAWL GỐC (comment lấy ở bước 3, bất đồng bộ) ---
             res, jsonp = crawl_one_tiktok(
                 original_url,
                 video_specific_dir,
-                use_comments=True,          # Lấy comment
-                max_comments=200,           # Tăng số lượng nếu cần
-                max_replies_per_comment=50,
-                sleep=1.0                   # Nghỉ giữa các lần gọi API comment
+                use_comments=False,
             )
             print(f"   ✅ Metadata JSON saved: {os.path.basename(jsonp)}")
 
-            # --- XUẤT EXCEL COMMENT ---
-            cmts = res.get("comments", [])
-            if cmts:
-                # Gọi hàm export_comments_to_excel gốc
-                xlsx_path, _ = export_comments_to_excel(cmts, aweme_id, video_specific_dir)
-                if xlsx_path:
-                    print(f"   ✅ Comments Excel saved: {os.path.basename(xlsx_path)} ({len(cmts)} cmts)")
-            else:
-                print("   ℹ️ Không tìm thấy comment nào.")
-
         except Exception as e:
              print(f"   ❌ LỖI KHI CRAWL VIDEO NÀY: {e}")
              # Có thể xóa thư mục lỗi nếu muốn sạch sẽ
@@ -529,6 +469,27 @@ else:
         print("   💤 Đang nghỉ 5s...")
         time.sleep(5)
 
+    # 3. Comment + reply của mọi video: bất đồng bộ, ghi vào Parquet dataset.
+    #    Chạy lại cell -> video đã xong bị bỏ qua, video dở chạy tiếp từ cursor cuối.
+    videos = []
+    for row in df_videos.itertuples(index=False):
+        aweme_id = extract_aweme_id_from_url(row.link)
+        if aweme_id:
+            videos.append((aweme_id, row.label))
+    sink = ParquetSink(COMMENTS_DATASET_DIR, COMMENTS_CHECKPOINT)
+    print(f"\n💬 Crawl comment {len(videos)} video "
+          f"({sum(1 for v, _ in videos if sink.checkpoint.get(v, {}).get('done'))} đã xong trước đó)...")
+    # Notebook đã có event loop -> await trực tiếp (script thường: asyncio.run(...))
+    totals = await crawl_comments_dataset(
+        videos, sink, sink.checkpoint,
+        cookies={c.name: c.value for c in cj if "tiktok.com" in c.domain},
+        video_concurrency=4,
+        rate_per_sec=2.0,        # thay cho sleep 1s giữa mỗi request
+        max_comments=200,
+        max_replies_per_comment=50,
+    )
+    print(f"✅ Comments: {sum(totals.values())} comment mới -> {COMMENTS_DATASET_DIR}")
+
     print("\n🎉🎉🎉 ĐÃ HOÀN TẤT TOÀN BỘ DANH SÁCH VIDEO! 🎉🎉🎉")
 
 
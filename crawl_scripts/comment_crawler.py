@@ -0,0 +1,268 @@
+"""
+Crawl comment + reply TikTok bất đồng bộ (aiohttp) và ghi ra Parquet dataset.
+
+Tách khỏi notebook ScrapingVideoTiktok.py (cell có `!pip` / top-level await) để
+import và test được:
+- Reply của các comment trong 1 trang được tải song song (asyncio.gather), nhiều
+  video chạy song song; nhịp request giới hạn theo host (HostRateLimiter).
+- Comment không có reply (reply_comment_total = 0) -> không gọi API reply.
+- ParquetSink: <root>/label=<label>/part-*.parquet. Cursor từng video chỉ ghi vào
+  checkpoint sau khi rows của trang đã ghi ra đĩa -> dừng giữa chừng rồi chạy lại
+  tiếp từ trang dở, không trùng dòng.
+"""
+
+import asyncio
+import json
+import os
+import random
+import uuid
+from urllib.parse import urlparse
+
+import aiohttp
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+COMMENT_API = "https://www.tiktok.com/api/comment/list/"
+REPLY_API = "https://www.tiktok.com/api/comment/list/reply/"
+
+
+def _comment_item(c):
+    """Comment từ web API -> dict gọn (replies điền sau)."""
+    return {
+        "cid": c.get("cid"),
+        "text": c.get("text"),
+        "author": (c.get("user") or {}).get("nickname"),
+        "create_time": c.get("create_time"),
+        "like_count": c.get("digg_count"),
+        "reply_count": c.get("reply_comment_total"),
+        "replies": [],
+    }
+
+
+class HostRateLimiter:
+    """Tối đa `rate_per_sec` request/giây và `max_concurrency` request đang chạy mỗi host."""
+
+    def __init__(self, rate_per_sec=2.0, max_concurrency=4):
+        self.interval = 1.0 / rate_per_sec
+        self.max_concurrency = max_concurrency
+        self._hosts = {}  # host -> [lock, semaphore, next_start]
+
+    def _state(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = [asyncio.Lock(), asyncio.Semaphore(self.max_concurrency), 0.0]
+        return self._hosts[host]
+
+    async def wait(self, host):
+        """Giữ 1 slot của host (trả lại bằng release)."""
+        lock, semaphore, _ = state = self._state(host)
+        await semaphore.acquire()
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = state[2] - loop.time()
+            state[2] = max(state[2], loop.time()) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def release(self, host):
+        self._state(host)[1].release()
+
+    def backoff(self, host, seconds):
+        """Bị 429/403 -> dời lượt kế tiếp của host."""
+        state = self._state(host)
+        state[2] = max(state[2], asyncio.get_running_loop().time() + seconds)
+
+
+async def fetch_json_async(http, limiter, url, params, retries=3):
+    host = urlparse(url).netloc
+    for attempt in range(retries):
+        await limiter.wait(host)
+        try:
+            async with http.get(url, params=params, timeout=aiohttp.ClientTimeout(total=20)) as r:
+                if r.status in (403, 429):
+                    limiter.backoff(host, 10 * 2 ** attempt + random.uniform(0, 3))
+                    continue
+                if r.status != 200:
+                    print("HTTP", r.status, url)
+                    return None
+                return await r.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"⚠️ {url}: {e}")
+        finally:
+            limiter.release(host)
+    return None
+
+
+async def fetch_replies_async(http, limiter, aweme_id, comment_id, max_replies=50):
+    cursor, out = 0, []
+    while len(out) < max_replies:
+        params = {"aid": 1988, "aweme_id": aweme_id, "comment_id": comment_id, "cursor": cursor, "count": 20}
+        data = await fetch_json_async(http, limiter, REPLY_API, params)
+        if not data:
+            break
+        out.extend(data.get("comments") or [])
+        if not data.get("has_more"):
+            break
+        cursor = data.get("cursor", cursor + 20)
+    return out[:max_replies]
+
+
+async def crawl_video_comments_async(http, limiter, sink, checkpoint, aweme_id, label,
+                                     max_comments=200, max_replies_per_comment=50):
+    """Trang comment tuần tự theo cursor; reply của cả trang chạy song song.
+
+    Mỗi trang xong -> sink.add(rows, cursor kế tiếp); cursor chỉ được ghi vào checkpoint
+    khi rows của trang đã ghi ra Parquet.
+    """
+    state = checkpoint.get(aweme_id, {"cursor": 0, "fetched": 0, "done": False})
+    if state["done"]:
+        return 0
+    cursor, fetched = state["cursor"], state["fetched"]
+    while fetched < max_comments:
+        params = {"aid": 1988, "aweme_id": aweme_id, "cursor": cursor, "count": 20}
+        data = await fetch_json_async(http, limiter, COMMENT_API, params)
+        if data is None:
+            return fetched  # lỗi: giữ cursor cũ, lần sau chạy tiếp
+        comments = (data.get("comments") or [])[: max_comments - fetched]
+
+        async def with_replies(c):
+            item = _comment_item(c)
+            if item["cid"] and item["reply_count"]:
+                item["replies"] = await fetch_replies_async(
+                    http, limiter, aweme_id, item["cid"], max_replies=max_replies_per_comment
+                )
+            return item
+
+        items = await asyncio.gather(*(with_replies(c) for c in comments))
+        fetched += len(items)
+        cursor = data.get("cursor", cursor + 20)
+        done = not data.get("has_more") or fetched >= max_comments
+        sink.add(
+            comment_rows(items, aweme_id, label),
+            checkpoint_update=(aweme_id, {"cursor": cursor, "fetched": fetched, "done": done}),
+        )
+        if done:
+            break
+    return fetched
+
+
+async def crawl_comments_dataset(videos, sink, checkpoint, cookies=None, video_concurrency=4,
+                                 rate_per_sec=2.0, max_comments=200, max_replies_per_comment=50):
+    """videos: list (aweme_id, label); cookies: {name: value} của tiktok.com.
+    Ghi toàn bộ comment + reply vào sink."""
+    limiter = HostRateLimiter(rate_per_sec=rate_per_sec, max_concurrency=video_concurrency)
+    gate = asyncio.Semaphore(video_concurrency)
+    totals = {}
+
+    async with aiohttp.ClientSession(
+        cookies=cookies or {},
+        headers={"User-Agent": "Mozilla/5.0", "Referer": "https://www.tiktok.com/"},
+        connector=aiohttp.TCPConnector(limit_per_host=video_concurrency),
+    ) as http:
+
+        async def one(aweme_id, label):
+            async with gate:
+                totals[aweme_id] = await crawl_video_comments_async(
+                    http, limiter, sink, checkpoint, aweme_id, label,
+                    max_comments=max_comments, max_replies_per_comment=max_replies_per_comment,
+                )
+
+        await asyncio.gather(*(one(vid, label) for vid, label in videos))
+    sink.flush()
+    return totals
+
+
+def comment_rows(all_items, aweme_id: str, label: str):
+    """Comment + reply -> list dict (mỗi dòng 1 comment, reply có parent_cid)."""
+    rows = []
+    for c in all_items or []:
+        # Top-level
+        rows.append({
+            "video_id": aweme_id,
+            "label": label,
+            "cid": c.get("cid"),
+            "parent_cid": None,
+            "is_reply": 0,
+            "author_name": c.get("author"),
+            "text": c.get("text"),
+            "like_count": c.get("like_count"),
+            "reply_count": c.get("reply_count"),
+            "create_time": c.get("create_time"),
+        })
+        # Replies
+        for r in (c.get("replies") or []):
+            ru = r.get("user") or {}
+            rows.append({
+                "video_id": aweme_id,
+                "label": label,
+                "cid": r.get("cid"),
+                "parent_cid": c.get("cid"),
+                "is_reply": 1,
+                "author_name": ru.get("nickname"),
+                "text": r.get("text"),
+                "like_count": r.get("digg_count") or r.get("like_count"),
+                "reply_count": r.get("reply_comment_total") or r.get("reply_count"),
+                "create_time": r.get("create_time"),
+            })
+    return rows
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+COMMENT_SCHEMA = pa.schema([
+    ("video_id", pa.string()),
+    ("label", pa.string()),
+    ("cid", pa.string()),
+    ("parent_cid", pa.string()),
+    ("is_reply", pa.int8()),
+    ("author_name", pa.string()),
+    ("text", pa.string()),
+    ("like_count", pa.int64()),
+    ("reply_count", pa.int64()),
+    ("create_time", pa.int64()),
+])
+
+
+class ParquetSink:
+    """Gom rows trong RAM, mỗi `flush_rows` dòng ghi 1 file part (partition theo label)."""
+
+    def __init__(self, root, checkpoint_path, checkpoint=None, flush_rows=5000):
+        self.root = root
+        self.checkpoint = checkpoint if checkpoint is not None else load_checkpoint(checkpoint_path)
+        self.checkpoint_path = checkpoint_path
+        self.flush_rows = flush_rows
+        self.rows = []
+        self.pending = {}  # cursor chờ ghi checkpoint
+        self.written = 0
+
+    def add(self, rows, checkpoint_update=None):
+        self.rows.extend(rows)
+        if checkpoint_update:
+            aweme_id, state = checkpoint_update
+            self.pending[aweme_id] = state
+        if len(self.rows) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            table = pa.Table.from_pylist(self.rows, schema=COMMENT_SCHEMA)
+            pq.write_to_dataset(
+                table,
+                self.root,
+                partition_cols=["label"],
+                basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            )
+            self.written += len(self.rows)
+            print(f"💾 Parquet: +{len(self.rows)} dòng (tổng {self.written})")
+            self.rows = []
+        if self.pending:
+            self.checkpoint.update(self.pending)
+            self.pending = {}
+            tmp = self.checkpoint_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.checkpoint, f)
+            os.replace(tmp, self.checkpoint_path)
@@ -7,6 +7,7 @@ Phiên bản Fix: Dùng logic khởi tạo Driver của file cũ (v1) để trá
 """
 
 import os
+import sys
 import time
 import random
 import pandas as pd
@@ -20,6 +21,10 @@ from selenium.webdriver.common.action_chains import ActionChains
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, WebDriverException
 
+# Crawl store dùng chung với streaming/ingestion (upsert theo video_id, export CSV)
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "streaming", "ingestion"))
+from crawl_store import CrawlStore
+
 
 # --- Exception tùy chỉnh ---
 class CaptchaException(Exception):
@@ -40,6 +45,7 @@ COOKIES_FILE = os.path.join(SCRIPT_DIR, "cookies.txt")
 OUTPUT_XLSX = os.path.join(CRAWL_DIR, "tiktok_links_full_viet.xlsx")
 OUTPUT_CSV = os.path.join(CRAWL_DIR, "tiktok_links_viet.csv")
 FAILED_TAGS_FILE = os.path.join(CRAWL_DIR, "failed_hashtags.txt")
+CRAWL_STORE = os.path.join(CRAWL_DIR, "crawl_store.sqlite")
 
 # ---------------- BỘ TỪ KHÓA VIỆT NAM ----------------
 RISKY_HASHTAGS = [
@@ -308,6 +314,21 @@ def collect_hashtag_links(
             continue
 
 
+def save_to_store(df_new):
+    """Upsert link mới vào crawl store rồi export lại OUTPUT_CSV (không trùng link)."""
+    is_new = not os.path.exists(CRAWL_STORE)
+    store = CrawlStore(CRAWL_STORE)
+    try:
+        if is_new and os.path.exists(OUTPUT_CSV):
+            store.import_csv(OUTPUT_CSV)  # lần đầu: giữ dữ liệu CSV cũ
+        for (tag, label), group in df_new.groupby(["hashtag", "label"]):
+            store.upsert(tag, [{"link": link} for link in group["link"]], label)
+        count = store.export_csv(OUTPUT_CSV)
+        print(f"💾 Saved {count} rows. {store.stats()}")
+    finally:
+        store.close()
+
+
 def main():
     try:
         os.makedirs(CRAWL_DIR, exist_ok=True)
@@ -363,8 +384,7 @@ def main():
             all_df = all_df.drop_duplicates(subset=["link"], keep="last")
             try:
                 all_df.to_excel(OUTPUT_XLSX, index=False)
-                all_df.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
-                print(f"💾 Saved {len(all_df)} rows.")
+                save_to_store(df_new)
             except Exception as e:
                 print(f"Lỗi lưu file: {e}")
 
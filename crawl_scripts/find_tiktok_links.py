@@ -18,6 +18,7 @@ YÊU CẦU:
 """
 
 import os
+import sys
 import time
 import random
 import pandas as pd
@@ -31,6 +32,10 @@ from selenium.webdriver.common.action_chains import ActionChains
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, WebDriverException
 
+# Crawl store dùng chung với streaming/ingestion (upsert theo video_id)
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "streaming", "ingestion"))
+from crawl_store import CrawlStore
+
 
 # ---------------- CONFIG ----------------
 # --- NÂNG CẤP (v3.11): Tự động tìm đường dẫn ---
@@ -49,6 +54,7 @@ print(f"Thư mục lưu data (CRAWL_DIR): {CRAWL_DIR}")
 COOKIES_FILE = os.path.join(SCRIPT_DIR, "cookies.txt") # cookies.txt vẫn ở thư mục gốc
 OUTPUT_XLSX = os.path.join(CRAWL_DIR, "tiktok_links_full.xlsx")
 OUTPUT_CSV = os.path.join(CRAWL_DIR, "tiktok_links.csv")
+CRAWL_STORE = os.path.join(CRAWL_DIR, "crawl_store.sqlite")  # toàn bộ link, không trùng
 CAPTCHA_SLEEP_SECONDS = 120 # Ngủ 2 phút nếu bị CAPTCHA
 
 # --- Harmful Hashtags (Cập nhật v3.7 - Loại bỏ tag cấm, thêm tiếng lóng) ---
@@ -463,6 +469,13 @@ def main():
             post_dedup_count = len(all_df)
             print(f"Đã gộp dữ liệu. Tổng cộng: {post_dedup_count} link (đã xoá {pre_dedup_count - post_dedup_count} trùng lặp).")
 
+            # 4. Upsert link mới vào crawl store + xuất full dữ liệu
+            if not df_new.empty:
+                store = CrawlStore(CRAWL_STORE)
+                for (tag, label), group in df_new.groupby(["hashtag", "label"]):
+                    store.upsert(tag, [{"link": link} for link in group["link"]], label)
+                print(f"💾 Crawl store: {store.stats()}")
+                store.close()
             # 4. Xuất full dữ liệu
             try:
                 all_df.to_excel(OUTPUT_XLSX, index=False)
@@ -1,9 +1,14 @@
+import os
 from airflow import DAG
 from airflow.operators.bash import BashOperator
+from airflow.operators.python import PythonOperator
+from airflow.utils.trigger_rule import TriggerRule
 from datetime import datetime, timedelta
 
 # Đường dẫn trong Docker Airflow (cấu trúc mới sau refactor)
 INGESTION_PATH = "/opt/project/streaming/ingestion"
+# Số browser session song song (hashtag chia đều, mỗi shard 1 task)
+CRAWL_SHARDS = int(os.getenv("CRAWL_SHARDS", "1"))
 
 default_args = {
     "owner": "airflow",
@@ -11,6 +16,17 @@ default_args = {
     "retry_delay": timedelta(minutes=1),
 }
 
+
+def shard_commands():
+    """1 lệnh crawl / shard -> dynamic task mapping."""
+    shards = int(os.getenv("CRAWL_SHARDS", str(CRAWL_SHARDS)))
+    return [
+        f"xvfb-run -a --server-args='-screen 0 1920x1080x24' "
+        f"python {INGESTION_PATH}/crawler.py --shard {i} --shards {shards}"
+        for i in range(shards)
+    ]
+
+
 with DAG(
     "1_TIKTOK_ETL_COLLECTOR",
     default_args=default_args,
@@ -19,7 +35,7 @@ with DAG(
     catchup=False,
     # [QUAN TRỌNG] Chỉ cho phép 1 Instance chạy tại 1 thời điểm
     max_active_runs=1,
-    concurrency=1,
+    max_active_tasks=max(1, CRAWL_SHARDS),
     tags=["etl", "source"],
 ) as dag:
 
@@ -29,12 +45,29 @@ with DAG(
         bash_command="pg_isready -h postgres -U user -d tiktok_safety_db",
     )
 
-    # 2. Chạy Crawler (Xvfb Mode) - file renamed: crawler_links.py -> crawler.py
-    crawl_task = BashOperator(
+    # 2. Tạo crawl store (nạp CSV cũ) 1 lần trước khi các shard cùng ghi
+    init_store = BashOperator(
+        task_id="init_crawl_store",
+        bash_command=f"python {INGESTION_PATH}/crawler.py --init-store",
+    )
+
+    plan_shards = PythonOperator(
+        task_id="plan_crawl_shards",
+        python_callable=shard_commands,
+    )
+
+    # 3. Chạy Crawler (Xvfb Mode), 1 task / shard
+    crawl_task = BashOperator.partial(
         task_id="crawl_tiktok_links",
         # Thêm timeout để tự kill nếu treo quá 45p
-        bash_command=f"xvfb-run -a --server-args='-screen 0 1920x1080x24' python {INGESTION_PATH}/crawler.py",
         execution_timeout=timedelta(minutes=45),
+    ).expand(bash_command=plan_shards.output)
+
+    # 4. Gộp: các shard upsert chung crawl store -> export CSV (đã dedup) cho DAG 2
+    export_csv = BashOperator(
+        task_id="export_crawl_csv",
+        bash_command=f"python {INGESTION_PATH}/crawler.py --export",
+        trigger_rule=TriggerRule.ALL_DONE,
     )
 
-    check_infra >> crawl_task
+    check_infra >> init_store >> plan_shards >> crawl_task >> export_csv
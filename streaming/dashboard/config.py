@@ -19,6 +19,15 @@ DB_CONFIG = {
     "port": os.getenv("POSTGRES_PORT", "5432"),
 }
 
+# SQLAlchemy pool (1 engine / process, dùng chung cho mọi session)
+DB_POOL_CONFIG = {
+    "pool_size": int(os.getenv("DASHBOARD_DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DASHBOARD_DB_MAX_OVERFLOW", "5")),
+    "pool_timeout": 10,  # chờ connection rảnh tối đa (giây)
+    "pool_recycle": 1800,  # đóng connection cũ trước khi Postgres / proxy cắt
+    "statement_timeout_ms": int(os.getenv("DASHBOARD_STATEMENT_TIMEOUT_MS", "15000")),
+}
+
 # MinIO Config
 MINIO_CONF = {
     "public_endpoint": _minio_endpoint,
@@ -46,7 +55,15 @@ AIRFLOW_AUTH = (
 APP_CONFIG = {
     "refresh_interval": 30000,  # 30 seconds
     "max_records": 500,
+    # get_data(): chỉ đọc dòng mới / vừa cập nhật sau watermark processed_at
+    "delta_overlap_sec": 30,  # đọc lùi lại để không sót transaction commit trễ
+    "delta_min_interval_sec": 2,  # các session refresh trong khoảng này dùng chung 1 lần đọc
+    "full_reload_interval_sec": 300,  # đọc lại toàn bộ để bỏ dòng đã bị xóa
     "items_per_page": 12,
+    # Gallery: JPEG thumbnail per card instead of loading the MP4 (ingestion MEDIA_THUMBNAIL_COUNT > 0)
+    "thumbnails": os.getenv("DASHBOARD_THUMBNAILS", "true").lower() == "true",
+    # Gallery player: 224p proxy clip (ingestion MEDIA_PROXY_ENABLED=true)
+    "proxy_videos": os.getenv("DASHBOARD_PROXY_VIDEOS", "false").lower() == "true",
 }
 
 # Blacklist keywords for content moderation
@@ -10,87 +10,158 @@ import subprocess
 from sqlalchemy import create_engine, text
 from config import (
     DB_CONFIG,
+    DB_POOL_CONFIG,
     MINIO_CONF,
     AIRFLOW_API_URL,
     AIRFLOW_AUTH,
     BLACKLIST_KEYWORDS,
     APP_CONFIG,
 )
+from results_cache import ResultsCache, normalize_results
 
 
+@st.cache_resource
 def get_db_engine():
-    """Create SQLAlchemy engine for database connection"""
+    """Process-wide SQLAlchemy engine (connection pool reused by every query/session)"""
     url = f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
-    return create_engine(url)
+    return create_engine(
+        url,
+        pool_size=DB_POOL_CONFIG["pool_size"],
+        max_overflow=DB_POOL_CONFIG["max_overflow"],
+        pool_timeout=DB_POOL_CONFIG["pool_timeout"],
+        pool_recycle=DB_POOL_CONFIG["pool_recycle"],
+        pool_pre_ping=True,  # bỏ connection chết (Postgres restart) thay vì báo lỗi
+        connect_args={
+            "options": f"-c statement_timeout={DB_POOL_CONFIG['statement_timeout_ms']}",
+            "application_name": "tiktok-dashboard",
+        },
+    )
 
 
 def get_db_connection():
-    """Get raw psycopg2-style connection via SQLAlchemy"""
+    """Get a pooled connection via SQLAlchemy (close() returns it to the pool)"""
     engine = get_db_engine()
     return engine.connect()
 
 
-@st.cache_data(ttl=5)
+RESULT_COLUMNS = """video_id, raw_text, human_label, text_verdict, video_verdict,
+                   text_score, video_score, avg_score, final_decision, processed_at"""
+
+
+@st.cache_resource
+def _results_cache(limit):
+    return ResultsCache(
+        limit,
+        columns=RESULT_COLUMNS,
+        overlap_sec=APP_CONFIG["delta_overlap_sec"],
+        min_interval_sec=APP_CONFIG["delta_min_interval_sec"],
+        full_reload_interval_sec=APP_CONFIG["full_reload_interval_sec"],
+    )
+
+
+def reset_data_cache():
+    """Buộc get_data() đọc lại toàn bộ ở lần gọi tới (nút Refresh Data)"""
+    _results_cache(APP_CONFIG["max_records"]).reset()
+
+
 def get_data(limit=None):
-    """Fetch processed results from database"""
+    """Fetch processed results from database (incremental, cached per process)"""
     try:
-        engine = get_db_engine()
-        limit_val = limit or APP_CONFIG["max_records"]
-        query = f"""
-            SELECT video_id, raw_text, human_label, text_verdict, video_verdict, 
-                   text_score, video_score, avg_score, final_decision, processed_at 
-            FROM processed_results 
-            ORDER BY processed_at DESC LIMIT {limit_val};
-        """
-        df = pd.read_sql(query, engine)
-        if not df.empty:
-            df["final_decision"] = df["final_decision"].str.lower().str.strip()
-            df["processed_at"] = pd.to_datetime(df["processed_at"])
-            df["Category"] = df["final_decision"].apply(
-                lambda x: "Harmful" if "harmful" in str(x) else "Safe"
-            )
-        return df
+        cache = _results_cache(limit or APP_CONFIG["max_records"])
+        # Copy: page module có thể thêm cột mà không làm bẩn frame dùng chung
+        return cache.get(get_db_engine()).copy()
     except Exception as e:
         st.error(f"Database error: {e}")
         return pd.DataFrame()
 
 
+# Cột category (generated) + index keyset có trong init.sql; DB cũ cần chạy
+# `./scripts/run_database.sh migrate`. Chưa migrate -> lọc bằng biểu thức cũ.
+HARMFUL_PATTERN = "%harmful%"
+CATEGORY_FALLBACK_SQL = (
+    "CASE WHEN LOWER(final_decision) LIKE :harmful_pattern THEN 'Harmful' ELSE 'Safe' END"
+)
+
+
+@st.cache_data(ttl=60)
+def has_category_column():
+    """processed_results đã có cột category chưa (cache 60s: migrate xong tự dùng cột mới)"""
+    query = text(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'processed_results' AND column_name = 'category'
+    """
+    )
+    return not pd.read_sql(query, get_db_engine()).empty
+
+
+def _category_sql():
+    return "category" if has_category_column() else CATEGORY_FALLBACK_SQL
+
+
+@st.cache_data(ttl=60)
+def get_result_counts():
+    """Số video theo category ({"Harmful": n, "Safe": m}), cache 60s thay vì COUNT(*) mỗi trang"""
+    query = text(
+        f"""
+        SELECT {_category_sql()} AS category, COUNT(*) AS count
+        FROM processed_results GROUP BY 1
+    """
+    )
+    df = pd.read_sql(query, get_db_engine(), params={"harmful_pattern": HARMFUL_PATTERN})
+    return {row["category"]: int(row["count"]) for _, row in df.iterrows()}
+
+
 @st.cache_data(ttl=10)
-def get_all_data_paginated(page=1, per_page=12, filter_category=None):
-    """Fetch paginated data for gallery view"""
-    try:
-        engine = get_db_engine()
-        offset = (page - 1) * per_page
+def _fetch_gallery_page(per_page, filter_category, cursor):
+    conditions = []
+    params = {"limit": per_page + 1, "harmful_pattern": HARMFUL_PATTERN}  # +1 dòng để biết còn trang sau
+    if filter_category in ("Harmful", "Safe"):
+        conditions.append(f"{_category_sql()} = :category")
+        params["category"] = filter_category
+    if cursor is not None:
+        conditions.append("(processed_at, video_id) < (:cursor_ts, :cursor_id)")
+        params["cursor_ts"] = pd.Timestamp(cursor[0]).to_pydatetime()
+        params["cursor_id"] = cursor[1]
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query = text(
+        f"""
+        SELECT {RESULT_COLUMNS}
+        FROM processed_results
+        {where_clause}
+        ORDER BY processed_at DESC, video_id DESC
+        LIMIT :limit;
+    """
+    )
+    return normalize_results(pd.read_sql(query, get_db_engine(), params=params))
 
-        where_clause = ""
-        if filter_category == "Harmful":
-            where_clause = "WHERE LOWER(final_decision) LIKE '%harmful%'"
-        elif filter_category == "Safe":
-            where_clause = "WHERE LOWER(final_decision) NOT LIKE '%harmful%'"
 
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM processed_results {where_clause};"
-        total = pd.read_sql(count_query, engine).iloc[0, 0]
+def get_all_data_paginated(per_page=12, filter_category=None, cursor=None):
+    """
+    Fetch one gallery page with keyset pagination on (processed_at, video_id).
 
-        # Get paginated data
-        query = f"""
-            SELECT video_id, raw_text, human_label, text_verdict, video_verdict, 
-                   text_score, video_score, avg_score, final_decision, processed_at 
-            FROM processed_results 
-            {where_clause}
-            ORDER BY processed_at DESC 
-            LIMIT {per_page} OFFSET {offset};
-        """
-        df = pd.read_sql(query, engine)
-        if not df.empty:
-            df["final_decision"] = df["final_decision"].str.lower().str.strip()
-            df["processed_at"] = pd.to_datetime(df["processed_at"])
-            df["Category"] = df["final_decision"].apply(
-                lambda x: "Harmful" if "harmful" in str(x) else "Safe"
-            )
-        return df, total
+    cursor: (processed_at, video_id) của dòng cuối trang trước, None = trang đầu.
+    Returns: (df, total, next_cursor) — next_cursor None nếu là trang cuối.
+    Trang sâu tốn như trang đầu: index seek thay vì offset đọc bỏ các trang trước.
+    """
+    try:
+        df = _fetch_gallery_page(per_page, filter_category, cursor)
+        next_cursor = None
+        if len(df) > per_page:
+            df = df.head(per_page)
+            last = df.iloc[-1]
+            next_cursor = (last["processed_at"], last["video_id"])
+
+        counts = get_result_counts()
+        if filter_category in ("Harmful", "Safe"):
+            total = counts.get(filter_category, 0)
+        else:
+            total = sum(counts.values())
+        return df, total, next_cursor
     except Exception as e:
-        return pd.DataFrame(), 0
+        st.error(f"Database error: {e}")
+        return pd.DataFrame(), 0, None
 
 
 def get_recent_logs(limit=50):
@@ -320,16 +391,31 @@ def infer_streaming_engine_state(processed_df, active_window_seconds=180):
     }
 
 
-def get_video_url(vid_id, label):
-    """Generate video URL from MinIO"""
+def _storage_label(label):
+    """Normalize label to the MinIO folder name (harmful / safe / unknown)"""
     clean_label = str(label).lower().strip()
     if "harm" in clean_label:
-        clean_label = "harmful"
-    elif "safe" in clean_label:
-        clean_label = "safe"
-    else:
-        clean_label = "unknown"
-    return f"{MINIO_CONF['public_endpoint']}/{MINIO_CONF['bucket']}/raw/{clean_label}/{vid_id}.mp4"
+        return "harmful"
+    if "safe" in clean_label:
+        return "safe"
+    return "unknown"
+
+
+def get_video_url(vid_id, label):
+    """Generate video URL from MinIO"""
+    return f"{MINIO_CONF['public_endpoint']}/{MINIO_CONF['bucket']}/raw/{_storage_label(label)}/{vid_id}.mp4"
+
+
+def get_thumbnail_url(vid_id, label, index=1):
+    """JPEG thumbnail written by ingestion's single-pass ffmpeg extract"""
+    return f"{MINIO_CONF['public_endpoint']}/{MINIO_CONF['bucket']}/thumbs/{_storage_label(label)}/{vid_id}_{index}.jpg"
+
+
+def get_preview_video_url(vid_id, label):
+    """Low-res proxy clip if enabled (MEDIA_PROXY_ENABLED at ingestion), else the full MP4"""
+    if not APP_CONFIG["proxy_videos"]:
+        return get_video_url(vid_id, label)
+    return f"{MINIO_CONF['public_endpoint']}/{MINIO_CONF['bucket']}/proxy/{_storage_label(label)}/{vid_id}.mp4"
 
 
 def find_blacklist_hits(text, max_hits=8):
@@ -426,13 +512,15 @@ def get_table_info(table_name):
     """Get column info for a table"""
     try:
         engine = get_db_engine()
-        query = f"""
+        query = text(
+            """
             SELECT column_name, data_type, is_nullable, column_default
             FROM information_schema.columns
-            WHERE table_name = '{table_name}'
+            WHERE table_name = :table_name
             ORDER BY ordinal_position;
         """
-        return pd.read_sql(query, engine)
+        )
+        return pd.read_sql(query, engine, params={"table_name": table_name})
     except:
         return pd.DataFrame()
 
@@ -456,30 +544,29 @@ def get_system_stats():
     """Get system statistics"""
     stats = {}
     try:
-        engine = get_db_engine()
-
-        # Total processed
-        stats["total_processed"] = pd.read_sql(
-            "SELECT COUNT(*) FROM processed_results", engine
-        ).iloc[0, 0]
+        # 1 connection từ pool cho cả 2 query
+        with get_db_engine().connect() as conn:
+            # Total processed + recent activity trong 1 lần quét
+            counts = pd.read_sql(
+                """
+                SELECT COUNT(*) AS total_processed,
+                       COUNT(*) FILTER (WHERE processed_at > NOW() - INTERVAL '1 hour') AS recent_1h,
+                       COUNT(*) FILTER (WHERE processed_at > NOW() - INTERVAL '24 hours') AS recent_24h
+                FROM processed_results
+                """,
+                conn,
+            ).iloc[0]
+            stats["total_processed"] = counts["total_processed"]
+
+            # By category
+            category_df = pd.read_sql(
+                "SELECT final_decision, COUNT(*) as count FROM processed_results GROUP BY final_decision",
+                conn,
+            )
+            stats["by_category"] = category_df
 
-        # By category
-        category_df = pd.read_sql(
-            "SELECT final_decision, COUNT(*) as count FROM processed_results GROUP BY final_decision",
-            engine,
-        )
-        stats["by_category"] = category_df
-
-        # Recent activity
-        stats["recent_1h"] = pd.read_sql(
-            "SELECT COUNT(*) FROM processed_results WHERE processed_at > NOW() - INTERVAL '1 hour'",
-            engine,
-        ).iloc[0, 0]
-
-        stats["recent_24h"] = pd.read_sql(
-            "SELECT COUNT(*) FROM processed_results WHERE processed_at > NOW() - INTERVAL '24 hours'",
-            engine,
-        ).iloc[0, 0]
+            stats["recent_1h"] = counts["recent_1h"]
+            stats["recent_24h"] = counts["recent_24h"]
 
     except:
         pass
@@ -6,12 +6,14 @@ import streamlit as st
 import pandas as pd
 from helpers import (
     get_video_url,
+    get_thumbnail_url,
+    get_preview_video_url,
     find_blacklist_hits,
     highlight_keywords,
     render_header,
     get_all_data_paginated,
 )
-from config import BLACKLIST_KEYWORDS
+from config import BLACKLIST_KEYWORDS, APP_CONFIG
 
 
 def render_content_audit(df):
@@ -113,22 +115,19 @@ def render_content_audit(df):
 
     # Render based on view mode
     if "Gallery" in view_mode:
-        _render_gallery_mode(filtered_df)
+        if score_range == (0.0, 1.0) and not search_query:
+            # Chỉ lọc category -> phân trang trên DB (keyset), xem được toàn bộ collection
+            _render_gallery_keyset(category_filter)
+        else:
+            _render_gallery_mode(filtered_df)
     elif "Detail" in view_mode:
         _render_detail_view(filtered_df)
     else:
         _render_table_view(filtered_df)
 
 
-def _render_gallery_mode(df):
-    """Render gallery mode with pagination"""
-    st.subheader("🖼️ Video Gallery")
-
-    if df.empty:
-        st.warning("Không có video nào phù hợp với bộ lọc")
-        return
-
-    # Initialize session state for pagination
+def _items_per_page():
+    """Slider số video / trang (đổi giá trị -> về trang 1)"""
     if "gallery_page" not in st.session_state:
         st.session_state.gallery_page = 1
     if "items_per_page" not in st.session_state:
@@ -148,24 +147,19 @@ def _render_gallery_mode(df):
         st.session_state.gallery_page = (
             1  # Reset to page 1 when changing items per page
         )
+    return items_per_page
 
-    total_pages = max(1, (len(df) + items_per_page - 1) // items_per_page)
 
-    # Ensure current page is valid
-    if st.session_state.gallery_page > total_pages:
-        st.session_state.gallery_page = total_pages
-
-    current_page = st.session_state.gallery_page
-
-    # Pagination controls - clear button layout
+def _render_pagination(current_page, total_pages, total_videos, has_prev, has_next):
+    """Pagination controls - clear button layout. Returns: "prev" / "next" / None"""
+    action = None
     st.markdown("---")
     col_prev, col_info, col_next = st.columns([1, 2, 1])
 
     with col_prev:
-        if current_page > 1:
+        if has_prev:
             if st.button("◀️ Previous Page", key="prev_btn", use_container_width=True):
-                st.session_state.gallery_page = current_page - 1
-                st.rerun()
+                action = "prev"
         else:
             st.button(
                 "◀️ Previous Page",
@@ -177,15 +171,14 @@ def _render_gallery_mode(df):
     with col_info:
         st.markdown(
             f"<div style='text-align: center; padding: 10px 15px; background: linear-gradient(135deg, #25F4EE20 0%, #FE2C5520 100%); border: 1px solid #ffffff20; border-radius: 8px;'>"
-            f"<b style='color: #ffffff;'>Page {current_page} / {total_pages}</b> <span style='color: #aaa;'>({len(df)} videos)</span></div>",
+            f"<b style='color: #ffffff;'>Page {current_page} / {total_pages}</b> <span style='color: #aaa;'>({total_videos} videos)</span></div>",
             unsafe_allow_html=True,
         )
 
     with col_next:
-        if current_page < total_pages:
+        if has_next:
             if st.button("Next Page ▶️", key="next_btn", use_container_width=True):
-                st.session_state.gallery_page = current_page + 1
-                st.rerun()
+                action = "next"
         else:
             st.button(
                 "Next Page ▶️",
@@ -195,13 +188,11 @@ def _render_gallery_mode(df):
             )
 
     st.markdown("---")
+    return action
 
-    # Get current page data
-    start_idx = (current_page - 1) * items_per_page
-    end_idx = min(start_idx + items_per_page, len(df))
-    page_df = df.iloc[start_idx:end_idx]
 
-    # Render grid
+def _render_video_grid(page_df):
+    """Render grid 3 cột"""
     cols_per_row = 3
     rows = (len(page_df) + cols_per_row - 1) // cols_per_row
 
@@ -215,6 +206,76 @@ def _render_gallery_mode(df):
                     _render_video_card(item)
 
 
+def _render_gallery_mode(df):
+    """Render gallery mode with pagination (in-memory, sau khi lọc score / search)"""
+    st.subheader("🖼️ Video Gallery")
+
+    if df.empty:
+        st.warning("Không có video nào phù hợp với bộ lọc")
+        return
+
+    items_per_page = _items_per_page()
+    total_pages = max(1, (len(df) + items_per_page - 1) // items_per_page)
+
+    # Ensure current page is valid
+    if st.session_state.gallery_page > total_pages:
+        st.session_state.gallery_page = total_pages
+
+    current_page = st.session_state.gallery_page
+
+    action = _render_pagination(
+        current_page, total_pages, len(df), current_page > 1, current_page < total_pages
+    )
+    if action:
+        st.session_state.gallery_page = current_page + (1 if action == "next" else -1)
+        st.rerun()
+
+    # Get current page data
+    start_idx = (current_page - 1) * items_per_page
+    end_idx = min(start_idx + items_per_page, len(df))
+    _render_video_grid(df.iloc[start_idx:end_idx])
+
+
+def _render_gallery_keyset(category_filter):
+    """
+    Render gallery phân trang trên DB theo keyset (processed_at, video_id).
+
+    gallery_cursors[i] = cursor bắt đầu trang i+1; Next thêm cursor, Previous bỏ
+    cursor cuối -> không cần OFFSET, trang sâu nhanh như trang đầu.
+    """
+    st.subheader("🖼️ Video Gallery")
+
+    items_per_page = _items_per_page()
+    state_key = (category_filter, items_per_page)
+    if st.session_state.get("gallery_keyset_key") != state_key:
+        st.session_state.gallery_keyset_key = state_key
+        st.session_state.gallery_cursors = [None]
+
+    cursors = st.session_state.gallery_cursors
+    page_df, total, next_cursor = get_all_data_paginated(
+        items_per_page, category_filter, cursors[-1]
+    )
+    if page_df.empty:
+        st.warning("Không có video nào phù hợp với bộ lọc")
+        return
+
+    current_page = len(cursors)
+    # total cache 60s: có thể lệch vài video so với trang hiện tại
+    total_pages = max(current_page, (total + items_per_page - 1) // items_per_page)
+
+    action = _render_pagination(
+        current_page, total_pages, total, current_page > 1, next_cursor is not None
+    )
+    if action == "next":
+        cursors.append(next_cursor)
+        st.rerun()
+    elif action == "prev":
+        cursors.pop()
+        st.rerun()
+
+    _render_video_grid(page_df)
+
+
 def _render_video_card(item):
     """Render a single video card in gallery"""
     is_harmful = item.get("Category", "Safe") == "Harmful"
@@ -223,7 +284,8 @@ def _render_video_card(item):
 
     # Use human_label (original CSV label) for MinIO path, not AI prediction
     storage_label = item.get("human_label", "harmful")  # Default to harmful if missing
-    video_url = get_video_url(item.get("video_id", ""), storage_label)
+    # Gallery: proxy clip (nếu bật) thay cho MP4 gốc; trang chi tiết vẫn phát MP4 gốc
+    video_url = get_preview_video_url(item.get("video_id", ""), storage_label)
     score = item.get("avg_score", 0)
 
     st.markdown(
@@ -241,6 +303,9 @@ def _render_video_card(item):
     # Video ID (clickable to expand)
     video_id = item.get("video_id", "Unknown")
 
+    if APP_CONFIG["thumbnails"] and item.get("video_id"):
+        st.image(get_thumbnail_url(video_id, storage_label), use_container_width=True)
+
     with st.expander(f"📹 {str(video_id)[:20]}...", expanded=False):
         # Video player
         if video_url:
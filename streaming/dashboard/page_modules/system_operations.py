@@ -13,6 +13,7 @@ from helpers import (
     get_recent_logs,
     render_header,
     get_data,
+    reset_data_cache,
     clear_queued_dag_runs,
     get_dag_info,
     get_dag_run_history,
@@ -101,6 +102,7 @@ def _render_pipeline_control():
             help="Làm mới dữ liệu (không reset trang)",
         ):
             st.cache_data.clear()
+            reset_data_cache()
             st.toast("✅ Đã làm mới dữ liệu!")
             # Don't call st.rerun() to avoid page reset
 
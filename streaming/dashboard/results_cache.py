@@ -0,0 +1,107 @@
+"""
+Incremental loader cho processed_results (không phụ thuộc streamlit / config để test
+được với bất kỳ SQLAlchemy engine nào). helpers.get_data() giữ 1 instance / process.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+def normalize_results(df):
+    """Chuẩn hóa final_decision / processed_at và thêm cột Category (vectorized)"""
+    if df.empty:
+        return df
+    df["final_decision"] = df["final_decision"].str.lower().str.strip()
+    df["processed_at"] = pd.to_datetime(df["processed_at"])
+    df["Category"] = np.where(
+        df["final_decision"].str.contains("harmful", na=False, regex=False),
+        "Harmful",
+        "Safe",
+    )
+    return df
+
+
+class ResultsCache:
+    """
+    Frame processed_results dùng chung trong process (mọi session của dashboard).
+
+    - Lần đầu: đọc N dòng mới nhất.
+    - Sau đó: chỉ đọc dòng có processed_at >= watermark - overlap. Spark upsert set
+      processed_at = CURRENT_TIMESTAMP nên dòng bị cập nhật cũng được đọc lại; overlap
+      bù cho transaction commit trễ hơn timestamp của nó.
+    - Merge theo video_id (dòng mới thắng), giữ N dòng mới nhất.
+    - Định kỳ đọc lại toàn bộ để bỏ các dòng đã bị xóa khỏi DB.
+    """
+
+    def __init__(
+        self,
+        limit,
+        columns="*",
+        overlap_sec=30,
+        min_interval_sec=2,
+        full_reload_interval_sec=300,
+    ):
+        self.limit = limit
+        self.columns = columns
+        self.overlap_sec = overlap_sec
+        self.min_interval_sec = min_interval_sec
+        self.full_reload_interval_sec = full_reload_interval_sec
+        self.df = pd.DataFrame()
+        self.watermark = None
+        self.fetched_at = 0.0
+        self.full_loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.watermark = None
+
+    def _load_full(self, engine):
+        query = f"""
+            SELECT {self.columns}
+            FROM processed_results
+            ORDER BY processed_at DESC LIMIT {int(self.limit)};
+        """
+        return normalize_results(pd.read_sql(query, engine))
+
+    def _load_delta(self, engine):
+        since = self.watermark - pd.Timedelta(seconds=self.overlap_sec)
+        query = text(
+            f"""
+            SELECT {self.columns}
+            FROM processed_results
+            WHERE processed_at >= :since
+            ORDER BY processed_at DESC LIMIT {int(self.limit)};
+        """
+        )
+        fresh = normalize_results(
+            pd.read_sql(query, engine, params={"since": since.to_pydatetime()})
+        )
+        if fresh.empty:
+            return self.df
+        merged = pd.concat([fresh, self.df], ignore_index=True)
+        merged = merged.drop_duplicates("video_id", keep="first")
+        return merged.sort_values("processed_at", ascending=False).head(self.limit)
+
+    def get(self, engine):
+        with self._lock:
+            now = time.time()
+            if self.watermark is not None and now - self.fetched_at < self.min_interval_sec:
+                return self.df  # nhiều session refresh cùng lúc -> dùng lại kết quả vừa đọc
+            full = (
+                self.watermark is None
+                or now - self.full_loaded_at > self.full_reload_interval_sec
+            )
+            self.df = self._load_full(engine) if full else self._load_delta(engine)
+            self.df = self.df.reset_index(drop=True)
+            self.fetched_at = now
+            if full:
+                self.full_loaded_at = now
+            if not self.df.empty:
+                self.watermark = self.df["processed_at"].max()
+            elif full:
+                self.watermark = None
+            return self.df
@@ -10,9 +10,19 @@ CREATE TABLE IF NOT EXISTS processed_results (
     threshold FLOAT,
     final_decision VARCHAR(50),
     -- Cột này phải có sẵn để Dashboard không bị lỗi
-    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP 
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Category chuẩn hóa cho Dashboard (lọc bằng index thay vì LIKE '%harmful%')
+    category VARCHAR(10) GENERATED ALWAYS AS (
+        CASE WHEN LOWER(final_decision) LIKE '%harmful%' THEN 'Harmful' ELSE 'Safe' END
+    ) STORED
 );
 
+-- Keyset pagination của gallery: ORDER BY processed_at DESC, video_id DESC
+CREATE INDEX IF NOT EXISTS idx_processed_results_recent
+    ON processed_results (processed_at DESC, video_id DESC);
+CREATE INDEX IF NOT EXISTS idx_processed_results_category_recent
+    ON processed_results (category, processed_at DESC, video_id DESC);
+
 -- 2. Bảng Logs hệ thống (MỚI - Thêm vào đây)
 CREATE TABLE IF NOT EXISTS system_logs (
     id SERIAL PRIMARY KEY,
@@ -0,0 +1,21 @@
+-- Migration cho DB tạo trước khi init.sql có cột category (user chạy tay, không chạy lúc render Dashboard):
+--   ./scripts/run_database.sh migrate
+--
+-- ADD COLUMN ... STORED ghi lại toàn bộ bảng dưới ACCESS EXCLUSIVE lock -> Spark upsert
+-- bị chặn trong lúc chạy. Nên tạm dừng DAG streaming / chạy lúc ít traffic.
+-- lock_timeout: không xếp hàng chặn writer nếu bảng đang bận, thử lại sau.
+-- Trước khi chạy, Dashboard vẫn hoạt động (lọc bằng LOWER(final_decision) LIKE).
+SET lock_timeout = '5s';
+
+ALTER TABLE processed_results ADD COLUMN IF NOT EXISTS category VARCHAR(10)
+    GENERATED ALWAYS AS (
+        CASE WHEN LOWER(final_decision) LIKE '%harmful%' THEN 'Harmful' ELSE 'Safe' END
+    ) STORED;
+
+RESET lock_timeout;
+
+-- CONCURRENTLY: không chặn ghi trong lúc build index (không chạy trong transaction)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_processed_results_recent
+    ON processed_results (processed_at DESC, video_id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_processed_results_category_recent
+    ON processed_results (category, processed_at DESC, video_id DESC);
@@ -0,0 +1,183 @@
+"""
+Crawl API item_list trực tiếp (không scroll browser cho từng trang).
+
+- 1 browser đã warm-up chỉ dùng để lấy "template": request item_list đã ký
+  (URL + query có signature, headers, cookie) của hashtag.
+- Các trang tiếp theo gọi thẳng API bằng requests.Session (connection pool dùng
+  chung), chỉ thay tham số cursor. Nhiều hashtag chạy song song trên thread pool,
+  nhịp request do AIMD controller điều chỉnh.
+- Response lỗi (HTTP != 200, body rỗng / không phải JSON, statusCode != 0) -> lấy
+  template mới từ browser rồi thử lại trang đó.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from concurrency import BLOCKED, ERROR, OK
+from item_list import BLOCKED_STATUS, parse_item_list
+
+# Header do requests / kết nối tự quản lý, không copy từ request của browser
+SKIP_HEADERS = {"host", "content-length", "connection", "accept-encoding"}
+
+
+class ItemListTemplate:
+    def __init__(self, url, headers=None):
+        parts = urlsplit(url)
+        self.base = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+        self.params = parse_qsl(parts.query, keep_blank_values=True)
+        self.headers = {
+            k: v for k, v in (headers or {}).items() if k.lower() not in SKIP_HEADERS
+        }
+
+    @classmethod
+    def from_request(cls, request):
+        """Từ request selenium-wire đã capture."""
+        return cls(request.url, dict(request.headers.items()))
+
+    def page_url(self, cursor):
+        params = [(k, v) for k, v in self.params if k != "cursor"]
+        params.append(("cursor", str(cursor)))
+        return f"{self.base}?{urlencode(params)}"
+
+
+def capture_template(driver, tag, timeout=15):
+    """Mở trang hashtag trên browser, lấy request item_list đầu tiên trả 200.
+
+    driver: selenium-wire driver (đã set scopes item_list). Returns: ItemListTemplate | None
+    """
+    del driver.requests
+    driver.get(f"https://www.tiktok.com/tag/{tag}")
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for request in driver.requests:
+            if (
+                "item_list" in request.url
+                and request.response is not None
+                and request.response.status_code == 200
+            ):
+                template = ItemListTemplate.from_request(request)
+                del driver.requests
+                return template
+        time.sleep(0.5)
+    return None
+
+
+class TemplateExpired(Exception):
+    pass
+
+
+class ApiCrawler:
+    """
+    template_provider(tag) -> ItemListTemplate | None (thường là capture_template trên
+    1 browser dùng chung, được gọi tuần tự qua lock).
+    """
+
+    def __init__(
+        self,
+        template_provider,
+        controller=None,
+        workers=4,
+        max_pages=20,
+        template_retries=2,
+        timeout=15,
+    ):
+        self.template_provider = template_provider
+        self.controller = controller
+        self.workers = max(1, workers)
+        self.max_pages = max_pages
+        self.template_retries = template_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._provider_lock = threading.Lock()
+        self.templates_fetched = 0
+
+    def _template(self, tag):
+        with self._provider_lock:  # 1 browser cho mọi fetcher
+            self.templates_fetched += 1
+            return self.template_provider(tag)
+
+    def _get(self, url, headers):
+        if self.controller is None:
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+        self.controller.acquire()
+        outcome = ERROR
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            outcome = BLOCKED if response.status_code in BLOCKED_STATUS else OK
+            return response
+        finally:
+            self.controller.release(outcome)
+
+    def fetch_page(self, template, cursor):
+        """1 trang item_list. Raises TemplateExpired nếu response không dùng được."""
+        try:
+            response = self._get(template.page_url(cursor), template.headers)
+        except requests.RequestException as e:
+            raise TemplateExpired(str(e))
+        if response.status_code != 200 or not response.content:
+            raise TemplateExpired(f"HTTP {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError:
+            raise TemplateExpired("body không phải JSON")
+        if data.get("statusCode", 0) != 0:
+            raise TemplateExpired(f"statusCode={data.get('statusCode')}")
+        return data
+
+    def crawl_tag(self, tag, label, on_videos=None):
+        """Phân trang 1 hashtag theo cursor. Returns: list video (đã dedup theo link)."""
+        template = self._template(tag)
+        videos = {}
+        cursor = 0
+        refreshes = pages = 0
+        while pages < self.max_pages:
+            if template is None:
+                print(f"⚠️ #{tag}: không lấy được template item_list")
+                break
+            try:
+                data = self.fetch_page(template, cursor)
+            except TemplateExpired as e:
+                if refreshes >= self.template_retries:
+                    print(f"⚠️ #{tag}: dừng ở cursor={cursor} ({e})")
+                    break
+                refreshes += 1
+                print(f"🔄 #{tag}: template hết hạn ({e}), lấy lại từ browser")
+                template = self._template(tag)
+                continue
+
+            pages += 1
+            page = [v for v in parse_item_list(data) if v["link"] not in videos]
+            videos.update((v["link"], v) for v in page)
+            if page and on_videos:
+                on_videos(tag, page, label)
+            if not data.get("hasMore") or "cursor" not in data:
+                break
+            cursor = data["cursor"]
+        return list(videos.values())
+
+    def crawl(self, tags, on_videos=None):
+        """tags: list (tag, label). Returns: {tag: số video}"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="api-crawl") as pool:
+            futures = {
+                pool.submit(self.crawl_tag, tag, label, on_videos): tag for tag, label in tags
+            }
+            for future in as_completed(futures):
+                tag = futures[future]
+                try:
+                    results[tag] = len(future.result())
+                except Exception as e:
+                    print(f"❌ #{tag}: {e}")
+                    results[tag] = 0
+        return results
+
+    def close(self):
+        self.session.close()
@@ -1,64 +1,194 @@
+import functools
 import os
+import re
 import subprocess
 import shutil
 
+import config
+
+# -af loudnorm: Chuẩn hóa âm lượng (EBU R128)
+# -af silenceremove: Cắt bỏ đoạn im lặng đầu file (-50dB)
+AUDIO_FILTER = (
+    "loudnorm=I=-16:TP=-1.5:LRA=11,"
+    "silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.1"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_path():
+    """Path ffmpeg (tra 1 lần / process), None nếu chưa cài."""
+    return shutil.which("ffmpeg")
+
 
 def check_ffmpeg():
     """Kiểm tra xem FFmpeg đã được cài đặt chưa"""
-    if shutil.which("ffmpeg") is None:
+    if ffmpeg_path() is None:
         print("❌ LỖI: Không tìm thấy FFmpeg. Hãy cài đặt: sudo apt install ffmpeg")
         return False
     return True
 
 
-def extract_audio_single(video_path, output_path):
+def probe(video_path):
+    """Đọc header (không decode): {"audio": bool, "video": bool, "duration": giây | None}.
+
+    Dùng `ffmpeg -i` thay vì ffprobe để chỉ phụ thuộc 1 binary.
     """
-    Tách audio từ video, chuẩn hóa âm lượng và cắt khoảng lặng.
+    result = subprocess.run(
+        [ffmpeg_path(), "-hide_banner", "-i", video_path],
+        capture_output=True,
+        text=True,
+    )
+    header = result.stderr
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", header)
+    return {
+        "audio": re.search(r"Stream #\S+: Audio:", header) is not None,
+        "video": re.search(r"Stream #\S+: Video:", header) is not None,
+        "duration": (
+            int(duration[1]) * 3600 + int(duration[2]) * 60 + float(duration[3])
+            if duration
+            else None
+        ),
+    }
+
+
+# AUDIO_FORMAT -> (đuôi file, content type, tham số codec ffmpeg)
+AUDIO_FORMATS = {
+    "wav": (".wav", "audio/wav", ["-acodec", "pcm_s16le"]),  # Codec Wav chuẩn
+    "flac": (".flac", "audio/flac", ["-acodec", "flac", "-sample_fmt", "s16"]),
+    "opus": (".opus", "audio/ogg", ["-acodec", "libopus", "-b:a", config.AUDIO_OPUS_BITRATE]),
+}
+
+
+def audio_format(name=None):
+    """(đuôi file, content type, codec args) của AUDIO_FORMAT, không hợp lệ -> wav."""
+    return AUDIO_FORMATS.get(name or config.AUDIO_FORMAT, AUDIO_FORMATS["wav"])
+
+
+def _format_of(path):
+    """Format theo đuôi file (.wav / .flac / .opus)."""
+    ext = os.path.splitext(path)[1].lower()
+    return next((f for f in AUDIO_FORMATS.values() if f[0] == ext), AUDIO_FORMATS["wav"])
+
+
+def audio_content_type(path):
+    return _format_of(path)[1]
+
+
+def _audio_output(output_path):
+    return [
+        "-map", "0:a:0",
+        "-af", AUDIO_FILTER,
+        "-vn",  # Không lấy hình ảnh
+        *_format_of(output_path)[2],
+        "-ar", "16000",  # 16kHz (Chuẩn cho Wav2Vec2)
+        "-ac", "1",  # Mono
+        output_path,
+    ]
+
+
+def _thumbnail_output(thumb_pattern, count, duration):
+    # Chia đều theo duration, ảnh thứ k ở k * interval (bỏ 2 đầu: frame t=0 hay bị đen),
+    # không biết duration -> mỗi 2s 1 ảnh, bắt đầu từ giây thứ 2
+    interval = duration / (count + 1) if duration else 2.0
+    return [
+        "-map", "0:v:0",
+        "-vf",
+        f"trim=start={interval:.3f},setpts=PTS-STARTPTS,"
+        # round=up: ảnh k là frame tại đúng k * interval (mặc định lấy frame trước mốc)
+        f"fps=1/{interval:.3f}:round=up,scale=-2:{config.MEDIA_THUMBNAIL_HEIGHT}",
+        "-frames:v", str(count),
+        "-q:v", "4",
+        thumb_pattern,
+    ]
+
+
+def _proxy_output(proxy_path, has_audio):
+    cmd = ["-map", "0:v:0"]
+    if has_audio:
+        cmd += ["-map", "0:a:0", "-c:a", "aac", "-b:a", "48k", "-ac", "1"]
+    return cmd + [
+        "-vf", f"scale=-2:{config.MEDIA_PROXY_HEIGHT}",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-crf", "32",
+        "-movflags", "+faststart",  # phát được ngay khi dashboard stream
+        proxy_path,
+    ]
+
+
+def extract_media(video_path, audio_path, thumb_dir=None, proxy_path=None, thumb_count=None):
+    """
+    1 lần ffmpeg (decode MP4 1 lần) sinh nhiều output:
+    audio 16kHz mono đã chuẩn hóa (WAV/FLAC/Opus), JPEG thumbnails, proxy clip 224p (tuỳ chọn).
+
     Args:
-        video_path: Đường dẫn file video đầu vào (.mp4)
-        output_path: Đường dẫn file audio đầu ra (.wav)
+        video_path: video đầu vào (.mp4)
+        audio_path: audio đầu ra (.wav / .flac / .opus, codec theo đuôi file)
+        thumb_dir: thư mục ghi thumbnails (None = không tạo)
+        proxy_path: proxy clip đầu ra (None = không tạo)
+        thumb_count: số thumbnail (mặc định MEDIA_THUMBNAIL_COUNT)
     Returns:
-        bool: True nếu thành công, False nếu lỗi
+        dict: {"audio": bool, "thumbnails": [path], "proxy": path | None}
     """
+    result = {"audio": False, "thumbnails": [], "proxy": None}
     if not check_ffmpeg():
-        return False
-
-    if os.path.exists(output_path):
-        os.remove(output_path)  # Xóa file cũ nếu tồn tại để ghi đè
+        return result
+    thumb_count = config.MEDIA_THUMBNAIL_COUNT if thumb_count is None else thumb_count
 
     try:
-        # -af loudnorm: Chuẩn hóa âm lượng (EBU R128)
-        # -af silenceremove: Cắt bỏ đoạn im lặng đầu file (-50dB)
-        # -ar 16000: Sampling rate 16kHz (Chuẩn cho Wav2Vec2)
-        # -ac 1: Mono channel
-        cmd = [
-            "ffmpeg",
-            "-i",
-            video_path,
-            "-af",
-            "loudnorm=I=-16:TP=-1.5:LRA=11,silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.1",
-            "-vn",  # Không lấy hình ảnh
-            "-acodec",
-            "pcm_s16le",  # Codec Wav chuẩn
-            "-ar",
-            "16000",  # 16kHz
-            "-ac",
-            "1",  # Mono
-            output_path,
-            "-y",  # Overwrite
-            "-loglevel",
-            "error",  # Chỉ hiện lỗi
-        ]
-
-        subprocess.run(cmd, check=True)
+        streams = probe(video_path)
+        outputs = []
+        if streams["audio"]:
+            outputs += _audio_output(audio_path)
+        thumb_pattern = None
+        if streams["video"] and thumb_dir and thumb_count > 0:
+            thumb_pattern = os.path.join(thumb_dir, "thumb_%02d.jpg")
+            outputs += _thumbnail_output(thumb_pattern, thumb_count, streams["duration"])
+        if streams["video"] and proxy_path:
+            outputs += _proxy_output(proxy_path, streams["audio"])
+        if not outputs:
+            print(f"⚠️ Không có stream audio/video: {os.path.basename(video_path)}")
+            return result
+
+        cmd = [ffmpeg_path(), "-hide_banner", "-loglevel", "error", "-y", "-i", video_path]
+        try:
+            subprocess.run(cmd + outputs, check=True)
+        except subprocess.CalledProcessError as e:
+            if not streams["audio"] or outputs == _audio_output(audio_path):
+                raise
+            # Output phụ (thumbnail / proxy: video stream lỗi, thiếu libx264...) không được
+            # làm mất audio: chạy lại chỉ audio
+            print(f"⚠️ FFmpeg lỗi ({e}), tách lại chỉ audio: {os.path.basename(video_path)}")
+            subprocess.run(cmd + _audio_output(audio_path), check=True)
+            thumb_pattern = proxy_path = None
+
         # Kiểm tra file sinh ra có dung lượng > 0 không
-        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-            return True
-        return False
+        result["audio"] = os.path.exists(audio_path) and os.path.getsize(audio_path) > 0
+        if thumb_pattern:
+            result["thumbnails"] = [
+                path
+                for path in (thumb_pattern % i for i in range(1, thumb_count + 1))
+                if os.path.exists(path)
+            ]
+        if proxy_path and os.path.exists(proxy_path) and os.path.getsize(proxy_path) > 0:
+            result["proxy"] = proxy_path
+        return result
 
     except subprocess.CalledProcessError as e:
         print(f"❌ FFmpeg Error: {e}")
-        return False
+        return result
     except Exception as e:
-        print(f"❌ Audio Extract Error: {e}")
-        return False
+        print(f"❌ Media Extract Error: {e}")
+        return result
+
+
+def extract_audio_single(video_path, output_path):
+    """
+    Tách audio từ video, chuẩn hóa âm lượng và cắt khoảng lặng.
+    Args:
+        video_path: Đường dẫn file video đầu vào (.mp4)
+        output_path: Đường dẫn file audio đầu ra (.wav)
+    Returns:
+        bool: True nếu thành công, False nếu lỗi
+    """
+    return extract_media(video_path, output_path)["audio"]
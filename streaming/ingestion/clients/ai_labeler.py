@@ -1,17 +1,75 @@
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
+import argparse
+import hashlib
 import json
-import re
+import sqlite3
 import sys
 import os
+import threading
+import time
 
 # Thêm đường dẫn để import config từ thư mục cha
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 
+LABELS = ("safe", "harmful")
+# Đổi prompt / cách chấm điểm -> tăng version để cache cũ không còn khớp
+PROMPT_VERSION = 2
+PROMPT = """Phân loại nội dung sau là 'safe' (an toàn) hoặc 'harmful' (độc hại).
+Nội dung: "{text}"
+Chỉ trả lời đúng 1 từ: safe hoặc harmful."""
+
+
+class LabelCache:
+    """Cache kết quả gán nhãn (SQLite) theo hash text -> chạy lại chỉ tốn cho text mới."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_label_cache ("
+            "key TEXT PRIMARY KEY, label TEXT NOT NULL, confidence REAL NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):  # giới hạn số biến SQLite
+                chunk = keys[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT key, label, confidence FROM ai_label_cache WHERE key IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update(
+                    {key: {"label": label, "confidence": conf} for key, label, conf in rows}
+                )
+        return found
+
+    def put_many(self, results):
+        """results: {key: {"label", "confidence"}}"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ai_label_cache VALUES (?, ?, ?, ?)",
+                ((k, r["label"], r["confidence"], now) for k, r in results.items()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
 
 class AILabeler:
-    def __init__(self):
+    def __init__(self, cache_path=None):
+        self.cache = None
         if not config.ENABLE_AI_LABELING:
             self.model = None
             return
@@ -21,71 +79,187 @@ class AILabeler:
             self.tokenizer = AutoTokenizer.from_pretrained(
                 config.MODEL_NAME, trust_remote_code=True
             )
+            # Batch: pad bên trái để token cuối của mọi prompt thẳng hàng
+            self.tokenizer.padding_side = "left"
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
             self.model = AutoModelForCausalLM.from_pretrained(
                 config.MODEL_NAME,
                 torch_dtype="auto",
                 device_map="auto",
                 trust_remote_code=True,
             )
+            self.model.eval()
+            # Output bị ràng buộc: chỉ so xác suất token đầu của "safe" và "harmful"
+            self.label_token_ids = [
+                self.tokenizer.encode(label, add_special_tokens=False)[0] for label in LABELS
+            ]
             print("✅ Model Loaded!")
         except Exception as e:
             print(f"⚠️ Model Load Failed: {e}")
             self.model = None
+            return
+        self.cache = LabelCache(cache_path or config.AI_LABEL_CACHE_PATH)
 
-    def predict(self, text):
-        """
-        Dự đoán nhãn và độ tin cậy động bằng cách bóc tách JSON từ Output của LLM.
-        """
-        if not self.model or not text:
-            # Mặc định confidence 0.0 nếu không có model
-            return {"label": "safe", "confidence": 0.0}
-
-        # Prompt yêu cầu JSON nghiêm ngặt
-        prompt = f"""Phân loại nội dung sau là 'safe' (an toàn) hoặc 'harmful' (độc hại).
-        Nội dung: "{text}"
-        Yêu cầu trả về đúng định dạng JSON: {{"label": "safe/harmful", "confidence": <giá trị số thực từ 0 đến 1>}}"""
+    def _key(self, text):
+        raw = f"{config.MODEL_NAME}|{PROMPT_VERSION}|{text}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
-        messages = [{"role": "user", "content": prompt}]
-        input_text = self.tokenizer.apply_chat_template(
+    def _prompt(self, text):
+        text = text[: config.AI_LABEL_MAX_CHARS]
+        messages = [{"role": "user", "content": PROMPT.format(text=text)}]
+        return self.tokenizer.apply_chat_template(
             messages, tokenize=False, add_generation_prompt=True
         )
-        inputs = self.tokenizer([input_text], return_tensors="pt").to(self.model.device)
 
+    def _encode(self, texts):
+        """Token ids của prompt (chưa pad) để chia bucket theo độ dài."""
+        prompts = [self._prompt(t) for t in texts]
+        return self.tokenizer(prompts, add_special_tokens=False)["input_ids"]
+
+    def _score_batch(self, input_ids):
+        """1 forward pass cho cả batch -> P(harmful) của từng prompt.
+
+        Thay cho generate(max_new_tokens=100) + regex JSON: chỉ cần logits của token
+        trả lời đầu tiên, so 2 token nhãn.
+        """
+        batch = self.tokenizer.pad(
+            {"input_ids": input_ids}, padding=True, return_tensors="pt"
+        ).to(self.model.device)
         with torch.no_grad():
-            generated_ids = self.model.generate(
-                **inputs,
-                max_new_tokens=100,
-                temperature=0.1,  # Nhiệt độ thấp để output ổn định
-                top_p=0.9,
-            )
+            logits = self.model(**batch).logits[:, -1, :]
+        probs = torch.softmax(logits[:, self.label_token_ids].float(), dim=-1)
+        return probs[:, 1].tolist()
 
-        response = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[
-            0
+    def predict_batch(self, texts, batch_size=None):
+        """
+        Gán nhãn cả list text: cache theo hash, text trùng chỉ chạy 1 lần, batch theo
+        bucket độ dài prompt (ít padding).
+
+        Returns:
+            list[dict]: {"label": "safe/harmful", "confidence": 0..1}, cùng thứ tự texts
+        """
+        default = {"label": "safe", "confidence": 0.0}
+        if not self.model:
+            # Mặc định confidence 0.0 nếu không có model
+            return [dict(default) for _ in texts]
+        batch_size = batch_size or config.AI_LABEL_BATCH_SIZE
+
+        keys = {text: self._key(text) for text in texts if text}
+        results = self.cache.get_many(set(keys.values()))
+        todo = [text for text, key in keys.items() if key not in results]
+
+        if todo:
+            input_ids = self._encode(todo)
+            order = sorted(range(len(todo)), key=lambda i: len(input_ids[i]))
+            for start in range(0, len(order), batch_size):
+                bucket = order[start : start + batch_size]
+                try:
+                    scores = self._score_batch([input_ids[i] for i in bucket])
+                except Exception as e:
+                    print(f"⚠️ Labeling batch lỗi ({len(bucket)} text): {e}")
+                    continue
+                fresh = {}
+                for i, p_harmful in zip(bucket, scores):
+                    label = "harmful" if p_harmful >= 0.5 else "safe"
+                    fresh[keys[todo[i]]] = {
+                        "label": label,
+                        "confidence": round(max(p_harmful, 1 - p_harmful), 4),
+                    }
+                self.cache.put_many(fresh)  # lưu ngay: dừng giữa chừng không mất batch đã chạy
+                results.update(fresh)
+
+        return [
+            dict(results.get(keys[text], default)) if text else dict(default)
+            for text in texts
         ]
 
-        # --- BÓC TÁCH JSON ĐỘNG (LOGIC MỚI) ---
-        try:
-            # Tìm khối JSON trong chuỗi phản hồi bằng Regex
-            json_match = re.search(r"\{.*\}", response, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group())
+    def predict(self, text):
+        """
+        Dự đoán nhãn và độ tin cậy (xác suất của nhãn được chọn).
+        """
+        return self.predict_batch([text])[0]
 
-                # 1. Đồng bộ nhãn về lowercase chuẩn: safe/harmful
-                raw_label = str(result.get("label", "safe")).lower()
-                clean_label = "harmful" if "harm" in raw_label else "safe"
 
-                # 2. Lấy confidence thực tế từ mô hình (Quan trọng)
-                confidence = float(result.get("confidence", 0.5))
+def label_csv(input_csv, output_csv, labeler, text_column="description", chunk_rows=256):
+    """
+    Gán nhãn cả file CSV crawl, ghi thêm cột ai_label / ai_confidence.
 
-                return {"label": clean_label, "confidence": confidence}
+    Checkpoint sau mỗi chunk (<output>.progress: số dòng đã xong + kích thước file
+    output) -> chạy lại tiếp từ chunk dở, không ghi trùng dòng.
+    """
+    import pandas as pd
 
-            # Fallback thông minh: Nếu không tìm thấy JSON, kiểm tra từ khóa
-            lower_res = response.lower()
-            if "harmful" in lower_res or "độc hại" in lower_res:
-                return {"label": "harmful", "confidence": 0.75}  # Confidence ước lượng
+    progress_path = output_csv + ".progress"
+    done_rows, output_bytes = 0, 0
+    if os.path.exists(progress_path) and os.path.exists(output_csv):
+        with open(progress_path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+        done_rows, output_bytes = progress["rows"], progress["bytes"]
+        # Bỏ phần ghi dở sau checkpoint cuối
+        with open(output_csv, "r+b") as f:
+            f.truncate(output_bytes)
+        print(f"♻️ Resume từ dòng {done_rows}")
+    elif os.path.exists(output_csv):
+        os.remove(output_csv)
+
+    rows = 0
+    start = time.time()
+    labeled = 0
+    for chunk in pd.read_csv(input_csv, chunksize=chunk_rows, encoding="utf-8-sig"):
+        chunk_start, rows = rows, rows + len(chunk)
+        if rows <= done_rows:
+            continue
+        chunk = chunk.iloc[max(0, done_rows - chunk_start) :].copy()
+        results = labeler.predict_batch(chunk[text_column].fillna("").astype(str).tolist())
+        chunk["ai_label"] = [r["label"] for r in results]
+        chunk["ai_confidence"] = [r["confidence"] for r in results]
+
+        new_file = output_bytes == 0
+        chunk.to_csv(
+            output_csv,
+            mode="w" if new_file else "a",
+            header=new_file,
+            index=False,
+            # BOM chỉ ở đầu file (Excel đọc được tiếng Việt)
+            encoding="utf-8-sig" if new_file else "utf-8",
+        )
+        output_bytes = os.path.getsize(output_csv)
+        tmp = progress_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "bytes": output_bytes}, f)
+        os.replace(tmp, progress_path)
+
+        labeled += len(chunk)
+        rate = labeled / max(time.time() - start, 1e-6)
+        print(f"🏷️ {rows} dòng ({rate:.1f} dòng/s)")
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    print(f"✅ Đã gán nhãn: {output_csv}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gán nhãn AI cho file CSV crawl")
+    parser.add_argument("--input", default=config.INPUT_CSV_PATH, help="CSV crawl")
+    parser.add_argument("--output", help="CSV kết quả (mặc định <input>_labeled.csv)")
+    parser.add_argument("--text-column", default="description")
+    parser.add_argument("--batch-size", type=int, default=config.AI_LABEL_BATCH_SIZE)
+    parser.add_argument("--chunk-rows", type=int, default=256, help="Số dòng mỗi checkpoint")
+    args = parser.parse_args()
+
+    config.AI_LABEL_BATCH_SIZE = args.batch_size
+    output = args.output or os.path.splitext(args.input)[0] + "_labeled.csv"
+    labeler = AILabeler()
+    if not labeler.model:
+        print("❌ Không có model, dừng.")
+        return
+    try:
+        label_csv(args.input, output, labeler, args.text_column, args.chunk_rows)
+    finally:
+        labeler.cache.close()
 
-        except Exception as e:
-            print(f"⚠️ Parsing Error: {e} | Response: {response}")
 
-        # Fallback an toàn cuối cùng
-        return {"label": "safe", "confidence": 0.5}
+if __name__ == "__main__":
+    main()
@@ -3,34 +3,21 @@ Data Cleaner Module
 Inspired by preprocess/preprocess_new.py logic
 """
 
-import re
-
-# Từ điển Teencode đầy đủ (từ preprocess_new.py)
-TEENCODE_DICT = {
-    "ko": "không",
-    "k": "không",
-    "kh": "không",
-    "dc": "được",
-    "đc": "được",
-    "t": "tôi",
-    "tao": "tôi",
-    "nt": "nhắn tin",
-    "fb": "facebook",
-    "hnay": "hôm nay",
-    "ng": "người",
-    "mn": "mọi người",
-    "ae": "anh em",
-    "v": "vậy",
-    "add": "thêm",
-    "ib": "inbox",
-    "fuck": "địt",
-    "đm": "địt mẹ",
-    "vcl": "vãi cả lồn",
-    "dell": "đéo",
-    "éo": "đéo",
-    "clgt": "cái lồn gì thế",
-    "vkl": "vãi cả lồn",
-}
+import os
+import sys
+
+# Engine chuẩn hoá dùng chung với training: train_eval_module/shared_utils/text_normalize.py
+# (container: mount tại /models)
+for _root in (
+    os.getenv("TRAIN_EVAL_MODULE_DIR", "/models"),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "train_eval_module"),
+):
+    if os.path.isdir(os.path.join(_root, "shared_utils")):
+        sys.path.append(os.path.abspath(_root))
+        break
+
+from shared_utils.text_normalize import TEENCODE_DICT, clean_batch as _clean_batch
+from shared_utils.text_normalize import clean_ingestion
 
 
 def clean_text_advanced(text):
@@ -41,29 +28,12 @@ def clean_text_advanced(text):
     - Chuyển teencode
     - Xóa ký tự lặp quá 2 lần
     """
-    if not text or str(text) == "nan":
-        return ""
-
-    text = str(text).lower()
-
-    # Xóa URL, email, mentions
-    text = re.sub(r"http\S+|www\.\S+|\S+@\S+|@\w+", "", text)
-
-    # Xóa ký tự đặc biệt nhưng giữ lại dấu câu cơ bản
-    text = re.sub(r"[^\w\s.,?!:;'\"]", " ", text)
-
-    # Chuyển teencode
-    words = text.split()
-    words = [TEENCODE_DICT.get(word, word) for word in words]
-    text = " ".join(words)
-
-    # Xóa khoảng trắng thừa
-    text = re.sub(r"\s+", " ", text).strip()
+    return clean_ingestion(text)
 
-    # Xóa ký tự lặp quá 2 lần (vd: "aaaaaa" -> "aa")
-    text = re.sub(r"(.)\1{2,}", r"\1\1", text)
 
-    return text
+def clean_batch(texts):
+    """clean_text_advanced cho cả list (text trùng chỉ xử lý 1 lần)."""
+    return _clean_batch(texts, "ingestion")
 
 
 def aggregate_comments(comments, max_comments=50):
@@ -110,8 +80,8 @@ def clean_and_aggregate_comments(raw_comments, max_comments=50):
     if not raw_comments:
         return ""
 
-    # Làm sạch từng comment
-    cleaned = [clean_text_advanced(c) for c in raw_comments]
+    # Làm sạch cả list 1 lượt
+    cleaned = clean_batch(raw_comments)
 
     # Lọc bỏ comment rỗng sau khi clean
     cleaned = [c for c in cleaned if c]
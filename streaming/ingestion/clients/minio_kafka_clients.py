@@ -1,9 +1,12 @@
 from minio import Minio
 from kafka import KafkaProducer, KafkaAdminClient
 from kafka.admin import NewTopic
+import hashlib
+import io
 import json
 import sys
 import os
+import threading
 import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -41,61 +44,296 @@ class MinioClient:
         object_name,
         bucket_name=config.MINIO_BUCKET,
         content_type="video/mp4",
+        part_size=config.MINIO_PART_SIZE,
+        num_parallel_uploads=config.MINIO_PARALLEL_UPLOADS,
+        dedup=True,
     ):
+        """Upload file (multipart, các part upload song song).
+
+        dedup=True: nếu đã có object cùng SHA256 trong bucket thì bỏ qua upload và
+        trả về path của object đó.
+        """
         try:
+            digest = sha256_file(file_path) if dedup else None
+            if digest:
+                existing = self._find_by_hash(bucket_name, digest)
+                if existing:
+                    print(f"♻️ MinIO dedup: {object_name} trùng nội dung {existing}")
+                    return f"{bucket_name}/{existing}"
+
             self.client.fput_object(
-                bucket_name, object_name, file_path, content_type=content_type
+                bucket_name,
+                object_name,
+                file_path,
+                content_type=content_type,
+                part_size=part_size,
+                num_parallel_uploads=num_parallel_uploads,
             )
+            if digest:
+                self._record_hash(bucket_name, digest, object_name)
             # print(f"📤 Uploaded: {object_name}")
             return f"{bucket_name}/{object_name}"
         except Exception as e:
             print(f"❌ MinIO Upload Error: {e}")
             return None
 
+    def upload_stream(
+        self,
+        stream,
+        object_name,
+        bucket_name=config.MINIO_BUCKET,
+        content_type="video/mp4",
+        part_size=config.MINIO_PART_SIZE,
+        num_parallel_uploads=config.MINIO_PARALLEL_UPLOADS,
+        dedup=True,
+    ):
+        """Upload từ stream chưa biết độ dài (pipe, file đang được ghi - GrowingFileReader).
+
+        Multipart: mỗi part_size bytes đọc được là 1 part. SHA256 chỉ biết sau khi
+        stream hết, nên dedup=True kiểm tra hash index SAU khi upload: đã có object
+        cùng nội dung -> xoá object vừa upload, trả về path của object cũ.
+        """
+        try:
+            reader = HashingReader(stream)
+            self.client.put_object(
+                bucket_name,
+                object_name,
+                reader,
+                length=-1,
+                content_type=content_type,
+                part_size=part_size,
+                num_parallel_uploads=num_parallel_uploads,
+            )
+            digest = reader.hexdigest()
+            existing = self._find_by_hash(bucket_name, digest) if dedup else None
+            if existing and existing != object_name:
+                self.client.remove_object(bucket_name, object_name)
+                print(f"♻️ MinIO dedup: {object_name} trùng nội dung {existing}")
+                return f"{bucket_name}/{existing}"
+            self._record_hash(bucket_name, digest, object_name)
+            return f"{bucket_name}/{object_name}"
+        except Exception as e:
+            print(f"❌ MinIO Stream Upload Error: {e}")
+            return None
+
+    def _find_by_hash(self, bucket_name, digest):
+        """Object có SHA256 = digest (tra hash index, kiểm tra object còn tồn tại)."""
+        try:
+            marker = self.client.stat_object(bucket_name, f"{HASH_INDEX_PREFIX}{digest}")
+            existing = marker.metadata.get("x-amz-meta-path")
+            if existing:
+                self.client.stat_object(bucket_name, existing)
+            return existing
+        except Exception:
+            return None
+
+    def _record_hash(self, bucket_name, digest, object_name):
+        try:
+            self.client.put_object(
+                bucket_name,
+                f"{HASH_INDEX_PREFIX}{digest}",
+                io.BytesIO(b""),
+                0,
+                metadata={"path": object_name},
+            )
+        except Exception as e:
+            print(f"⚠️ MinIO hash index write failed: {e}")
+
+
+HASH_INDEX_PREFIX = "_sha256/"
+
+
+def sha256_file(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashingReader:
+    """Bọc stream: tính SHA256 của mọi byte đã đọc."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self._digest.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class GrowingFileReader:
+    """Đọc file trong lúc file vẫn đang được ghi (vd: yt-dlp đang tải).
+
+    read() chờ thêm dữ liệu thay vì trả EOF, cho tới khi `is_complete()` = True.
+    `is_failed()` = True (download lỗi) -> raise để huỷ multipart upload.
+    Giữ file descriptor mở nên yt-dlp rename .part -> .mp4 không ảnh hưởng.
+    Upload bắt đầu muộn (sau khi đã rename) -> đọc `final_path`.
+    """
+
+    def __init__(
+        self,
+        path,
+        is_complete,
+        is_failed=lambda: False,
+        poll_interval=0.2,
+        timeout=300,
+        final_path=None,
+    ):
+        self.path = path
+        self.final_path = final_path
+        self.is_complete = is_complete
+        self.is_failed = is_failed
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._file = None
+
+    def read(self, size=-1):
+        waited = 0.0
+        while True:
+            if self._file is None:
+                self._open()
+            if self._file is not None:
+                data = self._file.read(size)
+                if data:
+                    return data
+            if self.is_failed():
+                raise IOError(f"Download failed while streaming {self.path}")
+            if self.is_complete():
+                if self._file is None and not self._open():
+                    raise IOError(f"{self.path} không còn tồn tại sau khi download xong")
+                # Đọc lần cuối sau khi writer đã xong
+                return self._file.read(size)
+            if waited >= self.timeout:
+                raise TimeoutError(f"No data from {self.path} for {self.timeout}s")
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+
+    def _open(self):
+        for path in (self.path, self.final_path):
+            if path:
+                try:
+                    self._file = open(path, "rb")
+                    return True
+                except FileNotFoundError:
+                    continue
+        return False
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
 
 class KafkaClient:
-    def __init__(self, retries=20, delay=5):
-        self._ensure_topic_with_retry(retries, delay)
+    """Producer async: send() chỉ đưa message vào buffer, kafka-python tự gom batch
+    (linger_ms/batch_size) + nén rồi gửi ở background thread.
+
+    Kết quả từng message được ghi nhận qua delivery callback (`sent`, `failed`).
+    Chỉ flush khi checkpoint (`flush()`) hoặc shutdown (`close()`).
+    """
+
+    def __init__(self, retries=20, delay=5, topic=None, partitions=4):
+        # topic mặc định: tiktok_raw_data; crawler dùng KAFKA_URL_TOPIC (URL work queue)
+        self.topic = topic or config.KAFKA_TOPIC
+        self._ensure_topic_with_retry(retries, delay, partitions)
         self.producer = None
+        self.sent = 0
+        self.failed = []  # [(video_id, error)] - message không gửi được
+        # Hook tuỳ chọn khi broker ack / gửi lỗi (vd: ghi ledger), chạy ở IO thread
+        self.on_delivered = None
+        self.on_failed = None
+        self._lock = threading.Lock()
         for i in range(retries):
             try:
                 self.producer = KafkaProducer(
                     bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS,
+                    key_serializer=lambda k: k.encode("utf-8") if k else None,
                     value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    compression_type=config.KAFKA_COMPRESSION,
+                    linger_ms=config.KAFKA_LINGER_MS,
+                    batch_size=config.KAFKA_BATCH_SIZE,
+                    acks=config.KAFKA_ACKS,
+                    retries=config.KAFKA_SEND_RETRIES,
+                )
+                print(
+                    f"✅ Kafka Producer Connected! (compression={config.KAFKA_COMPRESSION}, "
+                    f"linger={config.KAFKA_LINGER_MS}ms, batch={config.KAFKA_BATCH_SIZE}B)"
                 )
-                print("✅ Kafka Producer Connected!")
                 return
             except Exception as e:
                 print(f"⚠️ Kafka Retry {i+1}: {e}")
                 time.sleep(delay)
         raise Exception("❌ Kafka Connection Failed!")
 
-    def _ensure_topic_with_retry(self, retries, delay):
+    def _ensure_topic_with_retry(self, retries, delay, partitions):
         for i in range(retries):
             try:
                 admin = KafkaAdminClient(
                     bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS
                 )
-                if config.KAFKA_TOPIC not in admin.list_topics():
+                if self.topic not in admin.list_topics():
                     admin.create_topics(
                         [
                             NewTopic(
-                                name=config.KAFKA_TOPIC,
-                                num_partitions=4,
+                                name=self.topic,
+                                num_partitions=partitions,
                                 replication_factor=1,
                             )
                         ]
                     )
-                    print(f"✅ Topic '{config.KAFKA_TOPIC}' Created!")
+                    print(f"✅ Topic '{self.topic}' Created!")
                 admin.close()
                 return
             except Exception:
                 time.sleep(delay)
 
     def send(self, data):
+        """Đưa message vào buffer của producer (không chờ broker).
+
+        Key = video_id: message cùng video vào cùng partition, các video khác nhau
+        được rải đều giữa các partition.
+        """
+        video_id = data.get("video_id")
         try:
-            self.producer.send(config.KAFKA_TOPIC, value=data)
-            self.producer.flush()
-            print(f"📡 Sent Kafka: {data.get('video_id')}")
+            future = self.producer.send(self.topic, key=video_id, value=data)
+            future.add_callback(self._on_delivered, video_id)
+            future.add_errback(self._on_failed, video_id)
         except Exception as e:
-            print(f"❌ Kafka Send Error: {e}")
+            # Buffer đầy quá max_block_ms hoặc lỗi serialize
+            self._on_failed(video_id, e)
+
+    def _on_delivered(self, video_id, metadata):
+        with self._lock:
+            self.sent += 1
+        print(f"📡 Sent Kafka: {video_id} (partition {metadata.partition})")
+        if self.on_delivered:
+            self.on_delivered(video_id)
+
+    def _on_failed(self, video_id, error):
+        with self._lock:
+            self.failed.append((video_id, str(error)))
+        print(f"❌ Kafka Send Error: {video_id}: {error}")
+        if self.on_failed:
+            self.on_failed(video_id, error)
+
+    def flush(self, timeout=None):
+        """Checkpoint: chờ mọi message trong buffer được broker xác nhận.
+
+        Returns:
+            list: các (video_id, error) gửi lỗi tính tới thời điểm này
+        """
+        self.producer.flush(timeout=timeout)
+        with self._lock:
+            return list(self.failed)
+
+    def close(self, timeout=30):
+        """Shutdown: flush 1 lần duy nhất rồi đóng producer."""
+        failed = self.flush(timeout)
+        self.producer.close(timeout=timeout)
+        print(f"📊 Kafka Producer closed: sent={self.sent}, failed={len(failed)}")
+        return failed
@@ -0,0 +1,271 @@
+"""
+AIMD controller cho request tới TikTok (dùng chung cho downloader và crawler).
+
+- limit: số request chạy song song tối đa; rate_per_min: nhịp bắt đầu request.
+- Additive increase: đủ `window` kết quả gần nhất với tỉ lệ thành công >= increase_ratio
+  -> limit += 1, rate += rate_step.
+- Multiplicative decrease:
+    * lỗi yt-dlp / request lỗi     -> limit, rate x error_factor
+    * HTTP 403/429, captcha (block) -> limit, rate x block_factor + cooldown (tăng gấp đôi
+      nếu bị block liên tiếp). Cooldown dùng chung mọi controller (cùng IP).
+- rate_per_min = 0: không giới hạn nhịp (như RateLimiter), chỉ điều chỉnh limit.
+- Trạng thái đã học được ghi ra JSON (ADAPTIVE_STATE_PATH) -> lần chạy sau (và các
+  replica/crawler khác) bắt đầu từ mức TikTok vừa chấp nhận, không từ hằng số.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+
+import config
+
+OK = "ok"
+ERROR = "error"
+BLOCKED = "blocked"
+
+BLOCK_PATTERN = re.compile(
+    r"\b(403|429)\b|forbidden|too many requests|captcha|verify you are human|"
+    r"rate.?limit|ip address is blocked|access denied",
+    re.IGNORECASE,
+)
+
+
+def classify_error(message):
+    """Lỗi là tín hiệu block (403/429/captcha...) hay lỗi thường (video xoá, mạng...)."""
+    return BLOCKED if BLOCK_PATTERN.search(str(message or "")) else ERROR
+
+
+class AIMDController:
+    def __init__(
+        self,
+        name,
+        initial_limit=2,
+        min_limit=1,
+        max_limit=6,
+        initial_rate=12.0,
+        min_rate=2.0,
+        max_rate=60.0,
+        rate_step=None,
+        window=10,
+        increase_ratio=0.9,
+        error_factor=0.75,
+        block_factor=0.5,
+        cooldown_sec=60,
+        jitter=0.2,
+        state_path=None,
+    ):
+        self.name = name
+        self.min_limit, self.max_limit = min_limit, max_limit
+        self.min_rate, self.max_rate = min_rate, max_rate
+        self.rate_step = rate_step or max(1.0, initial_rate * 0.25)
+        self.increase_ratio = increase_ratio
+        self.error_factor = error_factor
+        self.block_factor = block_factor
+        self.cooldown_sec = cooldown_sec
+        self.jitter = jitter
+        self.state_path = state_path
+        self.limit = initial_limit
+        self.rate_per_min = self._clamp_rate(initial_rate)
+        self.cooldown_until = 0.0  # time.time(), dùng chung qua state file
+        self.strikes = 0  # số lần block liên tiếp
+        self.in_flight = 0
+        self.outcomes = deque(maxlen=window)
+        self._next_start = 0.0  # time.monotonic()
+        self._state_mtime = None
+        self._cond = threading.Condition()
+        self._load()
+
+    # --- PERMITS ---
+    def acquire(self):
+        """Chờ tới khi còn slot (in_flight < limit), đúng nhịp rate và hết cooldown."""
+        with self._cond:
+            while True:
+                self._refresh_shared_cooldown()
+                now = time.monotonic()
+                wait = max(self._next_start - now, self.cooldown_until - time.time())
+                if wait <= 0 and self.in_flight < self.limit:
+                    self.in_flight += 1
+                    interval = 60.0 / self.rate_per_min if self.rate_per_min > 0 else 0.0
+                    self._next_start = now + interval * random.uniform(
+                        1 - self.jitter, 1 + self.jitter
+                    )
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, outcome):
+        with self._cond:
+            self.in_flight -= 1
+            self._record(outcome)
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """with controller.slot() as result: ...; result["outcome"] = BLOCKED/ERROR nếu lỗi"""
+        self.acquire()
+        result = {"outcome": OK}
+        try:
+            yield result
+        except Exception as e:
+            result["outcome"] = classify_error(e)
+            raise
+        finally:
+            self.release(result["outcome"])
+
+    # --- AIMD ---
+    def _record(self, outcome):
+        self.outcomes.append(outcome)
+        if outcome == BLOCKED:
+            self._decrease(self.block_factor)
+            self.cooldown_until = time.time() + self.cooldown_sec * 2 ** min(self.strikes, 4)
+            self.strikes += 1
+            print(
+                f"🚫 [{self.name}] Bị chặn -> limit={self.limit}, rate={self.rate_per_min:.1f}/min, "
+                f"nghỉ {self.cooldown_until - time.time():.0f}s"
+            )
+        elif outcome == ERROR:
+            self._decrease(self.error_factor)
+        elif len(self.outcomes) == self.outcomes.maxlen:
+            success = sum(o == OK for o in self.outcomes) / len(self.outcomes)
+            if success < self.increase_ratio:
+                return
+            self.strikes = 0
+            self.outcomes.clear()
+            if self.limit >= self.max_limit and self.rate_per_min in (0, self.max_rate):
+                return
+            self.limit = min(self.max_limit, self.limit + 1)
+            if self.rate_per_min > 0:
+                self.rate_per_min = self._clamp_rate(self.rate_per_min + self.rate_step)
+            print(f"📈 [{self.name}] limit={self.limit}, rate={self.rate_per_min:.1f}/min")
+        else:
+            return
+        self._save()
+
+    def _decrease(self, factor):
+        self.outcomes.clear()
+        self.limit = max(self.min_limit, int(self.limit * factor))
+        self.rate_per_min = self._clamp_rate(self.rate_per_min * factor)
+
+    def _clamp_rate(self, rate):
+        """Giữ rate trong [min_rate, max_rate]; 0 (không giới hạn) giữ nguyên."""
+        if rate <= 0:
+            return 0.0
+        return float(min(self.max_rate, max(self.min_rate, rate)))
+
+    # --- STATE FILE ---
+    @contextlib.contextmanager
+    def _locked(self):
+        """Khóa liên process (crawler + các replica ingestion cùng ghi 1 file)."""
+        with open(self.state_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        entry = self._read_state().get(self.name)
+        if entry:
+            self.limit = min(self.max_limit, max(self.min_limit, entry["limit"]))
+            self.rate_per_min = self._clamp_rate(entry["rate_per_min"])
+            self.strikes = entry.get("strikes", 0)
+            print(f"🎛️ [{self.name}] Resume: limit={self.limit}, rate={self.rate_per_min:.1f}/min")
+        self._refresh_shared_cooldown()
+
+    def _refresh_shared_cooldown(self):
+        """Controller khác (crawler / replica khác) bị block -> cùng nghỉ."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        mtime = os.path.getmtime(self.state_path)
+        if mtime == self._state_mtime:
+            return
+        self._state_mtime = mtime
+        cooldowns = [e.get("cooldown_until", 0.0) for e in self._read_state().values()]
+        self.cooldown_until = max([self.cooldown_until] + cooldowns)
+
+    def _save(self):
+        if not self.state_path:
+            return
+        try:
+            with self._locked():
+                state = self._read_state()
+                state[self.name] = {
+                    "limit": self.limit,
+                    "rate_per_min": round(self.rate_per_min, 2),
+                    "strikes": self.strikes,
+                    "cooldown_until": self.cooldown_until,
+                    "updated_at": time.time(),
+                }
+                state_dir = os.path.dirname(os.path.abspath(self.state_path))
+                fd, tmp = tempfile.mkstemp(dir=state_dir, suffix=".json.tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(state, f, indent=2, sort_keys=True)
+                os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"⚠️ [{self.name}] Không ghi được adaptive state: {e}")
+
+
+def download_controller():
+    """Controller cho yt-dlp download (ingestion worker)."""
+    return AIMDController(
+        "download",
+        initial_limit=config.PIPELINE_DOWNLOAD_WORKERS,
+        max_limit=config.DOWNLOAD_MAX_CONCURRENCY,
+        initial_rate=config.PIPELINE_DOWNLOAD_RATE_PER_MIN,
+        min_rate=config.DOWNLOAD_MIN_RATE_PER_MIN,
+        max_rate=config.DOWNLOAD_MAX_RATE_PER_MIN,
+        cooldown_sec=config.ADAPTIVE_COOLDOWN_SEC,
+        state_path=config.ADAPTIVE_STATE_PATH,
+    )
+
+
+def crawl_controller(name="crawler"):
+    """Controller cho crawler hashtag (1 browser -> chỉ điều chỉnh nhịp).
+
+    name: key trong state file; mỗi shard 1 key để không ghi đè nhịp đã học của nhau
+    (cooldown khi bị chặn vẫn dùng chung).
+    """
+    return AIMDController(
+        name,
+        initial_limit=1,
+        max_limit=1,
+        initial_rate=config.CRAWL_RATE_PER_MIN,
+        min_rate=config.CRAWL_MIN_RATE_PER_MIN,
+        max_rate=config.CRAWL_MAX_RATE_PER_MIN,
+        rate_step=0.5,
+        window=4,
+        cooldown_sec=config.ADAPTIVE_COOLDOWN_SEC,
+        state_path=config.ADAPTIVE_STATE_PATH,
+    )
+
+
+def api_controller(name="crawler_api"):
+    """Controller cho request item_list gọi thẳng API (crawler mode api, nhiều fetcher)."""
+    return AIMDController(
+        name,
+        initial_limit=max(1, config.CRAWL_API_WORKERS // 2),
+        max_limit=config.CRAWL_API_WORKERS,
+        initial_rate=config.CRAWL_API_RATE_PER_MIN,
+        min_rate=config.CRAWL_MIN_RATE_PER_MIN,
+        max_rate=config.CRAWL_API_MAX_RATE_PER_MIN,
+        cooldown_sec=config.ADAPTIVE_COOLDOWN_SEC,
+        state_path=config.ADAPTIVE_STATE_PATH,
+    )
@@ -28,6 +28,8 @@ os.makedirs(AUDIO_DIR, exist_ok=True)
 # File CSV kết quả crawl: /opt/project/streaming/data/crawl/tiktok_links_viet.csv
 INPUT_CSV_PATH = os.path.join(CRAWL_DIR, "tiktok_links_viet.csv")
 print(f"DEBUG: INPUT_CSV_PATH is set to: {INPUT_CSV_PATH}")
+# Crawl store (SQLite, 1 dòng / video_id): crawler upsert vào đây, CSV trên chỉ là bản export
+CRAWL_STORE_PATH = os.getenv("CRAWL_STORE_PATH", os.path.join(CRAWL_DIR, "crawl_store.sqlite"))
 
 # File Cookies và Temp Download nằm ngay trong thư mục ingestion cho gọn
 COOKIES_PATH = os.path.join(BASE_DIR, "cookies.txt")
@@ -40,15 +42,105 @@ MINIO_ACCESS_KEY = "admin"
 MINIO_SECRET_KEY = "password123"
 MINIO_BUCKET = "tiktok-raw-videos"
 MINIO_AUDIO_BUCKET = "tiktok-raw-audios"
+# Multipart upload: kích thước mỗi part (tối thiểu 5MiB) + số part upload song song
+MINIO_PART_SIZE = int(os.getenv("MINIO_PART_SIZE", str(8 * 1024 * 1024)))
+MINIO_PARALLEL_UPLOADS = int(os.getenv("MINIO_PARALLEL_UPLOADS", "4"))
+# Bắt đầu upload video trong lúc yt-dlp vẫn đang tải (chỉ với format 1 file)
+MINIO_STREAM_UPLOAD = os.getenv("MINIO_STREAM_UPLOAD", "true").lower() == "true"
 
 # --- KAFKA CONFIG ---
 # KAFKA_BOOTSTRAP_SERVERS = ["localhost:9092"]
 KAFKA_BOOTSTRAP_SERVERS = ["kafka:29092"]  # Dùng port nội bộ 29092
 KAFKA_TOPIC = "tiktok_raw_data"
+# Producer batching: gom message trong linger_ms / tới batch_size rồi nén cả batch
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4")  # lz4 | zstd | gzip | None
+KAFKA_COMPRESSION = None if KAFKA_COMPRESSION.lower() == "none" else KAFKA_COMPRESSION
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "20"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", str(64 * 1024)))
+KAFKA_ACKS = os.getenv("KAFKA_ACKS", "1")
+KAFKA_ACKS = KAFKA_ACKS if KAFKA_ACKS == "all" else int(KAFKA_ACKS)
+KAFKA_SEND_RETRIES = int(os.getenv("KAFKA_SEND_RETRIES", "3"))
+
+# --- URL WORK QUEUE (crawler -> Kafka -> main_worker --consume) ---
+# Key = video_id; số partition = số replica ingestion tối đa chạy song song
+KAFKA_URL_TOPIC = os.getenv("KAFKA_URL_TOPIC", "tiktok_video_urls")
+KAFKA_URL_PARTITIONS = int(os.getenv("KAFKA_URL_PARTITIONS", "4"))
+KAFKA_URL_CONSUMER_GROUP = os.getenv("KAFKA_URL_CONSUMER_GROUP", "tiktok_ingestion")
+# Crawler vẫn ghi CSV; bật để publish thêm link vào URL topic
+CRAWLER_PUBLISH_URLS = os.getenv("CRAWLER_PUBLISH_URLS", "true").lower() == "true"
+# Số URL tối đa đang xử lý (chưa commit) mỗi replica; vượt thì pause partition
+URL_QUEUE_MAX_IN_FLIGHT = int(os.getenv("URL_QUEUE_MAX_IN_FLIGHT", "8"))
+URL_QUEUE_MAX_POLL_INTERVAL_MS = int(os.getenv("URL_QUEUE_MAX_POLL_INTERVAL_MS", "900000"))
+
+# --- PIPELINE CONFIG (main_worker CSV mode) ---
+# Download giới hạn theo số video/phút (không phụ thuộc số worker) để tránh Captcha/Block
+PIPELINE_DOWNLOAD_WORKERS = int(os.getenv("PIPELINE_DOWNLOAD_WORKERS", "2"))
+PIPELINE_DOWNLOAD_RATE_PER_MIN = float(os.getenv("PIPELINE_DOWNLOAD_RATE_PER_MIN", "12"))
+PIPELINE_EXTRACT_WORKERS = int(
+    os.getenv("PIPELINE_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+PIPELINE_UPLOAD_WORKERS = int(os.getenv("PIPELINE_UPLOAD_WORKERS", "4"))
+PIPELINE_PUBLISH_WORKERS = int(os.getenv("PIPELINE_PUBLISH_WORKERS", "1"))
+# Adaptive (AIMD): 2 giá trị trên chỉ là điểm bắt đầu, controller tự tăng khi tải ổn
+# định, giảm mạnh khi gặp lỗi / 403 / 429 / captcha; mức đã học lưu ở ADAPTIVE_STATE_PATH
+DOWNLOAD_MAX_CONCURRENCY = int(os.getenv("DOWNLOAD_MAX_CONCURRENCY", "6"))
+DOWNLOAD_MIN_RATE_PER_MIN = float(os.getenv("DOWNLOAD_MIN_RATE_PER_MIN", "2"))
+DOWNLOAD_MAX_RATE_PER_MIN = float(os.getenv("DOWNLOAD_MAX_RATE_PER_MIN", "60"))
+# Crawler: số hashtag/phút (1 browser)
+CRAWL_RATE_PER_MIN = float(os.getenv("CRAWL_RATE_PER_MIN", "2"))
+CRAWL_MIN_RATE_PER_MIN = float(os.getenv("CRAWL_MIN_RATE_PER_MIN", "0.5"))
+CRAWL_MAX_RATE_PER_MIN = float(os.getenv("CRAWL_MAX_RATE_PER_MIN", "6"))
+# Crawler song song: hashtag chia đều cho CRAWL_SHARDS browser session. Session i dùng
+# cookie file / proxy thứ i (xoay vòng, phân tách bằng dấu phẩy; proxy trống = kết nối thẳng)
+CRAWL_SHARDS = int(os.getenv("CRAWL_SHARDS", "1"))
+CRAWL_COOKIE_FILES = [p.strip() for p in os.getenv("CRAWL_COOKIE_FILES", "").split(",") if p.strip()]
+CRAWL_PROXIES = [p.strip() for p in os.getenv("CRAWL_PROXIES", "").split(",") if p.strip()]
+# Số session warm-up sẵn mỗi shard + tuổi tối đa 1 session trước khi đổi (giây)
+CRAWL_SPARE_SESSIONS = int(os.getenv("CRAWL_SPARE_SESSIONS", "1"))
+CRAWL_SESSION_MAX_AGE_SEC = int(os.getenv("CRAWL_SESSION_MAX_AGE_SEC", "2700"))
+# CRAWL_MODE=api: browser chỉ lấy request item_list đã ký (template), các trang sau gọi
+# thẳng API bằng HTTP (CRAWL_API_WORKERS hashtag song song); browser: scroll như cũ
+CRAWL_MODE = os.getenv("CRAWL_MODE", "browser").lower()
+CRAWL_API_WORKERS = int(os.getenv("CRAWL_API_WORKERS", "4"))
+CRAWL_API_MAX_PAGES = int(os.getenv("CRAWL_API_MAX_PAGES", "20"))
+CRAWL_API_RATE_PER_MIN = float(os.getenv("CRAWL_API_RATE_PER_MIN", "20"))
+CRAWL_API_MAX_RATE_PER_MIN = float(os.getenv("CRAWL_API_MAX_RATE_PER_MIN", "60"))
+# Bị chặn -> nghỉ (nhân đôi nếu bị chặn liên tiếp), áp dụng cho cả crawler và downloader
+ADAPTIVE_COOLDOWN_SEC = int(os.getenv("ADAPTIVE_COOLDOWN_SEC", "60"))
+ADAPTIVE_STATE_PATH = os.getenv(
+    "ADAPTIVE_STATE_PATH", os.path.join(DATA_DIR, "state", "adaptive_concurrency.json")
+)
+# Prefetch metadata (không tải) -> bỏ video quá dài / quá nặng trước khi tải; 0 = không lọc
+DOWNLOAD_MAX_DURATION_SEC = int(os.getenv("DOWNLOAD_MAX_DURATION_SEC", "600"))
+DOWNLOAD_MAX_FILESIZE_MB = float(os.getenv("DOWNLOAD_MAX_FILESIZE_MB", "200"))
+# Media extract (1 lần ffmpeg / video): WAV + thumbnails + proxy clip cho dashboard
+MEDIA_THUMBNAIL_COUNT = int(os.getenv("MEDIA_THUMBNAIL_COUNT", "3"))  # 0 = tắt
+MEDIA_THUMBNAIL_HEIGHT = int(os.getenv("MEDIA_THUMBNAIL_HEIGHT", "360"))
+MEDIA_PROXY_ENABLED = os.getenv("MEDIA_PROXY_ENABLED", "false").lower() == "true"
+MEDIA_PROXY_HEIGHT = int(os.getenv("MEDIA_PROXY_HEIGHT", "224"))
+# Định dạng audio lưu ở MINIO_AUDIO_BUCKET: wav (PCM) | flac (lossless, ~2x nhỏ hơn) |
+# opus (~5-10x nhỏ hơn). Phía đọc decode qua train_eval_module/shared_utils/audio_io.py
+AUDIO_FORMAT = os.getenv("AUDIO_FORMAT", "wav").lower()
+AUDIO_OPUS_BITRATE = os.getenv("AUDIO_OPUS_BITRATE", "32k")
+# Queue giữa các stage (giới hạn số video tạm nằm trên đĩa)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+PIPELINE_REPORT_INTERVAL = int(os.getenv("PIPELINE_REPORT_INTERVAL", "30"))
+
+# --- INGESTION LEDGER (trạng thái từng URL, resume + incremental) ---
+LEDGER_PATH = os.getenv(
+    "INGESTION_LEDGER_PATH", os.path.join(DATA_DIR, "state", "ingestion_ledger.sqlite")
+)
+LEDGER_MAX_RETRIES = int(os.getenv("INGESTION_MAX_RETRIES", "3"))
 
 # --- AI LABELING CONFIG ---
 ENABLE_AI_LABELING = True
 MODEL_NAME = "Qwen/Qwen2.5-1.5B-Instruct"
+# Batch labeling (clients/ai_labeler.py): cache theo hash text, prompt cắt tối đa N ký tự
+AI_LABEL_BATCH_SIZE = int(os.getenv("AI_LABEL_BATCH_SIZE", "8"))
+AI_LABEL_MAX_CHARS = int(os.getenv("AI_LABEL_MAX_CHARS", "1500"))
+AI_LABEL_CACHE_PATH = os.getenv(
+    "AI_LABEL_CACHE_PATH", os.path.join(DATA_DIR, "state", "ai_label_cache.sqlite")
+)
 
 # Tạo các thư mục cần thiết nếu chưa có
 os.makedirs(TEMP_DOWNLOAD_DIR, exist_ok=True)
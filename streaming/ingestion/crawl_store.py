@@ -0,0 +1,215 @@
+"""
+Crawl store (SQLite): 1 dòng / video, thay cho CSV append-only.
+
+- Khóa duy nhất video_id (link không có id -> dùng link): crawl lại cùng video chỉ
+  cập nhật last_seen / seen_count / description, dataset không phình theo số lần chạy.
+- Tra cứu theo video_id qua primary key, không cần đọc lại cả file.
+- export_csv() ghi lại định dạng cũ (hashtag, link, description, label) cho các bước
+  vẫn đọc tiktok_links_viet.csv.
+
+    python crawl_store.py export [--output x.csv] [--label harmful]
+    python crawl_store.py import old.csv     # nạp CSV cũ vào store
+    python crawl_store.py stats
+
+Không import config ở module level để crawl_scripts/* dùng được độc lập.
+"""
+
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl_videos (
+    video_id TEXT PRIMARY KEY,
+    link TEXT NOT NULL,
+    hashtag TEXT,
+    description TEXT,
+    label TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    seen_count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_videos_label ON crawl_videos (label);
+CREATE INDEX IF NOT EXISTS idx_crawl_videos_hashtag ON crawl_videos (hashtag);
+CREATE INDEX IF NOT EXISTS idx_crawl_videos_first_seen ON crawl_videos (first_seen);
+"""
+
+# Crawl lại: giữ hashtag / label lần đầu, description mới nếu có
+UPSERT = """
+INSERT INTO crawl_videos (video_id, link, hashtag, description, label, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (video_id) DO UPDATE SET
+    last_seen = excluded.last_seen,
+    seen_count = seen_count + 1,
+    description = COALESCE(NULLIF(excluded.description, ''), description)
+"""
+
+CSV_COLUMNS = ("hashtag", "link", "description", "label")
+
+_VIDEO_ID = re.compile(r"/video/(\d+)")
+
+
+def video_id_of(link):
+    match = _VIDEO_ID.search(link or "")
+    return match.group(1) if match else link
+
+
+def _clean_desc(desc):
+    # Xóa xuống dòng để tránh vỡ CSV khi export
+    return (desc or "").replace("\n", " ").replace("\r", " ")
+
+
+class CrawlStore:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def upsert(self, tag, videos, label):
+        """
+        videos: list of dict {'link': str, 'desc': str, 'video_id': str (tuỳ chọn)}
+        Returns:
+            int: số video mới (chưa có trong store)
+        """
+        now = time.time()
+        rows = []
+        for v in videos:
+            vid = v.get("video_id") or video_id_of(v["link"])
+            rows.append((str(vid), v["link"], tag, _clean_desc(v.get("desc")), label, now, now))
+        batch_ids = {row[0] for row in rows}
+        with self._lock:
+            # BEGIN IMMEDIATE: giữ write lock từ lúc tra id tới commit -> video do shard
+            # process khác ghi cùng lúc không bị đếm là "mới"
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._existing_ids(batch_ids)
+                self._conn.executemany(UPSERT, rows)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return len(batch_ids - existing)
+
+    def _existing_ids(self, video_ids):
+        """Tra theo primary key (không quét cả bảng)."""
+        video_ids = list(video_ids)
+        found = set()
+        for start in range(0, len(video_ids), 500):  # giới hạn số biến SQLite
+            chunk = video_ids[start : start + 500]
+            found.update(
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT video_id FROM crawl_videos WHERE video_id IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+        return found
+
+    def get(self, video_id):
+        rows = self._query(
+            "SELECT video_id, link, hashtag, description, label, first_seen, last_seen, "
+            "seen_count FROM crawl_videos WHERE video_id = ?",
+            (str(video_id),),
+        )
+        if not rows:
+            return None
+        keys = ("video_id", "link", "hashtag", "description", "label",
+                "first_seen", "last_seen", "seen_count")
+        return dict(zip(keys, rows[0]))
+
+    def __contains__(self, video_id):
+        return bool(self._query("SELECT 1 FROM crawl_videos WHERE video_id = ?", (str(video_id),)))
+
+    def links(self, label=None):
+        """(link, label) theo thứ tự phát hiện, cho main_worker CSV mode."""
+        sql = "SELECT link, label FROM crawl_videos"
+        params = ()
+        if label:
+            sql += " WHERE label = ?"
+            params = (label,)
+        return self._query(sql + " ORDER BY first_seen, video_id", params)
+
+    def export_csv(self, output_csv, label=None):
+        """Ghi định dạng CSV cũ (utf-8-sig để Excel đọc được tiếng Việt), ghi atomic."""
+        sql = f"SELECT {', '.join(CSV_COLUMNS)} FROM crawl_videos"
+        params = ()
+        if label:
+            sql += " WHERE label = ?"
+            params = (label,)
+        rows = self._query(sql + " ORDER BY first_seen, video_id", params)
+        os.makedirs(os.path.dirname(os.path.abspath(output_csv)), exist_ok=True)
+        tmp = f"{output_csv}.{os.getpid()}.tmp"
+        with open(tmp, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(rows)
+        os.replace(tmp, output_csv)
+        return len(rows)
+
+    def import_csv(self, input_csv):
+        """Nạp CSV crawl cũ (hashtag, link, description?, label). Returns: số video mới."""
+        added = 0
+        with open(input_csv, newline="", encoding="utf-8-sig") as f:
+            groups = {}
+            for row in csv.DictReader(f):
+                if not row.get("link"):
+                    continue
+                key = (row.get("hashtag"), row.get("label"))
+                groups.setdefault(key, []).append(
+                    {"link": row["link"], "desc": row.get("description") or ""}
+                )
+        for (tag, label), videos in groups.items():
+            added += self.upsert(tag, videos, label)
+        return added
+
+    def stats(self):
+        return dict(self._query("SELECT label, COUNT(*) FROM crawl_videos GROUP BY label"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="Crawl store (SQLite)")
+    parser.add_argument("--store", default=config.CRAWL_STORE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Xuất CSV định dạng cũ")
+    export.add_argument("--output", default=config.INPUT_CSV_PATH)
+    export.add_argument("--label")
+    load = sub.add_parser("import", help="Nạp CSV cũ vào store")
+    load.add_argument("csv")
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    store = CrawlStore(args.store)
+    try:
+        if args.command == "export":
+            count = store.export_csv(args.output, args.label)
+            print(f"💾 Đã xuất {count} video -> {args.output}")
+        elif args.command == "import":
+            print(f"📥 Thêm {store.import_csv(args.csv)} video mới | {store.stats()}")
+        else:
+            print(f"📊 {store.stats()}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,15 @@ crawler_links.py
 Phiên bản: Full Data (Link + Caption/Text)
 """
 
+import argparse
 import os
 import time
 import random
-import csv
-import json
 import gzip
 import sys
 import psycopg2
 import itertools
+from concurrent.futures import ProcessPoolExecutor
 from seleniumwire import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -20,6 +20,22 @@ from selenium_stealth import stealth
 
 # webdriver_manager imported conditionally in init_driver() for fallback only
 import config
+from api_crawler import ApiCrawler, capture_template
+from concurrency import (
+    BLOCKED,
+    ERROR,
+    OK,
+    api_controller,
+    classify_error,
+    crawl_controller,
+)
+from crawl_store import CrawlStore
+from item_list import ITEM_LIST_SCOPES, ItemListCapture
+from sessions import SessionPool, shard
+
+# URL work queue (Kafka) - kafka client chỉ import khi bật CRAWLER_PUBLISH_URLS
+_URL_PUBLISHER = None
+_CRAWL_STORE = None
 
 # --- CONFIG DB ---
 DB_CONFIG = {
@@ -90,8 +106,8 @@ def log_to_db(message, level="INFO"):
         pass
 
 
-def init_driver():
-    log_to_db("🔧 Khởi tạo Browser (Non-Headless API Mode)...")
+def init_driver(proxy=None):
+    log_to_db(f"🔧 Khởi tạo Browser (Non-Headless API Mode, proxy={proxy or 'none'})...")
     options = Options()
 
     # Giữ Non-Headless để TikTok trả JSON
@@ -109,7 +125,14 @@ def init_driver():
     options.add_experimental_option("useAutomationExtension", False)
 
     try:
-        seleniumwire_options = {"disable_encoding": True}
+        seleniumwire_options = {
+            "disable_encoding": True,
+            # Giữ request trong RAM (không ghi đĩa), tối đa N request gần nhất
+            "request_storage": "memory",
+            "request_storage_max_size": 200,
+        }
+        if proxy:
+            seleniumwire_options["proxy"] = {"http": proxy, "https": proxy, "no_proxy": "localhost,127.0.0.1"}
         # Use system chromedriver instead of webdriver-manager (avoids path issues in Docker)
         chromedriver_path = "/usr/local/bin/chromedriver"
         if os.path.exists(chromedriver_path):
@@ -124,6 +147,8 @@ def init_driver():
         driver = webdriver.Chrome(
             service=service, options=options, seleniumwire_options=seleniumwire_options
         )
+        # Chỉ capture API item_list
+        driver.scopes = ITEM_LIST_SCOPES
         stealth(
             driver,
             languages=["vi-VN", "vi", "en-US", "en"],
@@ -139,16 +164,16 @@ def init_driver():
         return None
 
 
-def load_cookies(driver):
-    if not os.path.exists(COOKIES_FILE):
-        log_to_db("⚠️ KHÔNG TÌM THẤY COOKIES!", "ERROR")
+def load_cookies(driver, cookies_file=COOKIES_FILE):
+    if not os.path.exists(cookies_file):
+        log_to_db(f"⚠️ KHÔNG TÌM THẤY COOKIES! ({cookies_file})", "ERROR")
         return False
 
-    log_to_db("🍪 Đang nạp cookies...")
+    log_to_db(f"🍪 Đang nạp cookies ({os.path.basename(cookies_file)})...")
     try:
         driver.get("https://www.tiktok.com/")
         time.sleep(3)
-        with open(COOKIES_FILE, "r", encoding="utf-8") as f:
+        with open(cookies_file, "r", encoding="utf-8") as f:
             count = 0
             for line in f:
                 if line.strip().startswith("#") or not line.strip():
@@ -188,133 +213,308 @@ def warmup_session(driver):
         pass
 
 
-def save_csv(tag, videos, label):
+def close_crawl_store():
+    global _CRAWL_STORE
+    if _CRAWL_STORE is not None:
+        _CRAWL_STORE.close()
+        _CRAWL_STORE = None
+
+
+def get_crawl_store():
+    """Crawl store (SQLite, unique theo video_id), mở 1 lần."""
+    global _CRAWL_STORE
+    if _CRAWL_STORE is None:
+        is_new = not os.path.exists(config.CRAWL_STORE_PATH)
+        _CRAWL_STORE = CrawlStore(config.CRAWL_STORE_PATH)
+        if is_new and os.path.exists(OUTPUT_CSV):
+            # Lần đầu: nạp CSV append-only cũ để export không làm mất dữ liệu
+            added = _CRAWL_STORE.import_csv(OUTPUT_CSV)
+            log_to_db(f"📥 Nạp {added} video từ CSV cũ vào crawl store", "INFO")
+    return _CRAWL_STORE
+
+
+def save_videos(tag, videos, label):
     """
-    videos: list of dict {'link': str, 'desc': str}
+    Upsert vào crawl store (thay cho append CSV: crawl lại không sinh dòng trùng).
+    videos: list of dict {'link': str, 'desc': str, 'video_id': str}
     """
     try:
-        mode = "a" if os.path.exists(OUTPUT_CSV) else "w"
-        # Dùng utf-8-sig để Excel đọc được tiếng Việt
-        with open(OUTPUT_CSV, mode=mode, newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            # Ghi header nếu file mới
-            if mode == "w":
-                writer.writerow(["hashtag", "link", "description", "label"])
-
-            for v in videos:
-                # Làm sạch description (xóa xuống dòng để tránh vỡ CSV)
-                clean_desc = v["desc"].replace("\n", " ").replace("\r", " ")
-                writer.writerow([tag, v["link"], clean_desc, label])
+        new_count = get_crawl_store().upsert(tag, videos, label)
+        log_to_db(f"💾 #{tag}: {new_count} video mới / {len(videos)}", "INFO")
+    except Exception as e:
+        log_to_db(f"Lỗi ghi crawl store: {e}", "ERROR")
+
+
+def export_csv():
+    """Xuất store ra OUTPUT_CSV cho các bước vẫn đọc CSV (DAG 2, crawl_scripts)."""
+    try:
+        count = get_crawl_store().export_csv(OUTPUT_CSV)
+        log_to_db(f"💾 Export {count} video -> {OUTPUT_CSV}", "INFO")
     except Exception as e:
         log_to_db(f"Lỗi ghi CSV: {e}", "ERROR")
 
 
+def get_url_publisher():
+    """Producer cho URL topic (tạo 1 lần). Kafka lỗi -> None, crawler chỉ ghi CSV."""
+    global _URL_PUBLISHER
+    if _URL_PUBLISHER is None and config.CRAWLER_PUBLISH_URLS:
+        try:
+            from clients.minio_kafka_clients import KafkaClient
+
+            _URL_PUBLISHER = KafkaClient(
+                retries=3, topic=config.KAFKA_URL_TOPIC, partitions=config.KAFKA_URL_PARTITIONS
+            )
+        except Exception as e:
+            log_to_db(f"⚠️ Không kết nối được Kafka URL topic, chỉ ghi crawl store: {e}", "WARN")
+            config.CRAWLER_PUBLISH_URLS = False
+    return _URL_PUBLISHER
+
+
+def publish_urls(tag, videos, label):
+    """Đẩy link vào URL topic (key = video_id) cho main_worker --consume."""
+    publisher = get_url_publisher()
+    if publisher is None:
+        return
+    already_failed = len(publisher.failed)
+    for v in videos:
+        publisher.send(
+            {
+                "video_id": v["video_id"],
+                "url": v["link"],
+                "label": label,
+                "hashtag": tag,
+                "description": v["desc"],
+                "discovered_at": time.time(),
+            }
+        )
+    failed = publisher.flush(timeout=30)[already_failed:]
+    if failed:
+        log_to_db(f"⚠️ URL topic: {len(failed)} link gửi lỗi (vẫn có trong crawl store)", "WARN")
+
+
+def is_blocked_page(driver):
+    """TikTok trả trang captcha / verify thay vì nội dung hashtag."""
+    try:
+        page = driver.page_source.lower()
+    except Exception:
+        return False
+    return "captcha" in page or "verify to continue" in page
+
+
 def intercept_api_data(driver, tag, label):
+    """Bắt API item_list của 1 hashtag.
+
+    Returns:
+        str: OK (có video) / ERROR (không bắt được gì) / BLOCKED (403, 429, captcha)
+    """
     log_to_db(f"📡 Đang lắng nghe API cho #{tag}...", "INFO")
-    del driver.requests
+    capture = ItemListCapture(driver)
+    capture.reset()
 
     try:
         driver.get(f"https://www.tiktok.com/tag/{tag}")
-    except:
-        return  # Bỏ qua nếu load lỗi
+    except Exception as e:
+        return classify_error(e)  # Bỏ qua nếu load lỗi
 
     for _ in range(3):
         driver.execute_script("window.scrollBy(0, 1000);")
         time.sleep(random.uniform(2, 4))
-
-    found_videos = []  # Chứa dict {'link':..., 'desc':...}
+        capture.poll()
 
     log_to_db("⏳ Đang đợi phản hồi từ API...", "INFO")
     start_wait = time.time()
 
+    # Mỗi vòng chỉ parse response mới về
     while time.time() - start_wait < 15:
-        for request in driver.requests:
-            if request.response and "item_list" in request.url:
-                try:
-                    body = request.response.body
-                    try:
-                        data = json.loads(body.decode("utf-8"))
-                    except:
-                        continue
-
-                    if "itemList" in data:
-                        for item in data["itemList"]:
-                            vid_id = item.get("id")
-                            author = item.get("author", {})
-                            author_id = author.get("uniqueId")
-
-                            # [MỚI] Lấy caption text
-                            desc = item.get("desc", "")
-
-                            if vid_id and author_id:
-                                full_link = f"https://www.tiktok.com/@{author_id}/video/{vid_id}"
-
-                                # Lưu cả link và description
-                                found_videos.append({"link": full_link, "desc": desc})
-                except Exception:
-                    pass
-
-        # Lọc trùng lặp dựa trên link
-        unique_videos = {v["link"]: v for v in found_videos}.values()
-
-        if len(unique_videos) > 5:
+        if capture.poll() > 5:
             break
         time.sleep(1)
 
-    unique_list = list({v["link"]: v for v in found_videos}.values())
+    unique_list = list(capture.videos.values())
+    blocked_status = capture.blocked_status
 
     if unique_list:
-        save_csv(tag, unique_list, label)
+        save_videos(tag, unique_list, label)
+        publish_urls(tag, unique_list, label)
         log_to_db(
             f"🎉 TỔNG KẾT: Lấy được {len(unique_list)} video (có Text) cho #{tag}",
             "INFO",
         )
-    else:
-        log_to_db(f"⚠️ Không bắt được API nào cho #{tag}.", "WARN")
+        return OK
+    if blocked_status or is_blocked_page(driver):
+        log_to_db(f"🚫 #{tag}: TikTok chặn (HTTP {blocked_status or 'captcha'})", "WARN")
+        return BLOCKED
+    log_to_db(f"⚠️ Không bắt được API nào cho #{tag}.", "WARN")
+    return ERROR
+
+
+def crawl_hashtag(controller, driver, tag, label):
+    """Chờ tới lượt theo nhịp AIMD rồi crawl; kết quả quay lại điều chỉnh nhịp."""
+    controller.acquire()
+    outcome = ERROR
+    try:
+        outcome = intercept_api_data(driver, tag, label)
+    finally:
+        controller.release(outcome)
+
+
+def hashtag_shards(shards):
+    """Danh sách (tag, label) xen kẽ harmful / safe, chia round-robin cho các shard."""
+    tags = []
+    for r, s in itertools.zip_longest(RISKY_HASHTAGS, SAFE_HASHTAGS):
+        if r:
+            tags.append((r, "harmful"))
+        if s:
+            tags.append((s, "safe"))
+    return shard(tags, shards)
+
+
+def session_profile(index):
+    """Cookie file + proxy của session thứ index (xoay vòng theo config)."""
+    cookies = config.CRAWL_COOKIE_FILES or [COOKIES_FILE]
+    proxies = config.CRAWL_PROXIES or [None]
+    return {"cookies": cookies[index % len(cookies)], "proxy": proxies[index % len(proxies)]}
+
+
+def start_session(profile):
+    """Browser mới đã nạp cookies + warm-up, None nếu lỗi."""
+    driver = init_driver(proxy=profile["proxy"])
+    if not driver:
+        return None
+    if not load_cookies(driver, profile["cookies"]):
+        driver.quit()
+        return None
+    warmup_session(driver)
+    return driver
+
+
+def crawl_api(driver, tags, controller):
+    """CRAWL_MODE=api: browser chỉ cấp template item_list, phân trang qua HTTP."""
+
+    def save_page(tag, videos, label):
+        save_videos(tag, videos, label)
+        publish_urls(tag, videos, label)
+
+    crawler = ApiCrawler(
+        lambda tag: capture_template(driver, tag),
+        controller=controller,
+        workers=config.CRAWL_API_WORKERS,
+        max_pages=config.CRAWL_API_MAX_PAGES,
+    )
+    try:
+        results = crawler.crawl(tags, on_videos=save_page)
+    finally:
+        crawler.close()
+    log_to_db(
+        f"🎉 API mode: {sum(results.values())} video / {len(results)} hashtag, "
+        f"{crawler.templates_fetched} lần lấy template",
+        "INFO",
+    )
+
+
+def crawl_browser(pool, driver, tags, controller):
+    """Scroll trang từng hashtag trên browser. Returns: session đang dùng lúc kết thúc."""
+    start_time = time.time()
+    for count, (tag, label) in enumerate(tags, start=1):
+        crawl_hashtag(controller, driver, tag, label)
+
+        if time.time() - start_time > config.CRAWL_SESSION_MAX_AGE_SEC:
+            log_to_db("♻️ Đổi sang browser đã warm-up sẵn...", "INFO")
+            driver.quit()
+            driver = pool.get()
+            if not driver:
+                log_to_db("❌ Session mới lỗi, dừng shard", "ERROR")
+                break
+            start_time = time.time()
+
+        if count % 4 == 0:
+            log_to_db("☕ Nghỉ 15s...", "INFO")
+            time.sleep(15)
+    return driver
+
+
+def run_shard(index, shards):
+    """Crawl các hashtag của 1 shard bằng 1 browser; đổi sang session warm sẵn sau
+    CRAWL_SESSION_MAX_AGE_SEC (không phải chờ restart). Returns: False nếu không có session.
+    """
+    tags = hashtag_shards(shards)[index]
+    profile = session_profile(index)
+    log_to_db(f"🚀 Shard {index + 1}/{shards}: {len(tags)} hashtag", "INFO")
+
+    # API mode chỉ dùng 1 browser để lấy template, không đổi session -> không warm sẵn
+    spares = 0 if config.CRAWL_MODE == "api" else config.CRAWL_SPARE_SESSIONS
+    pool = SessionPool(lambda: start_session(profile), spares=spares)
+    driver = pool.get()
+    if not driver:
+        log_to_db(f"❌ Shard {index + 1}/{shards}: không khởi động được browser", "ERROR")
+        pool.close()
+        return False
+
+    try:
+        # Nhịp crawl tự điều chỉnh (thay cho sleep 8-12s cố định), học từ lần chạy trước.
+        # Mỗi shard 1 key trong state file; bị chặn -> mọi shard cùng IP nghỉ (cooldown chung)
+        suffix = f"-{index}" if shards > 1 else ""
+        if config.CRAWL_MODE == "api":
+            crawl_api(driver, tags, api_controller(f"crawler_api{suffix}"))
+        else:
+            driver = crawl_browser(pool, driver, tags, crawl_controller(f"crawler{suffix}"))
+    finally:
+        if driver:
+            driver.quit()
+        pool.close()
+        close_crawl_store()
+        if _URL_PUBLISHER is not None:
+            _URL_PUBLISHER.close()
+    return True
 
 
 def main():
+    """
+    Không tham số: chạy CRAWL_SHARDS shard song song (mỗi shard 1 process / browser),
+    gộp vào crawl store rồi export CSV.
+    --shard i: chỉ chạy shard i (Airflow map 1 task / shard, task export chạy sau).
+    """
+    parser = argparse.ArgumentParser(description="TikTok hashtag crawler")
+    parser.add_argument("--shard", type=int, help="Chỉ chạy shard này (0-based)")
+    parser.add_argument("--shards", type=int, default=config.CRAWL_SHARDS)
+    parser.add_argument("--export", action="store_true", help="Chỉ export crawl store ra CSV")
+    parser.add_argument(
+        "--init-store", action="store_true", help="Chỉ tạo crawl store (nạp CSV cũ) trước khi chạy shard"
+    )
+    args = parser.parse_args()
+
     try:
         os.makedirs(config.CRAWL_DIR, exist_ok=True)
     except:
         pass
 
-    driver = init_driver()
-    if not driver:
-        sys.exit(1)
+    if args.export or args.init_store:
+        get_crawl_store()
+        if args.export:
+            export_csv()
+        close_crawl_store()
+        return
+    if args.shard is not None:
+        if not run_shard(args.shard, args.shards):
+            sys.exit(1)
+        return
+
+    # Tạo store (nạp CSV cũ nếu có) trước khi tách process
+    get_crawl_store()
+    close_crawl_store()
+    if args.shards <= 1:
+        ok = run_shard(0, 1)
+    else:
+        with ProcessPoolExecutor(max_workers=args.shards) as executor:
+            futures = [executor.submit(run_shard, i, args.shards) for i in range(args.shards)]
+            ok = any(f.result() for f in futures)
 
-    if load_cookies(driver):
-        warmup_session(driver)
-        log_to_db("🚀 Bắt đầu chiến dịch Streaming...", "INFO")
-        start_time = time.time()
-        count = 0
-
-        for r, s in itertools.zip_longest(RISKY_HASHTAGS, SAFE_HASHTAGS):
-            if r:
-                intercept_api_data(driver, r, "harmful")
-                time.sleep(random.uniform(8, 12))
-                count += 1
-            if s:
-                intercept_api_data(driver, s, "safe")
-                time.sleep(random.uniform(8, 12))
-                count += 1
-
-            # Restart sau 45 phút
-            if time.time() - start_time > 2700:
-                log_to_db("♻️ Restart Browser...", "INFO")
-                driver.quit()
-                time.sleep(5)
-                driver = init_driver()
-                load_cookies(driver)
-                warmup_session(driver)
-                start_time = time.time()
-
-            if count % 4 == 0:
-                log_to_db("☕ Nghỉ 15s...", "INFO")
-                time.sleep(15)
-
-    driver.quit()
+    # Các shard ghi chung 1 store (unique video_id) -> output đã dedup
+    export_csv()
+    close_crawl_store()
     log_to_db("🏁 Hoàn tất phiên làm việc.", "INFO")
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
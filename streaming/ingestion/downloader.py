@@ -1,98 +1,302 @@
-import yt_dlp
+"""
+Downloader TikTok (yt-dlp, giả lập mobile).
+
+TikTokDownloader sống suốt phiên ingestion:
+- Mỗi thread giữ 1 YoutubeDL (không thread-safe) dùng lại cho mọi URL -> giữ HTTP
+  connection / cookie jar, không dựng lại extractor mỗi video.
+- device_id cố định cho cả phiên (như 1 điện thoại thật), không random mỗi URL.
+- Mỗi task tải vào thư mục tạm riêng (mkdtemp) -> path file lấy thẳng từ yt-dlp,
+  không còn quét temp_downloads tìm MP4 mới (race giữa các thread).
+- prefetch(): chỉ lấy metadata (download=False) để lọc theo duration / filesize,
+  video đạt mới tải (dùng lại metadata, không request lần 2).
+"""
+
 import os
-import shutil
 import random
-import time
-import re
+import shutil
+import tempfile
+import threading
 
+import yt_dlp
 
-def download_video_to_temp_mobile(video_url):  # Giữ nguyên tên hàm cũ để tương thích
-    """
-    Tải video TikTok sử dụng yt-dlp với cấu hình Mobile (iPhone) để tránh bị chặn.
-    """
-    # 1. Thiết lập đường dẫn
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    cookie_path = os.path.join(base_dir, "cookies.txt")
-    temp_dir = os.path.join(base_dir, "temp_downloads")
-
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
-    # 2. Cấu hình yt-dlp (Mobile Emulation)
-    ydl_opts = {
-        "outtmpl": os.path.join(temp_dir, "%(id)s.%(ext)s"),
-        "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
-        "noplaylist": True,
-        "http_headers": {
-            "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Accept-Language": "en-us",
-        },
-        "extractor_args": {
-            "tiktok": {
-                "app_version": "32.0.0",
-                "manifest_app_version": "32.0.0",
-                "iid": "7318518857994389254",
-                "device_id": str(
-                    random.randint(7000000000000000000, 7999999999999999999)
-                ),
-            }
-        },
-        "quiet": True,
-        "no_warnings": True,
-        "nocheckcertificate": True,
-        "ignoreerrors": True,
-    }
-
-    if os.path.exists(cookie_path) and os.path.getsize(cookie_path) > 0:
-        ydl_opts["cookiefile"] = cookie_path
+import config
+from concurrency import OK, classify_error
 
-    try:
+
+class DownloadProgress:
+    """Trạng thái 1 lần download, cho phép upload song song trong lúc đang tải."""
+
+    def __init__(self, filename=None):
+        self.filename = filename  # path cuối cùng (sau khi yt-dlp rename .part)
+        self.complete = threading.Event()
+        self.failed = threading.Event()
+
+
+class YtdlpLog:
+    """Logger cho yt-dlp: giữ lại error message để phân loại block (403/429/captcha)."""
+
+    def __init__(self):
+        self.errors = []
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        print(f"❌ [yt-dlp] {msg}")
+        self.errors.append(msg)
+
+
+class VideoRejected(Exception):
+    """Metadata không đạt bộ lọc (quá dài / quá nặng) -> bỏ qua, không phải lỗi tải."""
+
+
+class TikTokDownloader:
+    def __init__(
+        self,
+        temp_root=None,
+        cookie_path=None,
+        max_duration_sec=None,
+        max_filesize_mb=None,
+    ):
+        self.temp_root = temp_root or config.TEMP_DOWNLOAD_DIR
+        self.cookie_path = cookie_path or config.COOKIES_PATH
+        self.max_duration_sec = (
+            config.DOWNLOAD_MAX_DURATION_SEC if max_duration_sec is None else max_duration_sec
+        )
+        self.max_filesize_mb = (
+            config.DOWNLOAD_MAX_FILESIZE_MB if max_filesize_mb is None else max_filesize_mb
+        )
+        self.device_id = str(random.randint(7000000000000000000, 7999999999999999999))
+        os.makedirs(self.temp_root, exist_ok=True)
+        self._local = threading.local()
+        self._instances = []  # để close() toàn bộ YoutubeDL của các thread
+        self._lock = threading.Lock()
+
+    # --- YOUTUBEDL PER THREAD ---
+    def _options(self, log):
+        ydl_opts = {
+            "outtmpl": "%(id)s.%(ext)s",
+            "paths": {"home": self.temp_root},
+            "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
+            "noplaylist": True,
+            "http_headers": {
+                "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1",
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-us",
+            },
+            "extractor_args": {
+                "tiktok": {
+                    "app_version": "32.0.0",
+                    "manifest_app_version": "32.0.0",
+                    "iid": "7318518857994389254",
+                    "device_id": self.device_id,
+                }
+            },
+            "quiet": True,
+            "no_warnings": True,
+            "logger": log,
+            "progress_hooks": [self._progress_hook],
+            "nocheckcertificate": True,
+            "ignoreerrors": True,
+        }
+        if os.path.exists(self.cookie_path) and os.path.getsize(self.cookie_path) > 0:
+            ydl_opts["cookiefile"] = self.cookie_path
+        return ydl_opts
+
+    def _ydl(self):
+        local = self._local
+        if getattr(local, "ydl", None) is None:
+            local.log = YtdlpLog()
+            local.on_progress = None
+            local.ydl = yt_dlp.YoutubeDL(self._options(local.log))
+            with self._lock:
+                self._instances.append(local.ydl)
+        local.log.errors = []
+        return local.ydl
+
+    def _progress_hook(self, d):
+        # Hook đăng ký 1 lần lúc tạo YoutubeDL -> chuyển tới callback của task hiện tại
+        on_progress = getattr(self._local, "on_progress", None)
+        if on_progress is not None:
+            on_progress(d)
+
+    @property
+    def errors(self):
+        """Error yt-dlp của lần gọi gần nhất trên thread hiện tại."""
+        log = getattr(self._local, "log", None)
+        return log.errors if log else []
+
+    # --- PREFETCH ---
+    def prefetch(self, video_url):
+        """Chỉ lấy metadata (không tải file). Trả về info dict hoặc None nếu lỗi."""
+        info = self._ydl().extract_info(video_url, download=False)
+        if not info:
+            print("⚠️ Không lấy được thông tin video.")
+            return None
+        return info
+
+    def check(self, info):
+        """Lý do bỏ video theo metadata, None nếu đạt."""
+        duration = info.get("duration") or 0
+        if self.max_duration_sec and duration > self.max_duration_sec:
+            return f"duration {duration:.0f}s > {self.max_duration_sec}s"
+        size = info.get("filesize") or info.get("filesize_approx") or 0
+        if self.max_filesize_mb and size > self.max_filesize_mb * 1024 * 1024:
+            return f"filesize {size / 1024 / 1024:.1f}MB > {self.max_filesize_mb}MB"
+        return None
+
+    # --- DOWNLOAD ---
+    def download(self, video_url, on_download_start=None, info=None):
+        """
+        Tải 1 video vào thư mục tạm riêng của task.
+
+        info: metadata từ prefetch() (không có -> tự prefetch). Video không đạt
+        check() -> raise VideoRejected.
+        Returns:
+            (video_id, final_path, raw_comments) hoặc (None, None, []) nếu lỗi
+        """
         print(f"🔍 [yt-dlp] Đang tải: {video_url}")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=True)
+        task_dir = None
+        progress = None
 
+        def progress_hook(d):
+            nonlocal progress
+            info = d.get("info_dict") or {}
+            if progress is None:
+                # Format merge (video+audio riêng) -> file cuối chỉ có sau khi merge, không stream
+                if d["status"] == "downloading" and "requested_formats" not in info:
+                    progress = DownloadProgress(d["filename"])
+                    on_download_start(
+                        info.get("id"), d.get("tmpfilename") or d["filename"], progress
+                    )
+            elif d["status"] == "finished":
+                progress.complete.set()
+            elif d["status"] == "error":
+                progress.failed.set()
+
+        try:
+            info = info or self.prefetch(video_url)
             if not info:
-                print(f"⚠️ Không lấy được thông tin video.")
                 return None, None, []
+            reason = self.check(info)
+            if reason:
+                raise VideoRejected(reason)
 
-            video_id = info.get("id")
-            ext = info.get("ext", "mp4")
+            ydl = self._ydl()
+            task_dir = tempfile.mkdtemp(prefix="task_", dir=self.temp_root)
+            ydl.params["paths"] = {"home": task_dir}
+            self._local.on_progress = progress_hook if on_download_start else None
+            # Dùng lại metadata của prefetch -> chỉ còn request tải file
+            result = ydl.process_ie_result(info, download=True)
 
-            # Lấy nội dung text
+            final_path = self._final_path(ydl, result or info)
+            if not final_path or os.path.getsize(final_path) <= 1000:
+                print("⚠️ File tải về lỗi.")
+                self.remove_task_dir(task_dir)
+                return None, None, []
+
+            video_id = info.get("id")
+            # Text: title + description, rỗng thì lấy ID làm text
             title = info.get("title", "") or ""
             desc = info.get("description", "") or ""
-
-            # Xử lý text: Nếu rỗng thì lấy ID làm text
             raw_text_data = f"{title} {desc}".strip()
             if not raw_text_data:
                 raw_text_data = f"tiktok video content {video_id}"
 
-            raw_comments = [raw_text_data]  # Trả về dạng list
-
-            # Kiểm tra file
-            expected_file = os.path.join(temp_dir, f"{video_id}.{ext}")
-            final_path = None
-
-            if os.path.exists(expected_file):
-                final_path = expected_file
-            else:
-                # Quét thư mục (Fallback)
-                for f in os.listdir(temp_dir):
-                    if f.endswith(".mp4"):
-                        f_path = os.path.join(temp_dir, f)
-                        if time.time() - os.path.getmtime(f_path) < 15:
-                            final_path = f_path
-                            video_id = f.replace(".mp4", "")
-                            break
-
-            if final_path and os.path.getsize(final_path) > 1000:
-                print(f"✅ Download OK: {os.path.basename(final_path)}")
-                return video_id, final_path, raw_comments
-            else:
-                print("⚠️ File tải về lỗi.")
-                return None, None, []
+            print(f"✅ Download OK: {os.path.basename(final_path)}")
+            return video_id, final_path, [raw_text_data]
+
+        except VideoRejected:
+            self.remove_task_dir(task_dir)
+            raise
+        except Exception as e:
+            print(f"❌ Download Exception: {e}")
+            self._local.log.errors.append(str(e))
+            self.remove_task_dir(task_dir)
+            return None, None, []
+        finally:
+            self._local.on_progress = None
+            if progress is not None and not progress.complete.is_set():
+                progress.failed.set()
+
+    @staticmethod
+    def _final_path(ydl, info):
+        """Path file cuối do yt-dlp báo (sau merge / rename), không đoán theo thư mục."""
+        for download in info.get("requested_downloads") or []:
+            path = download.get("filepath")
+            if path and os.path.exists(path):
+                return path
+        path = ydl.prepare_filename(info)
+        return path if path and os.path.exists(path) else None
+
+    def remove_task_dir(self, path):
+        """Xoá thư mục tạm của task (path = thư mục hoặc file trong đó).
+
+        Chỉ xoá thư mục con trực tiếp của temp_root.
+        """
+        if not path:
+            return
+        task_dir = path if os.path.isdir(path) else os.path.dirname(path)
+        if os.path.dirname(os.path.abspath(task_dir)) != os.path.abspath(self.temp_root):
+            return
+        shutil.rmtree(task_dir, ignore_errors=True)
 
-    except Exception as e:
-        print(f"❌ Download Exception: {e}")
-        return None, None, []
+    def close(self):
+        with self._lock:
+            instances, self._instances = self._instances, []
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception as e:
+                print(f"⚠️ Đóng YoutubeDL lỗi: {e}")
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_downloader():
+    """TikTokDownloader dùng chung của process (tạo lazy)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TikTokDownloader()
+        return _default
+
+
+def download_video_to_temp_mobile(video_url, on_download_start=None, controller=None, downloader=None):  # Giữ nguyên tên hàm cũ để tương thích
+    """
+    Tải video TikTok sử dụng yt-dlp với cấu hình Mobile (iPhone) để tránh bị chặn.
+
+    on_download_start(video_id, tmp_path, progress): gọi khi yt-dlp bắt đầu ghi file
+    (chỉ với format 1 file, không phải video+audio merge) để caller stream file
+    đang tải lên MinIO. `progress.complete`/`progress.failed` báo kết thúc,
+    `progress.filename` là path sau khi rename.
+
+    controller (AIMDController): chờ slot trước khi tải, báo kết quả (ok / lỗi /
+    bị chặn) sau khi tải để controller tự điều chỉnh số download song song.
+
+    Video bị lọc theo metadata -> raise VideoRejected (controller nhận OK).
+    File nằm trong thư mục tạm riêng của task: xoá bằng downloader.remove_task_dir(path).
+    """
+    downloader = downloader or get_downloader()
+    if controller is None:
+        return downloader.download(video_url, on_download_start)
+
+    controller.acquire()
+    outcome = None
+    try:
+        result = downloader.download(video_url, on_download_start)
+        outcome = OK if result[1] else classify_error(" ".join(downloader.errors))
+        return result
+    except VideoRejected:
+        outcome = OK  # request tới TikTok vẫn thành công
+        raise
+    finally:
+        controller.release(outcome or classify_error(" ".join(downloader.errors)))
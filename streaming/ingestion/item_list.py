@@ -0,0 +1,87 @@
+"""
+Đọc response API item_list của TikTok (danh sách video theo hashtag).
+
+ItemListCapture đọc request selenium-wire theo kiểu incremental:
+- driver.scopes chỉ giữ request item_list (không lưu ảnh / js / tracking của trang).
+- Cursor + id đã đọc: mỗi response chỉ parse 1 lần, thay vì duyệt lại toàn bộ
+  driver.requests và parse lại mọi body sau mỗi giây chờ.
+- Đọc xong hết thì xóa request đã capture (body không tích lũy suốt phiên).
+"""
+
+import json
+
+# Regex selenium-wire scopes (match theo URL)
+ITEM_LIST_SCOPES = [r".*/item_list.*"]
+BLOCKED_STATUS = (403, 429)
+
+
+def parse_item_list(data):
+    """
+    data: JSON (dict) của 1 response item_list
+    Returns:
+        list of dict {'link', 'desc', 'video_id'}
+    """
+    videos = []
+    for item in data.get("itemList") or []:
+        vid_id = item.get("id")
+        author_id = (item.get("author") or {}).get("uniqueId")
+        if vid_id and author_id:
+            videos.append(
+                {
+                    "link": f"https://www.tiktok.com/@{author_id}/video/{vid_id}",
+                    "desc": item.get("desc", ""),  # caption text
+                    "video_id": vid_id,
+                }
+            )
+    return videos
+
+
+class ItemListCapture:
+    def __init__(self, driver):
+        self.driver = driver
+        self.videos = {}  # link -> video, dedup khi thêm
+        self.blocked_status = None
+        self.responses = 0
+        self._cursor = 0  # mọi request trước cursor đã đọc
+        self._consumed = set()  # request.id đã đọc nằm sau cursor
+
+    def reset(self):
+        """Bắt đầu hashtag mới: bỏ request cũ và kết quả cũ."""
+        del self.driver.requests
+        self.videos = {}
+        self.blocked_status = None
+        self.responses = 0
+        self._cursor = 0
+        self._consumed.clear()
+
+    def _consume(self, request):
+        self.responses += 1
+        if request.response.status_code in BLOCKED_STATUS:
+            self.blocked_status = request.response.status_code
+            return
+        try:
+            data = json.loads(request.response.body.decode("utf-8"))
+        except Exception:
+            return
+        for video in parse_item_list(data):
+            self.videos.setdefault(video["link"], video)
+
+    def poll(self):
+        """Đọc response mới về từ lần poll trước. Returns: số video (đã dedup)."""
+        requests = self.driver.requests
+        for request in requests[self._cursor :]:
+            if request.id in self._consumed or request.response is None:
+                continue  # đã đọc / chưa có response
+            if "item_list" in request.url:
+                self._consume(request)
+            self._consumed.add(request.id)
+
+        while self._cursor < len(requests) and requests[self._cursor].id in self._consumed:
+            self._consumed.discard(requests[self._cursor].id)
+            self._cursor += 1
+
+        if requests and self._cursor == len(requests):
+            # Đã đọc hết -> xóa body khỏi storage của selenium-wire
+            del self.driver.requests
+            self._cursor = 0
+        return len(self.videos)
@@ -0,0 +1,184 @@
+"""
+Ledger (SQLite) ghi trạng thái xử lý của từng URL ingestion.
+
+    queued -> downloaded -> uploaded -> published
+         \\_______________________________/-> failed (retries += 1)
+         \\-> skipped (metadata không đạt bộ lọc duration / filesize, không retry)
+
+- Mỗi lần chạy chỉ xử lý URL mới hoặc còn retry được (failed, retries < max).
+- Worker crash giữa chừng: URL kẹt ở queued/downloaded được chạy lại từ đầu,
+  URL đã uploaded chỉ cần publish lại (MinIO path + text đã lưu trong ledger).
+- published chỉ được ghi khi Kafka broker ack message (delivery callback).
+- URL published không bao giờ bị tải / gửi Kafka lại.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+QUEUED = "queued"
+DOWNLOADED = "downloaded"
+UPLOADED = "uploaded"
+PUBLISHED = "published"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingestion_ledger (
+    url TEXT PRIMARY KEY,
+    label TEXT,
+    video_id TEXT,
+    state TEXT NOT NULL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    raw_comments TEXT,
+    minio_video_path TEXT,
+    minio_audio_path TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ingestion_ledger_state ON ingestion_ledger (state);
+CREATE INDEX IF NOT EXISTS idx_ingestion_ledger_video_id ON ingestion_ledger (video_id);
+"""
+
+ITEM_COLUMNS = (
+    "url, label, video_id, state, raw_comments, minio_video_path, minio_audio_path"
+)
+
+
+def _item(row):
+    url, label, video_id, state, raw_comments, video_path, audio_path = row
+    return {
+        "url": url,
+        "label": label,
+        "video_id": video_id,
+        "state": state,
+        "raw_comments": json.loads(raw_comments) if raw_comments else None,
+        "minio_video_path": video_path,
+        "minio_audio_path": audio_path,
+    }
+
+
+class IngestionLedger:
+    def __init__(self, path, max_retries=3):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cur
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def enqueue(self, rows):
+        """Thêm URL mới (url, label) với state=queued; URL đã có giữ nguyên. Trả về số URL mới."""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO ingestion_ledger (url, label, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((url, label, QUEUED, now, now) for url, label in rows),
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def pending(self):
+        """URL cần xử lý: chưa published / skipped và chưa hết lượt retry.
+
+        Returns:
+            list[dict]: theo thứ tự thêm vào; state cho biết resume từ bước nào
+        """
+        rows = self._query(
+            f"SELECT {ITEM_COLUMNS} FROM ingestion_ledger "
+            "WHERE state NOT IN (?, ?) AND NOT (state = ? AND retries >= ?) "
+            "ORDER BY created_at, url",
+            (PUBLISHED, SKIPPED, FAILED, self.max_retries),
+        )
+        return [_item(row) for row in rows]
+
+    def get(self, url):
+        """Trạng thái hiện tại của 1 URL (dict như pending() + retries), None nếu chưa có."""
+        rows = self._query(
+            f"SELECT {ITEM_COLUMNS}, retries FROM ingestion_ledger WHERE url = ?", (url,)
+        )
+        if not rows:
+            return None
+        item = _item(rows[0][:-1])
+        item["retries"] = rows[0][-1]
+        return item
+
+    def is_done(self, item):
+        """Không cần xử lý nữa: đã published / skipped hoặc hết lượt retry."""
+        return item["state"] in (PUBLISHED, SKIPPED) or (
+            item["state"] == FAILED and item["retries"] >= self.max_retries
+        )
+
+    def mark_downloaded(self, url, video_id, raw_comments):
+        self._execute(
+            "UPDATE ingestion_ledger SET state = ?, video_id = ?, raw_comments = ?, updated_at = ? "
+            "WHERE url = ?",
+            (DOWNLOADED, video_id, json.dumps(raw_comments, ensure_ascii=False), time.time(), url),
+        )
+
+    def mark_uploaded(self, url, minio_video_path, minio_audio_path):
+        self._execute(
+            "UPDATE ingestion_ledger SET state = ?, minio_video_path = ?, minio_audio_path = ?, "
+            "updated_at = ? WHERE url = ?",
+            (UPLOADED, minio_video_path, minio_audio_path, time.time(), url),
+        )
+
+    def mark_published(self, url):
+        self._execute(
+            "UPDATE ingestion_ledger SET state = ?, last_error = NULL, updated_at = ? WHERE url = ?",
+            (PUBLISHED, time.time(), url),
+        )
+
+    def mark_failed(self, url, error):
+        self._execute(
+            "UPDATE ingestion_ledger SET state = ?, retries = retries + 1, last_error = ?, "
+            "updated_at = ? WHERE url = ?",
+            (FAILED, str(error)[:500], time.time(), url),
+        )
+
+    def mark_skipped(self, url, reason):
+        self._execute(
+            "UPDATE ingestion_ledger SET state = ?, last_error = ?, updated_at = ? WHERE url = ?",
+            (SKIPPED, str(reason)[:500], time.time(), url),
+        )
+
+    # Kafka delivery callback chỉ biết video_id
+    def _urls_for_video(self, video_id):
+        return [url for (url,) in self._query(
+            "SELECT url FROM ingestion_ledger WHERE video_id = ?", (video_id,)
+        )]
+
+    def mark_published_video(self, video_id):
+        """Broker đã ack message của video -> published."""
+        for url in self._urls_for_video(video_id):
+            self.mark_published(url)
+
+    def mark_failed_video(self, video_id, error):
+        """Kafka delivery lỗi -> failed (giữ MinIO path, lần sau chỉ cần publish lại)."""
+        for url in self._urls_for_video(video_id):
+            self.mark_failed(url, error)
+
+    def stats(self):
+        return dict(self._query("SELECT state, COUNT(*) FROM ingestion_ledger GROUP BY state"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
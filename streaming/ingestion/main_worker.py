@@ -3,81 +3,438 @@ import os
 import time
 import config
 import argparse
-from concurrent.futures import ThreadPoolExecutor
-from clients.minio_kafka_clients import MinioClient, KafkaClient
-from clients.data_cleaner import clean_text_advanced
-from downloader import download_video_to_temp_mobile
-from audio_processor import extract_audio_single
-
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from clients.minio_kafka_clients import MinioClient, KafkaClient, GrowingFileReader
+from clients.data_cleaner import clean_batch
+from downloader import VideoRejected, download_video_to_temp_mobile, get_downloader
+from audio_processor import audio_content_type, audio_format, extract_media
+from crawl_store import CrawlStore
+from ledger import IngestionLedger
+from pipeline import Pipeline, Stage
+from concurrency import download_controller
+from url_queue import UrlQueueConsumer
+
+
+# --- CÁC BƯỚC XỬ LÝ (dùng chung cho chế độ tuần tự và pipeline) ---
+# Mỗi bước nhận/trả về 1 task dict; trả None = bỏ task.
+def download_step(task, minio=None, upload_pool=None, controller=None):
+    """A. Download video + text (yt-dlp)
+
+    Có minio + upload_pool: video được stream lên MinIO ngay trong lúc yt-dlp đang
+    tải (task["video_upload"] = future trả về MinIO path).
+    Có controller: số download song song / nhịp tải do AIMDController quyết định.
+    Video bị lọc theo metadata (quá dài / quá nặng) -> task["skip_reason"], bỏ task.
+    """
+    on_download_start = None
+    if minio is not None and upload_pool is not None:
+
+        def on_download_start(video_id, tmp_path, progress):
+            reader = GrowingFileReader(
+                tmp_path,
+                progress.complete.is_set,
+                progress.failed.is_set,
+                final_path=progress.filename,
+            )
+            task["video_upload"] = upload_pool.submit(
+                _stream_video_upload, minio, reader, f"raw/{task['label']}/{video_id}.mp4"
+            )
 
-def process_single_video(url, label, minio, kafka):
-    """Xử lý một video duy nhất: Download -> Audio -> MinIO -> Kafka"""
-    print(f"\n▶️ Processing: {url}")
+    try:
+        vid_id, video_local_path, raw_comments = download_video_to_temp_mobile(
+            task["url"], on_download_start=on_download_start, controller=controller
+        )
+    except VideoRejected as e:
+        print(f"   ⏭️ Skip: {e} ({task['url']})")
+        task["skip_reason"] = str(e)
+        return None
 
-    # A. Download
-    vid_id, video_local_path, raw_comments = download_video_to_temp_mobile(url)
     if not video_local_path:
-        print(f"   ⚠️ Skip: Download failed cho video {url}")
-        return
-
-    # B. Extract Audio
-    audio_local_path = os.path.join(config.TEMP_DOWNLOAD_DIR, f"{vid_id}.wav")
-    has_audio = extract_audio_single(video_local_path, audio_local_path)
-
-    if has_audio:
-        print(f"   🎵 Extracted Audio: {os.path.basename(audio_local_path)}")
+        print(f"   ⚠️ Skip: Download failed cho video {task['url']}")
+        _discard_streamed_video(task, minio)
+        return None
+    task.update(
+        video_id=vid_id,
+        video_path=video_local_path,
+        # Cùng thư mục tạm riêng của task (xoá cả thư mục ở cleanup_step)
+        audio_path=os.path.join(
+            os.path.dirname(video_local_path), f"{vid_id}{audio_format()[0]}"
+        ),
+        raw_comments=raw_comments,
+        has_audio=False,
+    )
+    return task
+
+
+def extract_step(task, pool=None):
+    """B. Extract media (1 lần ffmpeg): WAV + thumbnails + proxy clip - chạy trong process pool nếu có"""
+    work_dir = os.path.dirname(task["video_path"])
+    proxy_path = (
+        os.path.join(work_dir, f"{task['video_id']}_proxy.mp4")
+        if config.MEDIA_PROXY_ENABLED
+        else None
+    )
+    args = (task["video_path"], task["audio_path"], work_dir, proxy_path)
+    if pool is not None:
+        media = pool.submit(extract_media, *args).result()
+    else:
+        media = extract_media(*args)
+    task.update(
+        has_audio=media["audio"],
+        thumbnail_paths=media["thumbnails"],
+        proxy_path=media["proxy"],
+    )
+
+    if task["has_audio"]:
+        print(f"   🎵 Extracted Audio: {os.path.basename(task['audio_path'])}")
     else:
         print("   ⚠️ Audio extraction failed or empty.")
+    return task
+
 
+def _stream_video_upload(minio, reader, object_name):
     try:
-        # C. Upload Video & Audio lên MinIO
-        minio_video_obj = f"raw/{label}/{vid_id}.mp4"
-        minio_video_path = minio.upload_file(
-            video_local_path,
-            minio_video_obj,
+        return minio.upload_stream(
+            reader, object_name, bucket_name=config.MINIO_BUCKET, content_type="video/mp4"
+        )
+    finally:
+        reader.close()
+
+
+def _discard_streamed_video(task, minio):
+    """Download lỗi sau khi đã stream 1 phần/toàn bộ -> xoá object dở dang."""
+    future = task.pop("video_upload", None)
+    if future is None:
+        return
+    streamed_path = future.result()
+    if streamed_path:
+        bucket, object_name = streamed_path.split("/", 1)
+        minio.client.remove_object(bucket, object_name)
+
+
+def upload_step(task, minio):
+    """C. Upload Video & Audio lên MinIO"""
+    label, vid_id = task["label"], task["video_id"]
+    task["minio_video_path"] = None
+    if "video_upload" in task:
+        # Video đã được stream trong lúc download
+        task["minio_video_path"] = task.pop("video_upload").result()
+    if not task["minio_video_path"]:
+        task["minio_video_path"] = minio.upload_file(
+            task["video_path"],
+            f"raw/{label}/{vid_id}.mp4",
             bucket_name=config.MINIO_BUCKET,
             content_type="video/mp4",
         )
 
-        minio_audio_path = None
-        if has_audio:
-            minio_audio_obj = f"raw/{label}/{vid_id}.wav"
-            minio_audio_path = minio.upload_file(
-                audio_local_path,
-                minio_audio_obj,
-                bucket_name=config.MINIO_AUDIO_BUCKET,
-                content_type="audio/wav",
+    task["minio_audio_path"] = None
+    if task["has_audio"]:
+        ext = os.path.splitext(task["audio_path"])[1]
+        task["minio_audio_path"] = minio.upload_file(
+            task["audio_path"],
+            f"raw/{label}/{vid_id}{ext}",
+            bucket_name=config.MINIO_AUDIO_BUCKET,
+            content_type=audio_content_type(task["audio_path"]),
+        )
+
+    if not task["minio_video_path"]:
+        print("   ❌ Lỗi Upload Video MinIO.")
+        return None
+
+    # Preview cho dashboard (nhỏ hơn nhiều so với MP4 gốc)
+    task["minio_thumbnail_paths"] = [
+        path
+        for path in (
+            minio.upload_file(
+                thumb_path,
+                f"thumbs/{label}/{vid_id}_{i}.jpg",
+                bucket_name=config.MINIO_BUCKET,
+                content_type="image/jpeg",
             )
+            for i, thumb_path in enumerate(task.get("thumbnail_paths") or [], 1)
+        )
+        if path
+    ]
+    task["minio_proxy_path"] = None
+    if task.get("proxy_path"):
+        task["minio_proxy_path"] = minio.upload_file(
+            task["proxy_path"],
+            f"proxy/{label}/{vid_id}.mp4",
+            bucket_name=config.MINIO_BUCKET,
+            content_type="video/mp4",
+        )
+    return task
+
+
+def publish_step(task, kafka):
+    """D. Làm sạch text và gửi Kafka"""
+    clean_comments = clean_batch(task["raw_comments"])
+    full_text = " ".join(clean_comments)
+
+    message = {
+        "video_id": task["video_id"],
+        "minio_video_path": task["minio_video_path"],
+        "minio_audio_path": task["minio_audio_path"],
+        "minio_thumbnail_paths": task.get("minio_thumbnail_paths") or [],
+        "minio_proxy_path": task.get("minio_proxy_path"),
+        "clean_text": full_text,
+        "csv_label": task["label"],
+        "timestamp": time.time(),
+    }
+
+    kafka.send(message)
+    print(f"   📡 Queued to Kafka (Multi-modal): {task['video_id']}")
+    return task
+
+
+def cleanup_step(task):
+    """Cleanup file tạm sau khi đã đẩy lên MinIO"""
+    video_path = task.get("video_path")
+    if video_path and os.path.exists(video_path):
+        os.remove(video_path)
+    if task.get("has_audio") and os.path.exists(task["audio_path"]):
+        os.remove(task["audio_path"])
+    for path in (task.get("thumbnail_paths") or []) + [task.get("proxy_path")]:
+        if path and os.path.exists(path):
+            os.remove(path)
+    if video_path:
+        get_downloader().remove_task_dir(video_path)
 
-        if not minio_video_path:
-            print("   ❌ Lỗi Upload Video MinIO.")
-            return
 
-        # D. Làm sạch text và gửi Kafka
-        clean_comments = [clean_text_advanced(c) for c in raw_comments]
-        full_text = " ".join(clean_comments)
+def process_single_video(url, label, minio, kafka):
+    """Xử lý một video duy nhất: Download -> Audio -> MinIO -> Kafka"""
+    print(f"\n▶️ Processing: {url}")
+
+    task = download_step({"url": url, "label": label})
+    if task is None:
+        return
 
-        message = {
-            "video_id": vid_id,
-            "minio_video_path": minio_video_path,
-            "minio_audio_path": minio_audio_path,
-            "clean_text": full_text,
-            "csv_label": label,
-            "timestamp": time.time(),
-        }
+    extract_step(task)
 
-        kafka.send(message)
-        print(f"   📡 Sent to Kafka (Multi-modal): {vid_id}")
+    try:
+        if upload_step(task, minio) is not None:
+            publish_step(task, kafka)
 
     except Exception as e:
         print(f"   ❌ Lỗi xử lý pipeline: {e}")
 
     finally:
-        # Cleanup file tạm sau khi đã đẩy lên MinIO
-        if os.path.exists(video_local_path):
-            os.remove(video_local_path)
-        if has_audio and os.path.exists(audio_local_path):
-            os.remove(audio_local_path)
+        cleanup_step(task)
+
+
+def resume_uploaded(items, kafka):
+    """Ledger item đã upload MinIO (có path + text) -> chỉ cần publish lại, không tải lại.
+
+    Returns:
+        list: các item còn lại cần chạy full pipeline
+    """
+    remaining = []
+    for item in items:
+        if item["minio_video_path"] and item["raw_comments"] is not None:
+            publish_step(dict(item), kafka)
+        else:
+            remaining.append(item)
+    if len(remaining) < len(items):
+        print(f"♻️ Resume: publish lại {len(items) - len(remaining)} video đã upload")
+    return remaining
+
+
+def run_pipeline(
+    rows, minio, kafka, ledger=None, on_failed=None, on_publish=None, controller=None
+):
+    """Chạy CSV batch theo pipeline: download | extract | upload | publish.
+
+    extract: 1 lần ffmpeg / video sinh WAV + thumbnails + proxy clip (MEDIA_*),
+    upload cùng video ở stage upload.
+
+    Số download song song + nhịp tải do AIMDController điều chỉnh theo tín hiệu
+    block của TikTok (403/429/captcha) thay vì hằng số; ffmpeg chạy trong process
+    pool song song với download.
+    Có ledger: ghi trạng thái từng URL sau mỗi stage (published ghi khi Kafka ack).
+
+    rows: (url, label) hoặc task dict (consumer mode, kèm offset).
+    on_failed(task, error): task bị bỏ/lỗi (sau khi ledger đã ghi failed).
+    on_publish(task): ngay trước khi gửi Kafka (delivery callback có thể tới trước khi
+    stage publish trả về).
+    """
+    # spawn: tránh fork process khi các thread của pipeline đang chạy
+    pool = ProcessPoolExecutor(
+        max_workers=config.PIPELINE_EXTRACT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    controller = controller or download_controller()
+    # Stream upload video song song với download (MINIO_STREAM_UPLOAD)
+    stream_pool = (
+        ThreadPoolExecutor(max_workers=controller.max_limit)
+        if config.MINIO_STREAM_UPLOAD
+        else None
+    )
+
+    def upload(task):
+        try:
+            return upload_step(task, minio)
+        finally:
+            cleanup_step(task)  # file local không cần nữa sau khi upload
+
+    def on_error(task, error):
+        cleanup_step(task)
+        if ledger:
+            ledger.mark_failed(task["url"], error)
+        if on_failed:
+            on_failed(task, error)
+
+    def on_drop(reason):
+        def mark(task):
+            skip_reason = task.get("skip_reason")
+            if ledger:
+                if skip_reason:
+                    ledger.mark_skipped(task["url"], skip_reason)
+                else:
+                    ledger.mark_failed(task["url"], reason)
+            if on_failed:
+                on_failed(task, skip_reason or reason)
+
+        return mark
+
+    def on_downloaded(task):
+        if ledger:
+            ledger.mark_downloaded(task["url"], task["video_id"], task["raw_comments"])
+
+    def on_uploaded(task):
+        if ledger:
+            ledger.mark_uploaded(task["url"], task["minio_video_path"], task["minio_audio_path"])
+
+    def publish(task):
+        if on_publish:
+            on_publish(task)
+        return publish_step(task, kafka)
+
+    stages = [
+        Stage(
+            "download",
+            lambda task: download_step(task, minio, stream_pool, controller),
+            # Đủ thread cho limit tối đa; controller chặn bớt khi limit hiện tại thấp hơn
+            workers=controller.max_limit,
+            queue_size=config.PIPELINE_QUEUE_SIZE,
+            on_error=on_error,
+            on_drop=on_drop("download failed"),
+            on_done=on_downloaded,
+        ),
+        Stage(
+            "extract",
+            lambda task: extract_step(task, pool),
+            workers=config.PIPELINE_EXTRACT_WORKERS,
+            queue_size=config.PIPELINE_QUEUE_SIZE,
+            on_error=on_error,
+        ),
+        Stage(
+            "upload",
+            upload,
+            workers=config.PIPELINE_UPLOAD_WORKERS,
+            queue_size=config.PIPELINE_QUEUE_SIZE,
+            on_error=on_error,
+            on_drop=on_drop("upload failed"),
+            on_done=on_uploaded,
+        ),
+        Stage(
+            "publish",
+            publish,
+            workers=config.PIPELINE_PUBLISH_WORKERS,
+            queue_size=config.PIPELINE_QUEUE_SIZE,
+            on_error=on_error,
+        ),
+    ]
+    tasks = (
+        row if isinstance(row, dict) else {"url": row[0], "label": row[1]} for row in rows
+    )
+    try:
+        return Pipeline(stages, report_interval=config.PIPELINE_REPORT_INTERVAL).run(tasks)
+    finally:
+        pool.shutdown()
+        if stream_pool is not None:
+            stream_pool.shutdown()
+
+
+def run_consumer(minio, kafka, ledger, url_queue=None, requeue=None):
+    """Service chạy liên tục: consume URL topic theo consumer group.
+
+    Commit-after-publish: offset của URL chỉ được commit khi message tiktok_raw_data
+    của nó được broker ack, hoặc khi URL bị bỏ (lỗi -> gửi lại cuối URL topic nếu
+    ledger còn lượt retry). Chạy nhiều replica cùng KAFKA_URL_CONSUMER_GROUP để
+    song song theo partition.
+    """
+    url_queue = url_queue or UrlQueueConsumer()
+    requeue = requeue or KafkaClient(
+        topic=config.KAFKA_URL_TOPIC, partitions=config.KAFKA_URL_PARTITIONS
+    )
+    publishing = {}  # video_id -> [task] đang chờ broker ack
+    lock = threading.Lock()
+
+    def finish(task, error=None):
+        if error is not None:
+            item = ledger.get(task["url"])
+            if item and not ledger.is_done(item):
+                requeue.send(
+                    {"url": task["url"], "label": task["label"], "video_id": item["video_id"]}
+                )
+                print(f"   🔁 Requeue ({item['retries']}/{ledger.max_retries}): {task['url']}")
+        url_queue.done(task)
+
+    def on_publish(task):
+        with lock:
+            publishing.setdefault(task["video_id"], []).append(task)
+
+    def on_delivered(video_id):
+        ledger.mark_published_video(video_id)
+        with lock:
+            tasks = publishing.pop(video_id, [])
+        for task in tasks:
+            finish(task)
+
+    def on_delivery_failed(video_id, error):
+        ledger.mark_failed_video(video_id, error)
+        with lock:
+            tasks = publishing.pop(video_id, [])
+        for task in tasks:
+            finish(task, error)
+
+    kafka.on_delivered = on_delivered
+    kafka.on_failed = on_delivery_failed
+
+    def tasks():
+        for task in url_queue.tasks():
+            ledger.enqueue([(task["url"], task["label"])])
+            item = ledger.get(task["url"])
+            if ledger.is_done(item):
+                url_queue.done(task)  # URL trùng / hết retry
+                continue
+            if item["minio_video_path"] and item["raw_comments"] is not None:
+                # Đã upload ở lần trước -> chỉ publish lại
+                task.update(item, label=task["label"])
+                on_publish(task)
+                publish_step(task, kafka)
+                continue
+            yield task
+
+    def stop(signum, frame):
+        print("🛑 Nhận tín hiệu dừng: xử lý nốt URL đang chạy rồi commit...")
+        url_queue.stop()
+
+    previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+    print(f"👂 Consuming '{config.KAFKA_URL_TOPIC}' (group={config.KAFKA_URL_CONSUMER_GROUP})")
+    try:
+        return run_pipeline(
+            tasks(), minio, kafka, ledger, on_failed=finish, on_publish=on_publish
+        )
+    finally:
+        kafka.flush()  # delivery callback cuối -> finish() -> offset committable
+        requeue.close()
+        url_queue.close()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        print(f"📒 URL queue: committed {url_queue.committed} lần | ledger={ledger.stats()}")
 
 
 def run():
@@ -85,6 +442,11 @@ def run():
     parser = argparse.ArgumentParser(description="Ingestion Worker CLI")
     parser.add_argument("--url", help="URL video TikTok")
     parser.add_argument("--label", default="unknown", help="Nhãn video")
+    parser.add_argument(
+        "--consume",
+        action="store_true",
+        help="Chạy liên tục, nhận URL từ Kafka (KAFKA_URL_TOPIC) thay vì đọc CSV",
+    )
     args = parser.parse_args()
 
     try:
@@ -94,37 +456,52 @@ def run():
         print(f"❌ Kết nối Service thất bại: {e}")
         return
 
-    if args.url:
-        process_single_video(args.url, args.label, minio, kafka)
-    else:
+    ledger = None
+    try:
+        if args.url:
+            process_single_video(args.url, args.label, minio, kafka)
+        elif args.consume:
+            ledger = IngestionLedger(config.LEDGER_PATH, max_retries=config.LEDGER_MAX_RETRIES)
+            run_consumer(minio, kafka, ledger)
+        else:
+            # Chế độ chạy theo Batch: crawl store (đã dedup theo video_id), không có thì CSV
+            if os.path.exists(config.CRAWL_STORE_PATH):
+                store = CrawlStore(config.CRAWL_STORE_PATH)
+                queue = [(link, label) for link, label in store.links() if "/video/" in link]
+                store.close()
+            elif os.path.exists(config.INPUT_CSV_PATH):
+                df = pd.read_csv(config.INPUT_CSV_PATH)
+                df = df[df["link"].str.contains("/video/", na=False)]
+                queue = [(row["link"], row.get("label", "unknown")) for _, row in df.iterrows()]
+            else:
+                print(f"❌ CSV not found: {config.INPUT_CSV_PATH}")
+                return
+
+            # Ledger: chỉ xử lý URL mới / retry được, resume sau crash
+            ledger = IngestionLedger(config.LEDGER_PATH, max_retries=config.LEDGER_MAX_RETRIES)
+            kafka.on_delivered = ledger.mark_published_video
+            kafka.on_failed = ledger.mark_failed_video
+            new_count = ledger.enqueue(queue)
+            pending = ledger.pending()
+            print(
+                f"📋 Input: {len(queue)} videos ({new_count} mới) | ledger={ledger.stats()} "
+                f"-> processing {len(pending)}"
+            )
+            pending = resume_uploaded(pending, kafka)
 
-        if not os.path.exists(config.INPUT_CSV_PATH):
-            print(f"❌ CSV not found: {config.INPUT_CSV_PATH}")
-            return
-        # Chế độ chạy theo Batch CSV
-        df = pd.read_csv(config.INPUT_CSV_PATH)
-        queue = df[df["link"].str.contains("/video/", na=False)]
-        print(f"📋 Processing {len(queue)} videos from CSV...")
-
-        # for idx, row in queue.iterrows():
-        #     print(f"\n[{idx+1}/{len(queue)}] Đang xử lý hàng đợi...")
-        #     process_single_video(row["link"], row.get("label", "unknown"), minio, kafka)
-
-        #     # QUAN TRỌNG: Tăng thời gian nghỉ để tránh bị TikTok Captcha/Block
-        #     print("⏳ Nghỉ 5s để tránh bị chặn...")
-        #     time.sleep(5)
-
-        # CHIẾN THUẬT: Chạy song song 2 luồng.
-        # Đủ nhanh để Dashboard cập nhật liên tục, đủ chậm để không bị BAN.
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            for idx, row in queue.iterrows():
-                executor.submit(
-                    process_single_video,
-                    row["link"],
-                    row.get("label", "unknown"),
-                    minio,
-                    kafka,
-                )
+            # CHIẾN THUẬT: pipeline nhiều stage, download giới hạn tốc độ.
+            # Đủ nhanh để Dashboard cập nhật liên tục, đủ chậm để không bị BAN.
+            rows = ((item["url"], item["label"]) for item in pending)
+            run_pipeline(rows, minio, kafka, ledger)
+    finally:
+        get_downloader().close()
+        # Producer async: flush 1 lần duy nhất khi kết thúc
+        failed = kafka.close()
+        if failed:
+            print(f"❌ {len(failed)} message Kafka gửi lỗi: {[vid for vid, _ in failed]}")
+        if ledger:
+            print(f"📒 Ledger: {ledger.stats()}")
+            ledger.close()
 
 
 if __name__ == "__main__":
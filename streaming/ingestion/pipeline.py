@@ -0,0 +1,192 @@
+"""
+Pipeline ingestion nhiều stage nối bằng bounded queue.
+
+    [download] --q--> [extract] --q--> [upload] --q--> [publish]
+
+- Mỗi stage có số worker riêng; queue giới hạn kích thước nên stage chậm sẽ chặn
+  (backpressure) stage trước nó -> số file tạm trên đĩa luôn bị chặn trên.
+- Stage có thể đi qua RateLimiter (hoặc fn tự giới hạn, vd AIMDController cho
+  download): tăng worker ở stage khác không làm tăng số request tới TikTok.
+- Stage trả về None = bỏ task (vd: download fail), raise = task fail (gọi on_error).
+- on_drop(task) / on_error(task, error) / on_done(task) cho caller ghi trạng thái (ledger).
+- Reporter in queue depth + throughput từng stage định kỳ và khi kết thúc.
+"""
+
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class RateLimiter:
+    """Token bucket: tối đa `rate_per_min` lần acquire mỗi phút (burst tối đa `burst`)."""
+
+    def __init__(self, rate_per_min, burst=1):
+        self.interval = 60.0 / rate_per_min if rate_per_min > 0 else 0.0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) / self.interval
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
+
+class Stage:
+    """1 stage của pipeline: `fn(task) -> task | None` chạy trên `workers` thread."""
+
+    def __init__(
+        self,
+        name,
+        fn,
+        workers=1,
+        queue_size=8,
+        rate_limiter=None,
+        on_error=None,
+        on_drop=None,
+        on_done=None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.rate_limiter = rate_limiter
+        self.on_error = on_error
+        self.on_drop = on_drop
+        self.on_done = on_done
+        self.done = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy_sec = 0.0
+        self._lock = threading.Lock()
+
+    def stats(self, elapsed):
+        return {
+            "queue": self.inbox.qsize(),
+            "done": self.done,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "per_min": round(self.done / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            "busy_sec": round(self.busy_sec, 1),
+        }
+
+    def _record(self, field, busy):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            self.busy_sec += busy
+
+
+class Pipeline:
+    """Chạy list Stage nối tiếp nhau, feed task từ iterable vào stage đầu."""
+
+    def __init__(self, stages, report_interval=30):
+        self.stages = stages
+        self.report_interval = report_interval
+        self.started = None
+        self._finished = threading.Event()
+
+    def run(self, tasks):
+        self.started = time.time()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            remaining = [stage.workers]
+            for i in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(stage, next_stage, remaining),
+                    name=f"{stage.name}-{i}",
+                    daemon=True,
+                )
+                t.start()
+                threads.append(t)
+
+        reporter = threading.Thread(target=self._report_loop, daemon=True)
+        reporter.start()
+
+        first = self.stages[0]
+        for task in tasks:
+            first.inbox.put(task)  # block khi queue đầy (backpressure)
+        for _ in range(first.workers):
+            first.inbox.put(_STOP)
+
+        for t in threads:
+            t.join()
+        self._finished.set()
+        self.report(final=True)
+        return self.stats()
+
+    def _worker(self, stage, next_stage, remaining):
+        while True:
+            task = stage.inbox.get()
+            if task is _STOP:
+                break
+            if stage.rate_limiter:
+                stage.rate_limiter.acquire()
+            t0 = time.time()
+            try:
+                result = stage.fn(task)
+            except Exception as e:
+                print(f"   ❌ [{stage.name}] {e}")
+                stage._record("failed", time.time() - t0)
+                self._call_hook(stage, stage.on_error, task, e)
+                continue
+            if result is None:
+                stage._record("dropped", time.time() - t0)
+                self._call_hook(stage, stage.on_drop, task)
+                continue
+            stage._record("done", time.time() - t0)
+            self._call_hook(stage, stage.on_done, result)
+            if next_stage:
+                next_stage.inbox.put(result)
+
+        # Worker cuối cùng của stage thoát -> báo dừng cho stage sau
+        with stage._lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and next_stage:
+            for _ in range(next_stage.workers):
+                next_stage.inbox.put(_STOP)
+
+    @staticmethod
+    def _call_hook(stage, hook, *args):
+        """Hook lỗi (vd: SQLite 'database is locked') không được làm chết worker thread,
+        nếu không stage sau không bao giờ nhận _STOP và run() treo ở join()."""
+        if hook is None:
+            return
+        try:
+            hook(*args)
+        except Exception as e:
+            print(f"   ⚠️ [{stage.name}] hook {getattr(hook, '__name__', hook)} lỗi: {e}")
+
+    def stats(self):
+        elapsed = time.time() - self.started if self.started else 0.0
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
+
+    def report(self, final=False):
+        parts = [
+            f"{name}: q={s['queue']} done={s['done']} ({s['per_min']}/min)"
+            + (f" fail={s['failed']}" if s["failed"] else "")
+            + (f" skip={s['dropped']}" if s["dropped"] else "")
+            for name, s in self.stats().items()
+        ]
+        prefix = "🏁 Pipeline finished" if final else "📊 Pipeline"
+        print(f"{prefix} | " + " | ".join(parts), flush=True)
+
+    def _report_loop(self):
+        while not self._finished.wait(self.report_interval):
+            self.report()
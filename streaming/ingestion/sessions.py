@@ -0,0 +1,51 @@
+"""
+Browser session cho crawler: chia hashtag cho các shard và giữ sẵn session đã warm-up.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def shard(items, shards):
+    """Chia round-robin thành `shards` phần (giữ xen kẽ thứ tự gốc trong mỗi shard)."""
+    return [list(items[i::shards]) for i in range(shards)]
+
+
+class SessionPool:
+    """
+    Luôn giữ sẵn `spares` session đã khởi động (browser + cookies + warm-up) ở
+    background: đổi session (restart định kỳ, session lỗi) lấy ngay cái đã sẵn sàng
+    thay vì dừng crawl chờ browser mới.
+
+    factory(): trả về session mới, None nếu khởi động lỗi.
+    """
+
+    def __init__(self, factory, spares=1, close=None):
+        self.factory = factory
+        self.spares = max(0, spares)  # 0: không warm sẵn, get() khởi động tại chỗ
+        self._close = close or (lambda session: session.quit())
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-pool")
+        self._ready = deque(self._executor.submit(factory) for _ in range(self.spares))
+
+    def get(self):
+        """Session đã sẵn sàng (chờ nếu chưa xong), đồng thời khởi động session bù."""
+        if not self.spares:
+            return self.factory()
+        future = self._ready.popleft()
+        self._ready.append(self._executor.submit(self.factory))
+        return future.result()
+
+    def close(self):
+        for future in self._ready:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        for future in self._ready:
+            if future.cancelled():
+                continue
+            try:
+                session = future.result()
+            except Exception:
+                continue
+            if session is not None:
+                self._close(session)
+        self._ready.clear()
@@ -0,0 +1,182 @@
+"""
+URL work queue trên Kafka: crawler publish link, ingestion consume theo consumer group.
+
+    crawler --(key=video_id)--> [KAFKA_URL_TOPIC] --> main_worker --consume (N replicas)
+
+- Key = video_id: cùng 1 video luôn vào cùng partition -> cùng 1 replica.
+- Consumer group: thêm replica = thêm song song (tối đa = số partition).
+- enable_auto_commit=False, commit-after-publish: offset của 1 URL chỉ được coi là
+  xong khi message tiktok_raw_data được broker ack (hoặc URL bị bỏ / requeue).
+  OffsetTracker chỉ commit phần offset liên tiếp đã xong của từng partition,
+  nên crash giữa chừng -> URL chưa xong được consume lại (at-least-once,
+  ledger chặn xử lý lại URL đã published).
+- KafkaConsumer không thread-safe: poll/commit/pause chỉ chạy trên thread gọi tasks().
+"""
+
+import json
+import threading
+
+from kafka import KafkaConsumer, OffsetAndMetadata, TopicPartition
+
+import config
+
+
+class OffsetTracker:
+    """Theo dõi offset đang xử lý / đã xong của từng partition (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # (topic, partition) -> set(offset) chưa xong
+        self._done = {}  # (topic, partition) -> set(offset) đã xong nhưng chưa commit được
+        self._next = {}  # (topic, partition) -> offset nhỏ nhất chưa commit
+
+    def add(self, tp, offset):
+        with self._lock:
+            self._pending.setdefault(tp, set()).add(offset)
+            self._done.setdefault(tp, set())
+            if tp not in self._next:
+                self._next[tp] = offset
+
+    def done(self, tp, offset):
+        with self._lock:
+            pending = self._pending.get(tp)
+            if pending is None or offset not in pending:
+                return  # partition đã bị revoke
+            pending.discard(offset)
+            self._done[tp].add(offset)
+
+    def in_flight(self):
+        with self._lock:
+            return sum(len(p) for p in self._pending.values())
+
+    def committable(self):
+        """Offset kế tiếp cần commit của các partition có tiến triển: {tp: offset}."""
+        result = {}
+        with self._lock:
+            for tp, done in self._done.items():
+                start = offset = self._next[tp]
+                while offset in done:
+                    done.discard(offset)
+                    offset += 1
+                # Offset bị bỏ qua (compaction / transaction marker) không bao giờ tới
+                if not self._pending[tp] and done:
+                    offset = max(done) + 1
+                    done.clear()
+                if offset != start:
+                    self._next[tp] = offset
+                    result[tp] = offset
+        return result
+
+    def forget(self, tps):
+        """Partition bị revoke: bỏ theo dõi (replica mới sẽ consume lại phần chưa commit)."""
+        with self._lock:
+            for tp in tps:
+                self._pending.pop(tp, None)
+                self._done.pop(tp, None)
+                self._next.pop(tp, None)
+
+
+def _rebalance_listener(owner):
+    from kafka import ConsumerRebalanceListener
+
+    class _Listener(ConsumerRebalanceListener):
+        def on_partitions_revoked(self, revoked):
+            owner.on_revoked(revoked)
+
+        def on_partitions_assigned(self, assigned):
+            print(f"🔀 URL queue assigned: {sorted(tp.partition for tp in assigned)}")
+
+    return _Listener()
+
+
+class UrlQueueConsumer:
+    """Consume URL topic thành task dict cho Pipeline, commit sau khi task xong."""
+
+    def __init__(self, consumer=None, max_in_flight=None, poll_timeout_ms=1000):
+        self.max_in_flight = max_in_flight or config.URL_QUEUE_MAX_IN_FLIGHT
+        self.poll_timeout_ms = poll_timeout_ms
+        self.tracker = OffsetTracker()
+        self.committed = 0
+        self._stop = threading.Event()
+        self._paused = False
+        if consumer is None:
+            consumer = KafkaConsumer(
+                bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS,
+                group_id=config.KAFKA_URL_CONSUMER_GROUP,
+                enable_auto_commit=False,
+                auto_offset_reset="earliest",
+                key_deserializer=lambda k: k.decode("utf-8") if k else None,
+                value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+                max_poll_records=self.max_in_flight,
+                # Pipeline có thể chặn thread poll lâu (backpressure)
+                max_poll_interval_ms=config.URL_QUEUE_MAX_POLL_INTERVAL_MS,
+            )
+            consumer.subscribe([config.KAFKA_URL_TOPIC], listener=_rebalance_listener(self))
+        self.consumer = consumer
+
+    def tasks(self):
+        """Generator vô hạn (tới khi stop()) các task {"url", "label", "offset", ...}."""
+        while not self._stop.is_set():
+            self.commit()
+            self._throttle()
+            batches = self.consumer.poll(timeout_ms=self.poll_timeout_ms)
+            for records in batches.values():
+                for record in records:
+                    tp = (record.topic, record.partition)
+                    self.tracker.add(tp, record.offset)
+                    message = record.value or {}
+                    if not message.get("url"):
+                        print(f"⚠️ URL queue: bỏ message lỗi tại {tp}@{record.offset}")
+                        self.tracker.done(tp, record.offset)
+                        continue
+                    yield {
+                        "url": message["url"],
+                        "label": message.get("label", "unknown"),
+                        "offset": (tp, record.offset),
+                    }
+
+    def _throttle(self):
+        """Giữ số URL đang xử lý <= max_in_flight; pause vẫn giữ membership trong group."""
+        busy = self.tracker.in_flight() >= self.max_in_flight
+        if busy and not self._paused:
+            self.consumer.pause(*self.consumer.assignment())
+            self._paused = True
+        elif not busy and self._paused:
+            self.consumer.resume(*self.consumer.paused())
+            self._paused = False
+
+    def done(self, task):
+        """Task đã published / bị bỏ -> offset có thể commit."""
+        tp, offset = task["offset"]
+        self.tracker.done(tp, offset)
+
+    def commit(self):
+        offsets = self.tracker.committable()
+        if not offsets:
+            return
+        self.consumer.commit(
+            offsets={
+                TopicPartition(topic, partition): OffsetAndMetadata(offset, None)
+                for (topic, partition), offset in offsets.items()
+            }
+        )
+        self.committed += len(offsets)
+
+    def on_revoked(self, revoked):
+        # Chạy trong poll() (cùng thread) -> commit được phần đã xong trước khi mất partition
+        try:
+            self.commit()
+        except Exception as e:
+            print(f"⚠️ URL queue commit khi revoke lỗi: {e}")
+        self.tracker.forget((tp.topic, tp.partition) for tp in revoked)
+        print(f"🔀 URL queue revoked: {sorted(tp.partition for tp in revoked)}")
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        """Commit phần đã xong lần cuối rồi rời group."""
+        try:
+            self.commit()
+        finally:
+            self.consumer.close(autocommit=False)
@@ -0,0 +1,306 @@
+"""
+Local model artifact cache cho HF Hub models (content-addressed + manifest)
+
+Layout trong MODEL_CACHE_DIR:
+    blobs/<sha256>                          # nội dung file, mỗi nội dung lưu đúng 1 lần
+    snapshots/<org>--<name>/<commit>/<file> # symlink -> blobs/<sha256>, load bằng from_pretrained
+    manifest.json                           # repo -> revision (commit), file -> sha256/size
+
+- Repo đã có trong manifest -> trả snapshot local ngay, KHÔNG gọi network.
+- MODEL_CACHE_OFFLINE=true -> chỉ load từ cache, thiếu thì raise (không bao giờ chạm Hub).
+- Preflight (trước khi start container/job) populate + verify SHA256 toàn bộ file:
+    python model_cache.py preflight                # repos từ HF_MODEL_* env
+    python model_cache.py preflight org/model --revision v1 --refresh
+    python model_cache.py verify                   # hash lại mọi file trong manifest
+    python model_cache.py list
+"""
+
+import argparse
+import contextlib
+import fcntl
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+MODEL_CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR", "/tmp/.cache/huggingface/tiktok_model_cache"
+)
+MODEL_CACHE_OFFLINE = os.getenv("MODEL_CACHE_OFFLINE", "false").lower() == "true"
+# "size": lúc load chỉ check size (nhanh); "full": hash lại SHA256 mỗi lần load
+MODEL_CACHE_VERIFY = os.getenv("MODEL_CACHE_VERIFY", "size").lower()
+HF_TOKEN = os.getenv("HF_TOKEN", None)
+
+# Chỉ tải file cần cho inference (bỏ qua TF/Flax/ONNX weights, README, ảnh...)
+ALLOW_PATTERNS = [
+    "*.json",
+    "*.safetensors",
+    "*.bin",
+    "*.model",
+    "*.txt",
+    "*.tiktoken",
+]
+# Có safetensors thì không tải bản .bin trùng lặp
+BIN_FALLBACK_ONLY = "*.bin"
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class ModelCacheMiss(RuntimeError):
+    """Repo không có (hoặc hỏng) trong cache khi đang ở offline mode."""
+
+
+def is_hub_repo(path):
+    """Path local (thư mục tồn tại / path tuyệt đối) thì không đi qua cache."""
+    return bool(path) and not os.path.isabs(path) and not os.path.isdir(path)
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _repo_dir_name(repo_id):
+    return repo_id.replace("/", "--")
+
+
+def _manifest_key(repo_id, revision):
+    return f"{repo_id}@{revision}"
+
+
+class ModelCache:
+    """Cache model artifacts theo nội dung (SHA256), revision ghi trong manifest."""
+
+    def __init__(self, root=MODEL_CACHE_DIR, offline=MODEL_CACHE_OFFLINE, token=HF_TOKEN):
+        self.root = root
+        self.offline = offline
+        self.token = token
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        self.manifest_path = os.path.join(root, "manifest.json")
+
+    # --- MANIFEST ---
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"version": 1, "repos": {}}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".json.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Khóa liên process (driver + nhiều executor cùng populate 1 cache dir)."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- RESOLVE ---
+    def resolve(self, repo_id, revision="main"):
+        """Trả về thư mục snapshot local của repo (populate từ Hub nếu cần và được phép)."""
+        entry = self.load_manifest()["repos"].get(_manifest_key(repo_id, revision))
+        if entry and not self._check_entry(entry, full=MODEL_CACHE_VERIFY == "full"):
+            entry = None
+        if entry:
+            return entry["snapshot"]
+
+        if self.offline:
+            raise ModelCacheMiss(
+                f"{repo_id}@{revision} không có (hoặc hỏng) trong model cache {self.root} "
+                f"và MODEL_CACHE_OFFLINE=true. Chạy 'python model_cache.py preflight {repo_id}' trước."
+            )
+        with self._locked():
+            # Process khác (executor/driver) có thể vừa populate xong trong lúc chờ lock
+            entry = self.load_manifest()["repos"].get(_manifest_key(repo_id, revision))
+            if not entry or not self._check_entry(entry):
+                entry = self._populate(repo_id, revision)
+        return entry["snapshot"]
+
+    def _check_entry(self, entry, full=False):
+        """Snapshot còn đủ file, đúng size (và đúng SHA256 nếu full=True)?"""
+        for filename, meta in entry["files"].items():
+            path = os.path.join(entry["snapshot"], filename)
+            if not os.path.exists(path) or os.path.getsize(path) != meta["size"]:
+                print(f"⚠️ Model cache: {entry['repo_id']}/{filename} thiếu hoặc sai size")
+                return False
+            if full and sha256_file(path) != meta["sha256"]:
+                print(f"⚠️ Model cache: {entry['repo_id']}/{filename} sai SHA256")
+                return False
+        return True
+
+    # --- POPULATE ---
+    def populate(self, repo_id, revision="main"):
+        """Tải repo từ Hub vào blobs/ + snapshot, verify SHA256 với LFS metadata của Hub."""
+        with self._locked():
+            return self._populate(repo_id, revision)
+
+    def _populate(self, repo_id, revision):
+        from huggingface_hub import HfApi, hf_hub_download
+
+        info = HfApi().model_info(
+            repo_id, revision=revision, files_metadata=True, token=self.token
+        )
+        commit = info.sha
+        files = self._select_files(info.siblings)
+        if not files:
+            raise FileNotFoundError(f"{repo_id}@{revision}: không có file model nào để cache")
+
+        snapshot = os.path.join(self.snapshots_dir, _repo_dir_name(repo_id), commit)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+        entry_files = {}
+        try:
+            for sibling in files:
+                filename = sibling.rfilename
+                expected = sibling.lfs.sha256 if sibling.lfs else None
+                t0 = time.time()
+                downloaded = hf_hub_download(
+                    repo_id=repo_id,
+                    filename=filename,
+                    revision=commit,
+                    token=self.token,
+                    cache_dir=staging,
+                )
+                digest = self._store_blob(os.path.realpath(downloaded), expected)
+                self._link(snapshot, filename, digest)
+                entry_files[filename] = {
+                    "sha256": digest,
+                    "size": os.path.getsize(os.path.join(self.blobs_dir, digest)),
+                }
+                print(f"📥 Cached {repo_id}/{filename} ({time.time() - t0:.1f}s)")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        entry = {
+            "repo_id": repo_id,
+            "requested_revision": revision,
+            "revision": commit,
+            "snapshot": snapshot,
+            "files": entry_files,
+            "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        manifest = self.load_manifest()
+        manifest["repos"][_manifest_key(repo_id, revision)] = entry
+        self._save_manifest(manifest)
+        return entry
+
+    @staticmethod
+    def _select_files(siblings):
+        names = {s.rfilename for s in siblings}
+        has_safetensors = any(n.endswith(".safetensors") for n in names)
+        selected = []
+        for sibling in siblings:
+            name = sibling.rfilename
+            if "/" in name or not any(fnmatch.fnmatch(name, p) for p in ALLOW_PATTERNS):
+                continue
+            if has_safetensors and fnmatch.fnmatch(name, BIN_FALLBACK_ONLY):
+                continue
+            selected.append(sibling)
+        return selected
+
+    def _store_blob(self, src, expected_sha256=None):
+        digest = sha256_file(src)
+        if expected_sha256 and digest != expected_sha256:
+            raise ValueError(
+                f"SHA256 mismatch cho {src}: got {digest}, Hub says {expected_sha256}"
+            )
+        blob = os.path.join(self.blobs_dir, digest)
+        if not os.path.exists(blob):
+            shutil.move(src, blob + ".tmp")
+            os.replace(blob + ".tmp", blob)
+        return digest
+
+    def _link(self, snapshot, filename, digest):
+        os.makedirs(snapshot, exist_ok=True)
+        link = os.path.join(snapshot, filename)
+        target = os.path.relpath(os.path.join(self.blobs_dir, digest), snapshot)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(target, link)
+
+    # --- VERIFY ---
+    def verify(self):
+        """Hash lại toàn bộ file trong manifest. Trả về list repo key bị hỏng."""
+        broken = []
+        for key, entry in self.load_manifest()["repos"].items():
+            ok = self._check_entry(entry, full=True)
+            print(f"{'✅' if ok else '❌'} {key} -> {entry['revision']}")
+            if not ok:
+                broken.append(key)
+        return broken
+
+
+_DEFAULT_CACHE = None
+
+
+def get_model_cache():
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = ModelCache()
+    return _DEFAULT_CACHE
+
+
+def resolve_model_path(path, revision="main"):
+    """Path local -> giữ nguyên; repo HF Hub -> thư mục snapshot trong cache."""
+    if not is_hub_repo(path):
+        return path
+    return get_model_cache().resolve(path, revision)
+
+
+def default_repos():
+    """Repos streaming cần khi HF_MODEL_* được set (khớp spark_processor.get_*_model)."""
+    repos = [os.getenv("HF_MODEL_TEXT"), os.getenv("HF_MODEL_VIDEO")]
+    if os.getenv("HF_MODEL_FUSION"):
+        repos += [
+            os.getenv("HF_MODEL_FUSION"),
+            os.getenv("HF_MODEL_TEXT") or "uitnlp/CafeBERT",
+            os.getenv("HF_MODEL_VIDEO") or "MCG-NJU/videomae-base-finetuned-kinetics",
+        ]
+    return list(dict.fromkeys(r for r in repos if r))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Model artifact cache (HF Hub)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pre = sub.add_parser("preflight", help="Populate + verify cache cho các repo")
+    pre.add_argument("repos", nargs="*", help="Mặc định: lấy từ HF_MODEL_* env")
+    pre.add_argument("--revision", default="main")
+    pre.add_argument("--refresh", action="store_true", help="Luôn hỏi Hub revision mới nhất")
+    sub.add_parser("verify", help="Hash lại mọi file trong manifest")
+    sub.add_parser("list", help="In manifest")
+    args = parser.parse_args(argv)
+
+    cache = get_model_cache()
+    if args.command == "preflight":
+        repos = args.repos or default_repos()
+        if not repos:
+            print("⚠️ Không có repo nào (HF_MODEL_* chưa set) -> dùng local paths, bỏ qua")
+            return 0
+        for repo_id in repos:
+            if args.refresh and not cache.offline:
+                cache.populate(repo_id, args.revision)
+            cache.resolve(repo_id, args.revision)
+        return 1 if cache.verify() else 0
+    if args.command == "verify":
+        return 1 if cache.verify() else 0
+    print(json.dumps(cache.load_manifest(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,36 +1,131 @@
+import time
+
+_STARTUP_T0 = time.perf_counter()
+
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import from_json, col, udf, struct, when, lit
 from pyspark.sql.types import StructType, StructField, StringType, FloatType, DoubleType
 from pyspark import StorageLevel
-import boto3
 import os
+import contextlib
+import functools
+import gc
+import importlib
+import json
+import sys
 import tempfile
+import threading
 import torch
+import torch.nn as nn
 import numpy as np
-import scipy.io.wavfile as wavfile
-import re
-import psycopg2
-from psycopg2.extras import execute_values
+from collections import OrderedDict
 from datetime import datetime
 
+# --- LAZY IMPORTS ---
+# Mỗi Python worker Spark fork ra đều import lại module này. transformers model classes,
+# decord, safetensors, boto3, psycopg2 chỉ được import ở stage thật sự cần tới
+# (worker chỉ chạy text path sẽ không bao giờ import decord/VideoMAE).
+# torch/numpy vẫn import ngay: LateFusionModel kế thừa nn.Module lúc define class.
+IMPORT_TIMES = {
+    "eager (pyspark, torch, numpy)": round(time.perf_counter() - _STARTUP_T0, 3)
+}
+
+
+class _LazyImport:
+    """Proxy cho module (hoặc 1 attribute của module), import ở lần dùng đầu tiên.
+
+    Giữ nguyên tên ở module level (`boto3`, `VideoReader`, ...) nên code gọi và
+    `unittest.mock.patch("processing.spark_processor.boto3.client")` không đổi.
+    """
+
+    __slots__ = ("_module", "_attr", "_target")
+
+    def __init__(self, module, attr=None):
+        object.__setattr__(self, "_module", module)
+        object.__setattr__(self, "_attr", attr)
+        object.__setattr__(self, "_target", None)
+
+    def _resolve(self):
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            module_name = object.__getattribute__(self, "_module")
+            attr = object.__getattribute__(self, "_attr")
+            name = f"{module_name}.{attr}" if attr else module_name
+            t0 = time.perf_counter()
+            target = importlib.import_module(module_name)
+            if attr:
+                target = getattr(target, attr)
+            IMPORT_TIMES[name] = round(time.perf_counter() - t0, 3)
+            object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __reduce__(self):
+        # Gửi sang executor dưới dạng proxy chưa import
+        return (
+            _LazyImport,
+            (object.__getattribute__(self, "_module"), object.__getattribute__(self, "_attr")),
+        )
+
+    def __repr__(self):
+        return f"<lazy {object.__getattribute__(self, '_module')}>"
+
+
+boto3 = _LazyImport("boto3")
+psycopg2 = _LazyImport("psycopg2")
+execute_values = _LazyImport("psycopg2.extras", "execute_values")
+
 # --- HUGGING FACE IMPORTS ---
-from transformers import (
-    AutoImageProcessor,
-    VideoMAEForVideoClassification,
-    VideoMAEImageProcessor,
+AutoConfig = _LazyImport("transformers", "AutoConfig")
+AutoModel = _LazyImport("transformers", "AutoModel")
+AutoTokenizer = _LazyImport("transformers", "AutoTokenizer")
+AutoModelForSequenceClassification = _LazyImport(
+    "transformers", "AutoModelForSequenceClassification"
 )
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from transformers import AutoFeatureExtractor, AutoModelForAudioClassification
-from decord import VideoReader, cpu
-from safetensors.torch import load_file
-import torch.nn as nn
-from transformers import AutoModel
+AutoImageProcessor = _LazyImport("transformers", "AutoImageProcessor")
+VideoMAEForVideoClassification = _LazyImport(
+    "transformers", "VideoMAEForVideoClassification"
+)
+VideoMAEImageProcessor = _LazyImport("transformers", "VideoMAEImageProcessor")
+AutoFeatureExtractor = _LazyImport("transformers", "AutoFeatureExtractor")
+AutoModelForAudioClassification = _LazyImport(
+    "transformers", "AutoModelForAudioClassification"
+)
+VideoReader = _LazyImport("decord", "VideoReader")
+cpu = _LazyImport("decord", "cpu")
+load_file = _LazyImport("safetensors.torch", "load_file")
+
+# Decode audio WAV/FLAC/Opus dùng chung với training (train_eval_module/shared_utils,
+# mount tại /models trong container Spark)
+for _root in (
+    os.getenv("TRAIN_EVAL_MODULE_DIR", "/models"),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "train_eval_module"),
+):
+    if os.path.isdir(os.path.join(_root, "shared_utils")):
+        sys.path.append(os.path.abspath(_root))
+        break
+load_audio = _LazyImport("shared_utils.audio_io", "load_audio")
+
+# --- MODEL ARTIFACT CACHE (HF Hub -> local content-addressed cache) ---
+try:
+    from .model_cache import resolve_model_path
+except ImportError:
+    # Chạy trực tiếp bằng spark-submit (/app/processing trong sys.path)
+    from model_cache import resolve_model_path
 
 # --- MLFLOW AUTO-UPDATER ---
 try:
-    import sys
-    import sys
-
     sys.path.insert(0, "/app/mlflow")  # Mounted volume
     from model_updater import init_model_updater, get_model_updater
 
@@ -83,125 +178,6 @@ DAG_ID = "2_TIKTOK_STREAMING_PIPELINE"
 TASK_NAME = "spark_processor"
 
 
-# --- FUSION MODEL CLASS (Copy từ train_eval_module/fusion/src/model.py) ---
-class LateFusionModel(nn.Module):
-    """Late Fusion Model - Multimodal fusion for text + video."""
-
-    def __init__(self, config):
-        super().__init__()
-        text_path = config["text_model_path"]
-        video_path = config["video_model_path"]
-
-        # 1. Load Backbones
-        self.text_backbone = AutoModel.from_pretrained(text_path)
-        self.video_backbone = AutoModel.from_pretrained(video_path)
-
-        # Freeze all backbones
-        for p in self.text_backbone.parameters():
-            p.requires_grad = False
-        for p in self.video_backbone.parameters():
-            p.requires_grad = False
-
-        # 2. Fusion Strategy
-        self.fusion_type = config.get("fusion_type", "attention")
-        text_dim = config["text_feat_dim"]
-        video_dim = config["video_feat_dim"]
-        fusion_hidden = config["fusion_hidden"]
-
-        if self.fusion_type == "attention":
-            # Project to same dimension
-            self.text_proj = nn.Linear(text_dim, fusion_hidden)
-            self.video_proj = nn.Linear(video_dim, fusion_hidden)
-
-            # Cross-Attention
-            self.cross_attn_t2v = nn.MultiheadAttention(
-                embed_dim=fusion_hidden, num_heads=4, dropout=0.1, batch_first=True
-            )
-            self.cross_attn_v2t = nn.MultiheadAttention(
-                embed_dim=fusion_hidden, num_heads=4, dropout=0.1, batch_first=True
-            )
-
-            # Gating mechanism
-            self.gate = nn.Sequential(
-                nn.Linear(fusion_hidden * 2, fusion_hidden), nn.Sigmoid()
-            )
-
-            # Classifier
-            self.classifier = nn.Sequential(
-                nn.Linear(fusion_hidden, fusion_hidden // 2),
-                nn.LayerNorm(fusion_hidden // 2),
-                nn.ReLU(),
-                nn.Dropout(0.3),
-                nn.Linear(fusion_hidden // 2, 2),
-            )
-        else:
-            # Simple Concat Fusion
-            input_dim = text_dim + video_dim
-            self.classifier = nn.Sequential(
-                nn.Linear(input_dim, fusion_hidden),
-                nn.BatchNorm1d(fusion_hidden),
-                nn.ReLU(),
-                nn.Dropout(0.3),
-                nn.Linear(fusion_hidden, 2),
-            )
-
-        self.v_weight = config["video_weight"]
-        self.t_weight = config["text_weight"]
-        self.is_videomae = "videomae" in video_path.lower()
-
-    def forward(
-        self,
-        text_input_ids,
-        text_attention_mask,
-        video_pixel_values,
-        labels=None,
-        **kwargs,
-    ):
-        # A. Text Features
-        t_outputs = self.text_backbone(
-            input_ids=text_input_ids, attention_mask=text_attention_mask
-        )
-        t_feat = t_outputs.last_hidden_state[:, 0, :]  # CLS token
-
-        # B. Video Features
-        v_outputs = self.video_backbone(video_pixel_values)
-        if self.is_videomae:
-            v_feat = v_outputs.last_hidden_state.mean(dim=1)
-        else:
-            v_feat = v_outputs.last_hidden_state[:, 0, :]
-
-        # C. Fusion
-        if self.fusion_type == "attention":
-            t_proj = self.text_proj(t_feat).unsqueeze(1)
-            v_proj = self.video_proj(v_feat).unsqueeze(1)
-
-            t_attended, _ = self.cross_attn_t2v(t_proj, v_proj, v_proj)
-            v_attended, _ = self.cross_attn_v2t(v_proj, t_proj, t_proj)
-
-            t_attended = t_attended.squeeze(1)
-            v_attended = v_attended.squeeze(1)
-
-            t_weighted = t_attended * self.t_weight
-            v_weighted = v_attended * self.v_weight
-
-            concat_feat = torch.cat([t_weighted, v_weighted], dim=1)
-            gate = self.gate(concat_feat)
-            combined = gate * t_weighted + (1 - gate) * v_weighted
-        else:
-            combined = torch.cat(
-                (t_feat * self.t_weight, v_feat * self.v_weight), dim=1
-            )
-
-        # D. Classification
-        logits = self.classifier(combined)
-
-        if labels is not None:
-            loss_fct = nn.CrossEntropyLoss()
-            loss = loss_fct(logits.view(-1, 2), labels.view(-1))
-            return {"loss": loss, "logits": logits}
-        return {"logits": logits}
-
-
 def log_to_db(message, level="INFO"):
     """Ghi log ra stdout + ghi vào Postgres (bảng system_logs) để Dashboard hiển thị."""
     ts = datetime.utcnow().isoformat(timespec="seconds")
@@ -331,32 +307,33 @@ BLACKLIST_KEYWORDS = [
 ]
 
 # --- GLOBAL VARS ---
-text_tokenizer = None
-text_model = None
-video_processor = None
-video_model = None
-audio_extractor = None
-audio_model = None
 device = "cpu"
 
-# Fusion Model vars
-fusion_model = None
-fusion_text_tokenizer = None
-fusion_video_processor = None
+# RAM budget cho models trong 1 Python worker (MB). 0 = không giới hạn.
+# Vượt budget -> unload model ít dùng gần đây nhất (LRU) trước khi load model mới.
+MODEL_RAM_BUDGET_MB = int(os.getenv("MODEL_RAM_BUDGET_MB", "0"))
 
 
 # --- FUSION MODEL CLASS (Copy từ train_eval_module/fusion/src/model.py) ---
 class LateFusionModel(nn.Module):
     """Late Fusion Model - Multimodal fusion for text + video."""
 
-    def __init__(self, config):
+    def __init__(self, config, text_backbone=None, video_backbone=None):
         super().__init__()
         text_path = config["text_model_path"]
         video_path = config["video_model_path"]
 
-        # 1. Load Backbones
-        self.text_backbone = AutoModel.from_pretrained(text_path)
-        self.video_backbone = AutoModel.from_pretrained(video_path)
+        # 1. Load Backbones (hoặc dùng chung backbone đã load từ MODEL_REGISTRY)
+        self.text_backbone = (
+            text_backbone
+            if text_backbone is not None
+            else AutoModel.from_pretrained(text_path)
+        )
+        self.video_backbone = (
+            video_backbone
+            if video_backbone is not None
+            else AutoModel.from_pretrained(video_path)
+        )
 
         # Freeze all backbones
         for p in self.text_backbone.parameters():
@@ -464,161 +441,532 @@ class LateFusionModel(nn.Module):
         return {"logits": logits}
 
 
+# --- CHECKPOINT LOADING (meta device + mmap) ---
+@contextlib.contextmanager
+def init_empty_weights():
+    """Tạo nn.Parameter trên meta device (không cấp phát, không init weights).
+
+    Buffer vẫn tạo bình thường trên CPU (position_ids, sinusoid table...), vì chúng
+    không có trong checkpoint. Giống `accelerate.init_empty_weights(include_buffers=False)`.
+    """
+    old_register_parameter = nn.Module.register_parameter
+
+    def register_empty_parameter(module, name, param):
+        old_register_parameter(module, name, param)
+        if param is not None:
+            param_cls = type(module._parameters[name])
+            kwargs = module._parameters[name].__dict__
+            module._parameters[name] = param_cls(
+                module._parameters[name].to("meta"), **kwargs
+            )
+
+    nn.Module.register_parameter = register_empty_parameter
+    try:
+        yield
+    finally:
+        nn.Module.register_parameter = old_register_parameter
+
+
+def resolve_weights_file(model_dir):
+    """Tìm file weights trong thư mục checkpoint (local hoặc snapshot của model cache).
+
+    Ưu tiên model.safetensors (mmap được), fallback pytorch_model.bin.
+    """
+    for filename in ("model.safetensors", "pytorch_model.bin"):
+        candidate = os.path.join(model_dir, filename)
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"Model weights not found in {model_dir}")
+
+
+def load_weights_mmap(weights_file):
+    """Đọc state_dict dạng memory-mapped: tensor trỏ thẳng vào file, page chỉ được đọc khi dùng."""
+    if weights_file.endswith(".safetensors"):
+        return load_file(weights_file)
+    return torch.load(weights_file, map_location="cpu", mmap=True)
+
+
+def assert_materialized(model, name):
+    """Đảm bảo không còn parameter nào nằm trên meta device (checkpoint thiếu key)."""
+    missing = [n for n, p in model.named_parameters() if p.is_meta]
+    if missing:
+        raise KeyError(f"{name} checkpoint thiếu weights: {missing[:10]}")
+
+
+def _diverges(module, state_dict, prefix):
+    """True nếu weights `prefix.*` trong checkpoint khác weights của module đang dùng chung."""
+    own_state = module.state_dict()
+    for key, value in state_dict.items():
+        if not key.startswith(prefix):
+            continue
+        own = own_state.get(key[len(prefix) :])
+        if own is not None and not torch.equal(own, value.to(own.dtype)):
+            return True
+    return False
+
+
+# --- MODEL REGISTRY (backbone dùng chung giữa classifier và fusion) ---
+class ModelRegistry:
+    """Load mỗi backbone (CafeBERT, VideoMAE) đúng 1 lần cho mỗi path.
+
+    - Classifier load trước: fusion model dùng luôn `classifier.base_model`.
+    - Fusion load trước: backbone của fusion được đăng ký lại ở đây, classifier sau đó
+      chỉ dựng head (trên meta device) rồi đọc head weights từ checkpoint của nó.
+    Nhờ vậy chuyển qua lại FUSION / LATE_SCORE (hoặc fallback khi fusion load lỗi)
+    không bao giờ giữ 2 bản weights của cùng backbone.
+    """
+
+    LOADERS = {
+        "text": lambda path: AutoModelForSequenceClassification.from_pretrained(
+            path, token=HF_TOKEN
+        ),
+        "video": lambda path: VideoMAEForVideoClassification.from_pretrained(
+            path, token=HF_TOKEN
+        ),
+    }
+    FROM_CONFIG = {
+        "text": lambda config: AutoModelForSequenceClassification.from_config(config),
+        "video": lambda config: VideoMAEForVideoClassification(config),
+    }
+
+    def __init__(self):
+        self._classifiers = {}  # (kind, path) -> classifier model
+        self._backbones = {}  # (kind, path) -> backbone module (dùng chung)
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # UDF được cloudpickle (kèm globals) để gửi sang executor: lock không pickle được
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def classifier(self, kind, path):
+        """Classifier hoàn chỉnh (backbone + head) cho `kind` ("text"/"video")."""
+        key = (kind, path)
+        with self._lock:
+            if key not in self._classifiers:
+                model = None
+                if key in self._backbones:
+                    model = self._build_on_shared_backbone(kind, path)
+                if model is None:
+                    print(f"📦 Loading {kind} backbone: {path}")
+                    model = self.LOADERS[kind](path)
+                    self._backbones[key] = model.base_model
+                model.to(device)
+                model.eval()
+                self._classifiers[key] = model
+            return self._classifiers[key]
+
+    def _build_on_shared_backbone(self, kind, path):
+        """Dựng classifier trên backbone đã có; None nếu không dùng chung được."""
+        backbone = self._backbones[(kind, path)]
+        try:
+            config = AutoConfig.from_pretrained(path, token=HF_TOKEN)
+            with init_empty_weights():
+                model = self.FROM_CONFIG[kind](config)
+            prefix = model.base_model_prefix + "."
+            state_dict = load_weights_mmap(resolve_weights_file(path))
+            if _diverges(backbone, state_dict, prefix):
+                print(f"⚠️ {kind} checkpoint khác backbone dùng chung -> load bản riêng")
+                return None
+            setattr(model, model.base_model_prefix, backbone)
+            head_state = {k: v for k, v in state_dict.items() if not k.startswith(prefix)}
+            model.load_state_dict(head_state, strict=False, assign=True)
+            assert_materialized(model, f"{kind} classifier")
+            print(f"♻️ {kind} classifier dùng chung backbone đã load: {path}")
+            return model
+        except Exception as e:
+            print(f"⚠️ Không dựng được {kind} classifier trên backbone dùng chung: {e}")
+            return None
+
+    def backbone(self, kind, path):
+        """Backbone dùng chung (load qua classifier nếu chưa có)."""
+        with self._lock:
+            if (kind, path) not in self._backbones:
+                self.classifier(kind, path)
+            return self._backbones[(kind, path)]
+
+    def peek_backbone(self, kind, path):
+        """Backbone đã load (hoặc None) - không trigger load."""
+        return self._backbones.get((kind, path))
+
+    def register_backbone(self, kind, path, module):
+        with self._lock:
+            self._backbones.setdefault((kind, path), module)
+
+    def release(self, evicted, resident):
+        """Bỏ tham chiếu tới model bị unload.
+
+        Backbone chỉ được giữ lại nếu vẫn nằm trong 1 model còn resident (vd: text
+        classifier bị unload nhưng fusion vẫn dùng CafeBERT).
+        """
+        with self._lock:
+            evicted_ids = {id(m) for m in evicted}
+            for key, model in list(self._classifiers.items()):
+                if id(model) in evicted_ids:
+                    del self._classifiers[key]
+            alive = {id(sub) for model in resident for sub in model.modules()}
+            for key, module in list(self._backbones.items()):
+                if id(module) not in alive:
+                    del self._backbones[key]
+
+    def loaded(self):
+        return sorted(set(self._classifiers) | set(self._backbones))
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+
+def build_fusion_model(fusion_config, weights_file):
+    """Dựng LateFusionModel 1 lần duy nhất từ checkpoint fusion.
+
+    - Backbone đã có trong MODEL_REGISTRY -> dùng chung (chỉ so sánh, không copy).
+    - Backbone chưa có -> dựng từ config trên meta device, weights gán thẳng từ file
+      fusion đã mmap (`assign=True`), không đọc checkpoint backbone riêng lần nào nữa.
+    - Head (proj/attention/gate/classifier) cũng gán thẳng từ file fusion.
+    Nếu checkpoint fusion có backbone KHÁC backbone dùng chung thì backbone đó được dựng
+    riêng từ checkpoint fusion để không làm sai classifier đang dùng chung.
+    """
+    state_dict = load_weights_mmap(weights_file)
+    backbones = {}
+    for kind, prefix, path_key in (
+        ("text", "text_backbone.", "text_model_path"),
+        ("video", "video_backbone.", "video_model_path"),
+    ):
+        path = fusion_config[path_key]
+        shared = MODEL_REGISTRY.peek_backbone(kind, path)
+        if shared is not None and _diverges(shared, state_dict, prefix):
+            print(f"⚠️ Fusion checkpoint có {prefix[:-1]} khác backbone dùng chung -> load bản riêng")
+            shared = None
+        if shared is None:
+            with init_empty_weights():
+                shared = AutoModel.from_config(
+                    AutoConfig.from_pretrained(path, token=HF_TOKEN)
+                )
+        backbones[kind] = shared
+
+    with init_empty_weights():
+        model = LateFusionModel(
+            fusion_config,
+            text_backbone=backbones["text"],
+            video_backbone=backbones["video"],
+        )
+    shared_prefixes = tuple(
+        prefix
+        for kind, prefix in (("text", "text_backbone."), ("video", "video_backbone."))
+        if not any(p.is_meta for p in backbones[kind].parameters())
+    )
+    own_state = {k: v for k, v in state_dict.items() if not k.startswith(shared_prefixes)}
+    model.load_state_dict(own_state, strict=False, assign=True)
+    assert_materialized(model, "Fusion")
+
+    # Backbone vừa dựng từ checkpoint fusion -> đăng ký để classifier dùng chung về sau
+    MODEL_REGISTRY.register_backbone("text", fusion_config["text_model_path"], model.text_backbone)
+    MODEL_REGISTRY.register_backbone("video", fusion_config["video_model_path"], model.video_backbone)
+    return model
+
+
+def module_nbytes(modules):
+    """RAM của params + buffers, mỗi storage chỉ đếm 1 lần (backbone dùng chung)."""
+    seen = set()
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if tensor.is_meta:
+                continue
+            storage = tensor.untyped_storage()
+            if storage.data_ptr() in seen:
+                continue
+            seen.add(storage.data_ptr())
+            total += storage.nbytes()
+    return total
+
+
+def weights_nbytes(model_dir):
+    """Ước lượng RAM của model trước khi load = tổng size file weights."""
+    if not model_dir or not os.path.isdir(model_dir):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(model_dir, f))
+        for f in os.listdir(model_dir)
+        if f.endswith((".safetensors", ".bin")) and f != "training_args.bin"
+    )
+
+
+def estimate_nbytes(model_dir, shared=()):
+    """Ước lượng RAM cần thêm khi load model: size file weights trừ đi phần backbone
+    `shared` = [(kind, path)] đã resident trong MODEL_REGISTRY (sẽ được dùng chung,
+    không tốn thêm RAM)."""
+    held = [MODEL_REGISTRY.peek_backbone(kind, path) for kind, path in shared]
+    return max(0, weights_nbytes(model_dir) - module_nbytes([b for b in held if b is not None]))
+
+
+class ModelManager:
+    """Giữ các model đang resident trong worker theo RAM budget (LRU).
+
+    Mỗi model (text/video/audio/fusion) là 1 entry: bundle trả cho caller
+    (vd: (tokenizer, model)), size thực đo sau khi load, thời điểm dùng gần nhất.
+    Trước khi load model mới: unload model ít dùng gần đây nhất tới khi
+    (RAM đang dùng + size ước lượng) <= budget. Sau khi load đo lại size thật.
+    """
+
+    def __init__(self, registry, budget_mb=0, size_fn=module_nbytes):
+        self.registry = registry
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.size_fn = size_fn
+        self._models = OrderedDict()  # name -> entry, thứ tự LRU -> MRU
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def get(self, name, loader, estimate=None):
+        """Bundle của model `name`; load bằng `loader()` nếu chưa resident.
+
+        `estimate()` (bytes) chỉ được gọi khi cần load. Loader raise -> không cache.
+        """
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                self._models.move_to_end(name)
+                return entry["bundle"]
+
+            if self.budget_bytes:
+                self._make_room(estimate() if estimate else 0)
+            bundle = loader()
+            self._models[name] = {
+                "bundle": bundle,
+                "modules": [m for m in bundle if hasattr(m, "parameters")],
+                "last_used": time.time(),
+            }
+            if self.budget_bytes:
+                self._make_room(0, keep=name)
+            self.log_residency(f"loaded {name}")
+            return bundle
+
+    def resident_bytes(self):
+        return self.size_fn([m for e in self._models.values() for m in e["modules"]])
+
+    def _make_room(self, needed_bytes, keep=None):
+        while self._models and self.resident_bytes() + needed_bytes > self.budget_bytes:
+            victim = next((n for n in self._models if n != keep), None)
+            if victim is None:
+                break
+            self.evict(victim)
+        if self.resident_bytes() + needed_bytes > self.budget_bytes:
+            print(
+                f"⚠️ Model RAM vượt budget: {self.resident_bytes() / 2**20:.0f}MB "
+                f"+ {needed_bytes / 2**20:.0f}MB > {self.budget_bytes / 2**20:.0f}MB"
+            )
+
+    def evict(self, name):
+        with self._lock:
+            entry = self._models.pop(name, None)
+            if entry is None:
+                return
+            resident = [m for e in self._models.values() for m in e["modules"]]
+            self.registry.release(entry["modules"], resident)
+            entry.clear()
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            self.log_residency(f"evicted {name} (LRU)")
+
+    def residency(self):
+        """{name: {"mb", "idle_sec"}} + tổng RAM (backbone dùng chung đếm 1 lần)."""
+        now = time.time()
+        models = {
+            name: {
+                "mb": round(self.size_fn(entry["modules"]) / 2**20, 1),
+                "idle_sec": round(now - entry["last_used"], 1),
+            }
+            for name, entry in self._models.items()
+        }
+        return {
+            "models": models,
+            "total_mb": round(self.resident_bytes() / 2**20, 1),
+            "budget_mb": round(self.budget_bytes / 2**20, 1) or None,
+        }
+
+    def log_residency(self, event):
+        info = self.residency()
+        models = ", ".join(
+            f"{n}={m['mb']:.0f}MB/idle {m['idle_sec']:.0f}s" for n, m in info["models"].items()
+        )
+        budget = f"{info['budget_mb']:.0f}MB" if info["budget_mb"] else "unlimited"
+        print(
+            f"🧠 Models [{event}] pid={os.getpid()}: {models or '-'} | "
+            f"total={info['total_mb']:.0f}MB budget={budget}",
+            flush=True,
+        )
+
+
+MODEL_MANAGER = ModelManager(MODEL_REGISTRY, budget_mb=MODEL_RAM_BUDGET_MB)
+
+
 # --- LAZY LOADING FUNCTIONS ---
+MODEL_LOAD_TIMES = {}  # tên model -> giây load (không tính thời gian lazy import)
+
+
+def timed_model_load(name):
+    """Đo thời gian lần load đầu tiên của 1 model (cho --profile-startup / log)."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if name in MODEL_LOAD_TIMES:
+                return fn(*args, **kwargs)
+            import_before = sum(IMPORT_TIMES.values())
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            elapsed = time.perf_counter() - t0
+            imports = sum(IMPORT_TIMES.values()) - import_before
+            MODEL_LOAD_TIMES[name] = round(elapsed - imports, 3)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+@timed_model_load("text")
 def get_text_model():
-    global text_tokenizer, text_model
-    if text_model is None:
+    def load():
         print(f"📦 Loading Text Model...")
-        text_tokenizer = AutoTokenizer.from_pretrained(PATH_TEXT_MODEL)
-        text_model = AutoModelForSequenceClassification.from_pretrained(PATH_TEXT_MODEL)
-        text_model.to(device)
-        text_model.eval()
-    return text_tokenizer, text_model
+        path = resolve_model_path(PATH_TEXT_MODEL)
+        return AutoTokenizer.from_pretrained(path), MODEL_REGISTRY.classifier("text", path)
+
+    def estimate():
+        path = resolve_model_path(PATH_TEXT_MODEL)
+        return estimate_nbytes(path, shared=[("text", path)])
+
+    return MODEL_MANAGER.get("text", load, estimate)
 
 
+@timed_model_load("video")
 def get_video_model():
-    global video_processor, video_model
-    if video_model is None:
+    def load():
         print(f"📦 Loading Video Model...")
-        video_processor = AutoImageProcessor.from_pretrained(PATH_VIDEO_MODEL)
-        video_model = VideoMAEForVideoClassification.from_pretrained(PATH_VIDEO_MODEL)
-        video_model.to(device)
-        video_model.eval()
-    return video_processor, video_model
+        path = resolve_model_path(PATH_VIDEO_MODEL)
+        return AutoImageProcessor.from_pretrained(path), MODEL_REGISTRY.classifier("video", path)
 
+    def estimate():
+        path = resolve_model_path(PATH_VIDEO_MODEL)
+        return estimate_nbytes(path, shared=[("video", path)])
 
+    return MODEL_MANAGER.get("video", load, estimate)
+
+
+@timed_model_load("audio")
 def get_audio_model():
-    global audio_extractor, audio_model
-    if audio_model is None:
+    def load():
         print(f"📦 Loading Audio Model: {PATH_AUDIO_MODEL}")
         audio_extractor = AutoFeatureExtractor.from_pretrained(PATH_AUDIO_MODEL)
         audio_model = AutoModelForAudioClassification.from_pretrained(PATH_AUDIO_MODEL)
         audio_model.to(device)
         audio_model.eval()
-    return audio_extractor, audio_model
+        return audio_extractor, audio_model
 
+    return MODEL_MANAGER.get("audio", load, lambda: weights_nbytes(PATH_AUDIO_MODEL))
 
-def get_fusion_model():
-    """Load Fusion Model (text + video fusion) - Lazy loading.
 
-    Returns:
-        tuple: (model, tokenizer, processor) if successful, (None, None, None) if failed
-    """
-    global fusion_model, fusion_text_tokenizer, fusion_video_processor, FUSION_MODEL_AVAILABLE
+def fusion_backbone_paths():
+    """(text, video) backbone path của fusion model (HF Hub qua model cache / local)."""
+    if HF_MODEL_FUSION is not None:
+        return (
+            resolve_model_path(HF_MODEL_TEXT or "uitnlp/CafeBERT"),
+            resolve_model_path(HF_MODEL_VIDEO or "MCG-NJU/videomae-base-finetuned-kinetics"),
+        )
+    return PATH_FUSION_TEXT_BACKBONE, PATH_FUSION_VIDEO_BACKBONE
 
-    if fusion_model is not None:
-        return fusion_model, fusion_text_tokenizer, fusion_video_processor
 
-    try:
-        print(f"🔥 Loading Fusion Model from: {PATH_FUSION_MODEL}")
+def _load_fusion_model():
+    """Load Fusion Model (text + video fusion): (model, tokenizer, processor)."""
+    print(f"🔥 Loading Fusion Model from: {PATH_FUSION_MODEL}")
 
-        # 1. Determine if using HuggingFace Hub or local paths
-        is_hf_hub = HF_MODEL_FUSION is not None
+    # 1. Determine if using HuggingFace Hub or local paths
+    is_hf_hub = HF_MODEL_FUSION is not None
+    text_backbone_path, video_backbone_path = fusion_backbone_paths()
 
-        if is_hf_hub:
-            # Load tokenizer and processor from separate HF models
-            print(f"📦 Loading from HuggingFace Hub...")
-            print(f"   Text model: {HF_MODEL_TEXT}")
-            print(f"   Video model: {HF_MODEL_VIDEO}")
+    if is_hf_hub:
+        # Load tokenizer and processor from separate HF models
+        print(f"📦 Loading from HuggingFace Hub...")
+        print(f"   Text model: {HF_MODEL_TEXT}")
+        print(f"   Video model: {HF_MODEL_VIDEO}")
 
-            fusion_text_tokenizer = AutoTokenizer.from_pretrained(
-                HF_MODEL_TEXT if HF_MODEL_TEXT else "uitnlp/CafeBERT", token=HF_TOKEN
-            )
-            fusion_video_processor = VideoMAEImageProcessor.from_pretrained(
-                (
-                    HF_MODEL_VIDEO
-                    if HF_MODEL_VIDEO
-                    else "MCG-NJU/videomae-base-finetuned-kinetics"
-                ),
-                token=HF_TOKEN,
-            )
+        # For HF Hub, use the same HF paths for config (qua model cache local)
+        fusion_text_tokenizer = AutoTokenizer.from_pretrained(text_backbone_path)
+        fusion_video_processor = VideoMAEImageProcessor.from_pretrained(
+            video_backbone_path
+        )
+    else:
+        # Load from local paths
+        print(f"📂 Loading from local paths...")
+        fusion_text_tokenizer = AutoTokenizer.from_pretrained(
+            PATH_FUSION_TEXT_BACKBONE
+        )
+        fusion_video_processor = VideoMAEImageProcessor.from_pretrained(
+            PATH_FUSION_VIDEO_BACKBONE
+        )
 
-            # For HF Hub, use the same HF paths for config
-            text_backbone_path = HF_MODEL_TEXT or "uitnlp/CafeBERT"
-            video_backbone_path = (
-                HF_MODEL_VIDEO or "MCG-NJU/videomae-base-finetuned-kinetics"
-            )
-        else:
-            # Load from local paths
-            print(f"📂 Loading from local paths...")
-            fusion_text_tokenizer = AutoTokenizer.from_pretrained(
-                PATH_FUSION_TEXT_BACKBONE
-            )
-            fusion_video_processor = VideoMAEImageProcessor.from_pretrained(
-                PATH_FUSION_VIDEO_BACKBONE
-            )
+    # 2. Fusion model config (theo fusion_configs.py)
+    # IMPORTANT: Fusion model on HF Hub is now retrained with 1024-dim text backbone (CafeBERT)
+    fusion_config = {
+        "text_model_path": text_backbone_path,
+        "video_model_path": video_backbone_path,
+        "fusion_type": "attention",
+        "text_feat_dim": 1024,  # Updated to 1024 for KhoiBui/tiktok-text-safety-classifier (CafeBERT)
+        "video_feat_dim": 768,
+        "fusion_hidden": 256,
+        "video_weight": 0.5,
+        "text_weight": 0.5,
+    }
+
+    # 3 + 4. Dựng model + load weights trong 1 lượt (meta device + mmap checkpoint)
+    weights_file = resolve_weights_file(resolve_model_path(PATH_FUSION_MODEL))
+    print(f"📥 Loading weights from: {weights_file}")
+    fusion_model = build_fusion_model(fusion_config, weights_file)
+
+    fusion_model.to(device)
+    fusion_model.eval()
+    print("✅ Fusion Model loaded successfully!")
+    return fusion_model, fusion_text_tokenizer, fusion_video_processor
+
+
+def estimate_fusion_nbytes():
+    """Checkpoint fusion chứa cả 2 backbone: backbone text/video đã resident thì
+    được dùng chung -> chỉ tính phần còn lại (không evict text model vô ích)."""
+    text_path, video_path = fusion_backbone_paths()
+    return estimate_nbytes(
+        resolve_model_path(PATH_FUSION_MODEL),
+        shared=[("text", text_path), ("video", video_path)],
+    )
 
-            text_backbone_path = PATH_FUSION_TEXT_BACKBONE
-            video_backbone_path = PATH_FUSION_VIDEO_BACKBONE
-
-        # 2. Fusion model config (theo fusion_configs.py)
-        # IMPORTANT: Fusion model on HF Hub is now retrained with 1024-dim text backbone (CafeBERT)
-        fusion_config = {
-            "text_model_path": text_backbone_path,
-            "video_model_path": video_backbone_path,
-            "fusion_type": "attention",
-            "text_feat_dim": 1024,  # Updated to 1024 for KhoiBui/tiktok-text-safety-classifier (CafeBERT)
-            "video_feat_dim": 768,
-            "fusion_hidden": 256,
-            "video_weight": 0.5,
-            "text_weight": 0.5,
-        }
 
-        # 3. Initialize model architecture
-        fusion_model = LateFusionModel(fusion_config)
+@timed_model_load("fusion")
+def get_fusion_model():
+    """Load Fusion Model (text + video fusion) - Lazy loading.
 
-        # 4. Load weights from checkpoint
-        if is_hf_hub:
-            # For HuggingFace Hub, try to load from the repo
-            from huggingface_hub import hf_hub_download
+    Returns:
+        tuple: (model, tokenizer, processor) if successful, (None, None, None) if failed
+    """
+    global FUSION_MODEL_AVAILABLE
 
-            try:
-                safetensors_path = hf_hub_download(
-                    repo_id=PATH_FUSION_MODEL,
-                    filename="model.safetensors",
-                    token=HF_TOKEN,
-                )
-                print(f"📥 Loading weights from HF Hub: {safetensors_path}")
-                state_dict = load_file(safetensors_path)
-                fusion_model.load_state_dict(state_dict)
-            except Exception as e_safetensors:
-                try:
-                    pytorch_path = hf_hub_download(
-                        repo_id=PATH_FUSION_MODEL,
-                        filename="pytorch_model.bin",
-                        token=HF_TOKEN,
-                    )
-                    print(f"📥 Loading weights from HF Hub: {pytorch_path}")
-                    state_dict = torch.load(pytorch_path, map_location="cpu")
-                    fusion_model.load_state_dict(state_dict)
-                except Exception as e_pytorch:
-                    raise FileNotFoundError(
-                        f"Fusion model weights not found in HF Hub {PATH_FUSION_MODEL}. "
-                        f"Tried model.safetensors ({e_safetensors}) and pytorch_model.bin ({e_pytorch})"
-                    )
-        else:
-            # Local loading
-            safetensors_path = os.path.join(PATH_FUSION_MODEL, "model.safetensors")
-            if os.path.exists(safetensors_path):
-                print(f"📥 Loading weights from: {safetensors_path}")
-                state_dict = load_file(safetensors_path)
-                fusion_model.load_state_dict(state_dict)
-            else:
-                pytorch_path = os.path.join(PATH_FUSION_MODEL, "pytorch_model.bin")
-                if os.path.exists(pytorch_path):
-                    print(f"📥 Loading weights from: {pytorch_path}")
-                    state_dict = torch.load(pytorch_path, map_location="cpu")
-                    fusion_model.load_state_dict(state_dict)
-                else:
-                    raise FileNotFoundError(
-                        f"Fusion model weights not found in {PATH_FUSION_MODEL}"
-                    )
-
-        fusion_model.to(device)
-        fusion_model.eval()
+    try:
+        bundle = MODEL_MANAGER.get("fusion", _load_fusion_model, estimate_fusion_nbytes)
         FUSION_MODEL_AVAILABLE = True
-        print("✅ Fusion Model loaded successfully!")
-        return fusion_model, fusion_text_tokenizer, fusion_video_processor
+        return bundle
 
     except Exception as e:
         print(f"⚠️ Failed to load Fusion Model: {e}")
@@ -627,9 +975,6 @@ def get_fusion_model():
 
         traceback.print_exc()
         FUSION_MODEL_AVAILABLE = False
-        fusion_model = None
-        fusion_text_tokenizer = None
-        fusion_video_processor = None
         return None, None, None
 
 
@@ -712,8 +1057,33 @@ def process_text_logic(text):
 
 # --- UDF AUDIO ---
 def process_audio_logic(video_id, minio_audio_path):
-    # Trả về mặc định để tránh lỗi pipeline, sau này tích hợp model audio sau
-    return {"risk_score": 0.0, "verdict": "NoAudio", "status": "Skip"}
+    """Audio (WAV/FLAC/Opus) từ MinIO -> decode 16kHz trong RAM -> audio model."""
+    if not minio_audio_path:
+        return {"risk_score": 0.0, "verdict": "NoAudio", "status": "Skip"}
+    try:
+        s3 = boto3.client(
+            "s3",
+            endpoint_url=MINIO_ENDPOINT,
+            aws_access_key_id=MINIO_ACCESS_KEY,
+            aws_secret_access_key=MINIO_SECRET_KEY,
+        )
+        bucket, key = minio_audio_path.split("/", 1)
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        speech = load_audio(body, 16000)  # bytes -> decode, không cần file tạm
+
+        extractor, model = get_audio_model()
+        inputs = extractor(
+            speech.numpy(), sampling_rate=16000, return_tensors="pt"
+        ).to(device)
+        with torch.no_grad():
+            outputs = model(**inputs)
+            probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
+            score = probs[0][1].item()  # Class 1 = Harmful
+            verdict = "harmful" if score > 0.5 else "safe"
+
+        return {"risk_score": float(score), "verdict": str(verdict), "status": "Success"}
+    except Exception as e:
+        return {"risk_score": 0.0, "verdict": "Error", "status": str(e)}
 
 
 # --- UDF FUSION (TEXT + VIDEO FUSION MODEL) ---
@@ -952,6 +1322,10 @@ def main():
         .getOrCreate()
     )
     spark.sparkContext.setLogLevel("ERROR")  # Chỉ hiện lỗi thực sự
+    # UDF tham chiếu model_cache -> executor cần import được module này
+    spark.sparkContext.addPyFile(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache.py")
+    )
 
     # --- MLFLOW AUTO-UPDATER INITIALIZATION ---
     if MLFLOW_ENABLED:
@@ -1088,5 +1462,46 @@ def main():
     query.awaitTermination()
 
 
+# Thời gian import module (tính cả eager imports), trước khi load model nào
+MODULE_IMPORT_SEC = round(time.perf_counter() - _STARTUP_T0, 3)
+
+
+def profile_startup(models):
+    """Đo chi phí spin-up worker: import từng module + load từng model, in ra JSON."""
+    loaders = {
+        "text": get_text_model,
+        "video": get_video_model,
+        "audio": get_audio_model,
+        "fusion": get_fusion_model,
+    }
+    for name in models:
+        try:
+            loaders[name]()
+        except Exception as e:
+            print(f"❌ Load {name} model failed: {e}", file=sys.stderr)
+    report = {
+        "module_import_sec": MODULE_IMPORT_SEC,
+        "imports_sec": IMPORT_TIMES,
+        "model_load_sec": MODEL_LOAD_TIMES,
+        "residency": MODEL_MANAGER.residency(),
+        "total_sec": round(time.perf_counter() - _STARTUP_T0, 3),
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
 if __name__ == "__main__":
-    main()
+    if "--profile-startup" in sys.argv:
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Startup-time profile của spark_processor")
+        parser.add_argument("--profile-startup", action="store_true")
+        parser.add_argument(
+            "--models",
+            nargs="*",
+            default=["fusion", "text", "video"] if USE_FUSION_MODEL else ["text", "video"],
+            choices=["text", "video", "audio", "fusion"],
+        )
+        profile_startup(parser.parse_args().models)
+    else:
+        main()
@@ -13,6 +13,7 @@
 #   start     - Start PostgreSQL container
 #   connect   - Connect to PostgreSQL via psql
 #   logs      - View database logs
+#   migrate   - Apply infra/postgres/migrations/*.sql to an existing database
 #   reset     - Reset database (WARNING: deletes all data!)
 # ============================================================================
 
@@ -87,6 +88,18 @@ view_logs() {
         "SELECT timestamp, level, message FROM system_logs ORDER BY timestamp DESC LIMIT 20;"
 }
 
+migrate_db() {
+    print_header "MIGRATE DATABASE"
+    cd "$STREAMING_DIR"
+
+    # init.sql chỉ chạy khi volume mới; DB cũ cần chạy migration (idempotent)
+    for migration in infra/postgres/migrations/*.sql; do
+        echo "🔧 Applying $migration..."
+        docker exec -i postgres psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB" < "$migration"
+    done
+    echo -e "${GREEN}✅ Migrations applied.${NC}"
+}
+
 reset_db() {
     print_header "RESET DATABASE"
     echo -e "${RED}⚠️  WARNING: This will delete ALL data in tables!${NC}"
@@ -110,6 +123,7 @@ show_help() {
     echo "  start     Start PostgreSQL container"
     echo "  connect   Connect to PostgreSQL via psql"
     echo "  logs      View recent system logs"
+    echo "  migrate   Apply schema migrations (infra/postgres/migrations)"
     echo "  reset     Reset database (WARNING: deletes data!)"
     echo ""
     echo "Tables:"
@@ -131,6 +145,9 @@ case "${1:-test}" in
     logs)
         view_logs
         ;;
+    migrate)
+        migrate_db
+        ;;
     reset)
         reset_db
         ;;
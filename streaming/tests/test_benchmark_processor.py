@@ -0,0 +1,66 @@
+import sqlite3
+import pytest
+from processing import benchmark_processor as bench
+
+
+def _row(video_id, decision="safe"):
+    return {
+        "video_id": video_id, "raw_text": "text", "human_label": "safe",
+        "text_verdict": "safe", "text_score": 0.1,
+        "video_verdict": "safe", "video_score": 0.2,
+        "avg_score": 0.15, "threshold": 0.5, "final_decision": decision,
+    }
+
+
+def test_summarize_latencies_percentiles():
+    """Percentiles nearest-rank, đơn vị ms"""
+    stats = bench.summarize_latencies([i / 1000.0 for i in range(1, 101)])
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == 50.0
+    assert stats["p99_ms"] == 99.0
+    assert stats["max_ms"] == 100.0
+    assert bench.summarize_latencies([]) == {"count": 0}
+
+
+def test_local_object_store_download(tmp_path):
+    """LocalObjectStore thay boto3: bucket/key -> file local"""
+    src = tmp_path / "minio" / "bucket" / "raw" / "a.mp4"
+    src.parent.mkdir(parents=True)
+    src.write_bytes(b"video-bytes")
+    store = bench.LocalObjectStore(str(tmp_path / "minio"))
+
+    dest = tmp_path / "out.mp4"
+    store.client("s3", endpoint_url="ignored").download_file("bucket", "raw/a.mp4", str(dest))
+    assert dest.read_bytes() == b"video-bytes"
+
+
+def test_write_to_postgres_against_sqlite_stand_in(tmp_path, monkeypatch):
+    """write_to_postgres thật chạy trên SQLite stand-in: UPSERT + dedup theo video_id"""
+    db_path = str(tmp_path / "bench.sqlite")
+    store = bench.LocalObjectStore(str(tmp_path))
+    # monkeypatch: test sau dùng spark_processor không thừa hưởng stand-in (db đã bị xóa)
+    for name, value in bench.stand_ins(store, db="sqlite", db_path=db_path).items():
+        monkeypatch.setattr(bench.sp, name, value)
+
+    bench.sp.write_to_postgres(bench.ReplayBatch([_row("v1"), _row("v2")]), 0)
+    # Batch sau ghi đè v1 (ON CONFLICT DO UPDATE)
+    bench.sp.write_to_postgres(bench.ReplayBatch([_row("v1", "harmful")]), 1)
+
+    conn = sqlite3.connect(db_path)
+    rows = dict(conn.execute("SELECT video_id, final_decision FROM processed_results").fetchall())
+    logs = conn.execute("SELECT COUNT(*) FROM system_logs").fetchone()[0]
+    conn.close()
+
+    assert rows == {"v1": "harmful", "v2": "safe"}
+    assert logs > 0
+
+
+def test_install_stand_ins_restore(tmp_path):
+    """install_stand_ins trả về restore(): module spark_processor về lại như cũ"""
+    originals = (bench.sp.boto3, bench.sp.psycopg2, bench.sp.execute_values)
+    restore = bench.install_stand_ins(
+        bench.LocalObjectStore(str(tmp_path)), db="sqlite", db_path=str(tmp_path / "b.sqlite")
+    )
+    assert bench.sp.execute_values is bench.sqlite_execute_values
+    restore()
+    assert (bench.sp.boto3, bench.sp.psycopg2, bench.sp.execute_values) == originals
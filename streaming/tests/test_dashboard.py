@@ -262,6 +262,119 @@ class TestDatabaseSchema:
         assert "video_predictions" in content or "processed_results" in content, \
             "Should reference prediction table"
 
+    def test_db_engine_is_pooled(self):
+        """Test helpers.py reuses one pooled engine per process"""
+        helpers_path = os.path.join(os.path.dirname(__file__), "../dashboard/helpers.py")
+        with open(helpers_path, "r") as f:
+            content = f.read()
+
+        assert "@st.cache_resource\ndef get_db_engine" in content, "Engine should be cached per process"
+        assert "pool_pre_ping=True" in content, "Pool should drop dead connections"
+        assert "statement_timeout" in content, "Queries should have a statement timeout"
+
+    def test_gallery_uses_keyset_pagination(self):
+        """Test gallery pages seek on (processed_at, video_id) instead of OFFSET"""
+        helpers_path = os.path.join(os.path.dirname(__file__), "../dashboard/helpers.py")
+        with open(helpers_path, "r") as f:
+            content = f.read()
+        init_sql_path = os.path.join(os.path.dirname(__file__), "../infra/postgres/init.sql")
+        with open(init_sql_path, "r") as f:
+            init_sql = f.read()
+
+        assert "(processed_at, video_id) < (:cursor_ts, :cursor_id)" in content, "Should seek by cursor"
+        assert "OFFSET" not in content, "Should not page with OFFSET"
+        assert "{_category_sql()} = :category" in content, "Should filter on the category column"
+        assert "(category, processed_at DESC, video_id DESC)" in init_sql, "Should index category + keyset"
+        # Migration chạy ngoài Dashboard (ALTER TABLE khóa cả bảng)
+        assert "ALTER TABLE" not in content, "Dashboard should not run schema migrations"
+        migration_path = os.path.join(
+            os.path.dirname(__file__), "../infra/postgres/migrations/001_processed_results_category.sql"
+        )
+        assert os.path.exists(migration_path), "Existing databases need a migration script"
+
+
+# ============================================================================
+# TEST: Incremental processed_results loader (get_data)
+# ============================================================================
+
+class TestResultsCache:
+    """Drive ResultsCache against a SQLite processed_results table"""
+
+    @pytest.fixture
+    def db(self, tmp_path):
+        sqlalchemy = pytest.importorskip("sqlalchemy")
+        engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'results.db'}")
+        statements = []
+
+        @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+        def _capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE processed_results (video_id TEXT PRIMARY KEY, raw_text TEXT, "
+                "human_label TEXT, text_verdict TEXT, video_verdict TEXT, text_score REAL, "
+                "video_score REAL, avg_score REAL, final_decision TEXT, processed_at TEXT)"
+            )
+
+        def write(video_id, processed_at, decision="safe"):
+            with engine.begin() as conn:
+                conn.exec_driver_sql(
+                    "INSERT INTO processed_results VALUES (?, 'text', 'safe', '', '', 0.1, 0.2, 0.3, ?, ?) "
+                    "ON CONFLICT (video_id) DO UPDATE SET final_decision = excluded.final_decision, "
+                    "processed_at = excluded.processed_at",
+                    (video_id, decision, f"2026-01-01 {processed_at}"),
+                )
+
+        return engine, write, statements
+
+    def _cache(self, limit=5):
+        from results_cache import ResultsCache
+
+        # min_interval 0: mỗi get() đều đọc DB
+        return ResultsCache(limit, overlap_sec=30, min_interval_sec=0, full_reload_interval_sec=3600)
+
+    def test_delta_merge_overlap_and_reset(self, db):
+        engine, write, statements = db
+        for video_id, ts in [("a", "10:00:00"), ("b", "09:00:00"), ("c", "08:00:00"), ("z", "07:00:00")]:
+            write(video_id, ts)
+        cache = self._cache(limit=5)
+
+        df = cache.get(engine)
+        assert list(df["video_id"]) == ["a", "b", "c", "z"]
+        assert "WHERE" not in statements[-1]  # lần đầu: đọc toàn bộ
+        assert cache.watermark == df["processed_at"].max()
+
+        write("b", "10:05:00", " Harmful ")  # Spark upsert cập nhật dòng cũ
+        write("e", "09:59:45")  # commit trễ, nằm trong overlap 30s
+        write("x", "09:58:00")  # ngoài overlap -> delta không đọc
+
+        df = cache.get(engine)
+        assert "processed_at >=" in statements[-1]
+        assert list(df["video_id"]) == ["b", "a", "e", "c", "z"]
+        b = df[df["video_id"] == "b"].iloc[0]
+        assert b["final_decision"] == "harmful" and b["Category"] == "Harmful"
+        assert df["video_id"].is_unique
+
+        cache.reset()
+        df = cache.get(engine)
+        assert "WHERE" not in statements[-1]
+        # Đọc lại toàn bộ: thấy x, vẫn giữ giới hạn limit
+        assert list(df["video_id"]) == ["b", "a", "e", "x", "c"]
+
+    def test_limit_is_kept_after_delta(self, db):
+        engine, write, _ = db
+        write("a", "10:00:00")
+        write("b", "09:00:00")
+        cache = self._cache(limit=2)
+        cache.get(engine)
+
+        write("c", "10:01:00")
+        write("d", "10:02:00")
+        df = cache.get(engine)
+        assert list(df["video_id"]) == ["d", "c"]
+        assert set(df["Category"]) == {"Safe"}
+
 
 # ============================================================================
 # RUN TESTS
@@ -1,11 +1,12 @@
 import pytest
 from unittest.mock import patch, MagicMock
 import os
+import time
 from ingestion.main_worker import process_single_video
 import ingestion.config as config
 
 @patch("ingestion.main_worker.download_video_to_temp_mobile")
-@patch("ingestion.main_worker.extract_audio_single")
+@patch("ingestion.main_worker.extract_media")
 @patch("os.path.exists")
 @patch("os.remove")
 def test_process_single_video_success(
@@ -15,7 +16,7 @@ def test_process_single_video_success(
     
     # Setup Mocks
     mock_download.return_value = ("video123", "/tmp/video123.mp4", ["comment1", "comment2"])
-    mock_extract_audio.return_value = True
+    mock_extract_audio.return_value = {"audio": True, "thumbnails": [], "proxy": None}
     mock_exists.return_value = True
     
     # Run function
@@ -23,7 +24,9 @@ def test_process_single_video_success(
     
     # Assertions
     # 1. Check Download called
-    mock_download.assert_called_once_with("http://tiktok.com/video123")
+    mock_download.assert_called_once_with(
+        "http://tiktok.com/video123", on_download_start=None, controller=None
+    )
     
     # 2. Check Extraction called
     mock_extract_audio.assert_called_once()
@@ -59,3 +62,906 @@ def test_process_single_video_download_fail(mock_download, mock_minio_client, mo
     mock_download.assert_called_once()
     mock_minio_client.upload_file.assert_not_called()
     mock_kafka_client.send.assert_not_called()
+
+
+# --- TEST PIPELINE (stages + bounded queues) ---
+def test_pipeline_stages_drop_fail_and_report():
+    """Task đi qua các stage; None = bỏ, exception = fail + on_error"""
+    from ingestion.pipeline import Pipeline, Stage
+
+    published, cleaned = [], []
+
+    def download(task):
+        return None if task == 2 else task
+
+    def extract(task):
+        if task == 3:
+            raise RuntimeError("ffmpeg crashed")
+        return task * 10
+
+    stages = [
+        Stage("download", download, workers=2, queue_size=1),
+        Stage("extract", extract, workers=2, queue_size=1, on_error=lambda task, e: cleaned.append(task)),
+        Stage("publish", lambda t: published.append(t) or t, workers=1, queue_size=1),
+    ]
+    stats = Pipeline(stages, report_interval=60).run(iter(range(1, 7)))
+
+    assert sorted(published) == [10, 40, 50, 60]
+    assert cleaned == [3]
+    assert stats["download"]["done"] == 5 and stats["download"]["dropped"] == 1
+    assert stats["extract"]["failed"] == 1
+    assert all(s["queue"] == 0 for s in stats.values())
+
+
+def test_pipeline_survives_failing_hooks():
+    """Hook raise (vd: SQLite locked) không làm treo pipeline, task vẫn đi tiếp"""
+    from ingestion.pipeline import Pipeline, Stage
+
+    def broken_hook(*args):
+        raise RuntimeError("database is locked")
+
+    published = []
+    stages = [
+        Stage("download", lambda t: None if t == 1 else t, on_done=broken_hook, on_drop=broken_hook),
+        Stage("publish", lambda t: published.append(t) or t),
+    ]
+    stats = Pipeline(stages, report_interval=60).run(iter(range(4)))
+
+    assert sorted(published) == [0, 2, 3]
+    assert stats["publish"]["done"] == 3
+
+
+def test_rate_limiter_spaces_out_requests():
+    """RateLimiter giới hạn số lần acquire mỗi phút"""
+    from ingestion.pipeline import RateLimiter
+    import time
+
+    limiter = RateLimiter(rate_per_min=1200)  # 1 token / 50ms
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.14
+
+
+@patch("ingestion.main_worker.ProcessPoolExecutor")
+@patch("ingestion.main_worker.download_video_to_temp_mobile")
+@patch("os.path.exists", return_value=True)
+@patch("os.remove")
+def test_run_pipeline_publishes_every_downloaded_video(
+    mock_remove, mock_exists, mock_download, mock_pool, mock_minio_client, mock_kafka_client, monkeypatch
+):
+    """CSV mode: download -> extract (process pool) -> upload -> publish"""
+    from ingestion import main_worker
+
+    monkeypatch.setattr(main_worker.config, "PIPELINE_DOWNLOAD_RATE_PER_MIN", 0)
+    monkeypatch.setattr(main_worker.config, "ADAPTIVE_STATE_PATH", None)
+    mock_download.side_effect = lambda url, **kw: (url[-1], f"/tmp/{url[-1]}.mp4", ["text"])
+    mock_pool.return_value.submit.return_value.result.return_value = {
+        "audio": True, "thumbnails": ["/tmp/thumb_01.jpg"], "proxy": None
+    }
+
+    rows = [(f"http://tiktok.com/video/{i}", "safe") for i in range(5)]
+    stats = main_worker.run_pipeline(rows, mock_minio_client, mock_kafka_client)
+
+    assert stats["publish"]["done"] == 5
+    assert mock_kafka_client.send.call_count == 5
+    assert mock_minio_client.upload_file.call_count == 15  # video + audio + thumbnail
+    assert mock_kafka_client.send.call_args[0][0]["minio_thumbnail_paths"]
+    mock_pool.return_value.shutdown.assert_called_once()
+
+
+# --- TEST KAFKA CLIENT (async, batched) ---
+def test_kafka_client_send_is_async_and_keyed():
+    """send() không flush từng message; key = video_id; lỗi delivery được ghi nhận"""
+    from ingestion.clients.minio_kafka_clients import KafkaClient
+
+    with patch("ingestion.clients.minio_kafka_clients.KafkaAdminClient"), \
+         patch("ingestion.clients.minio_kafka_clients.KafkaProducer") as mock_producer_cls:
+        client = KafkaClient(retries=1, delay=0)
+    producer = mock_producer_cls.return_value
+    kwargs = mock_producer_cls.call_args.kwargs
+    assert kwargs["linger_ms"] > 0 and kwargs["compression_type"]
+
+    client.send({"video_id": "v1", "clean_text": "a"})
+    client.send({"video_id": "v2", "clean_text": "b"})
+    producer.flush.assert_not_called()
+    assert producer.send.call_args.kwargs["key"] == "v2"
+
+    # Delivery callbacks (kafka-python gọi ở IO thread)
+    future = producer.send.return_value
+    future.add_callback.call_args[0][0](future.add_callback.call_args[0][1], MagicMock(partition=1))
+    future.add_errback.call_args[0][0](future.add_errback.call_args[0][1], Exception("timeout"))
+
+    failed = client.close()
+    producer.flush.assert_called_once()
+    assert client.sent == 1
+    assert failed == [("v2", "timeout")]
+
+
+# --- TEST MINIO UPLOAD (dedup + streaming) ---
+def test_minio_upload_file_skips_duplicate_content(tmp_path):
+    """Đã có object cùng SHA256 -> không upload lại, trả về path cũ"""
+    from ingestion.clients.minio_kafka_clients import MinioClient, HASH_INDEX_PREFIX
+
+    video = tmp_path / "v.mp4"
+    video.write_bytes(b"same-bytes")
+    client = MinioClient(retries=1, delay=0)
+    client.client = MagicMock()
+    client.client.stat_object.side_effect = Exception("NoSuchKey")
+
+    assert client.upload_file(str(video), "raw/safe/v.mp4") == f"{config.MINIO_BUCKET}/raw/safe/v.mp4"
+    client.client.fput_object.assert_called_once()
+    assert client.client.fput_object.call_args.kwargs["num_parallel_uploads"] == config.MINIO_PARALLEL_UPLOADS
+    index_key = client.client.put_object.call_args[0][1]
+    assert index_key.startswith(HASH_INDEX_PREFIX)
+
+    # Lần 2: hash index trỏ tới object đã có
+    client.client.stat_object.side_effect = None
+    client.client.stat_object.return_value.metadata = {"x-amz-meta-path": "raw/safe/v.mp4"}
+    assert client.upload_file(str(video), "raw/harmful/v.mp4") == f"{config.MINIO_BUCKET}/raw/safe/v.mp4"
+    client.client.fput_object.assert_called_once()
+
+
+def test_growing_file_reader_streams_while_writing(tmp_path):
+    """Reader trả dữ liệu khi file còn đang ghi, EOF chỉ khi writer báo xong"""
+    import hashlib
+    import threading
+    import time
+    from ingestion.clients.minio_kafka_clients import GrowingFileReader, HashingReader
+
+    path = tmp_path / "v.mp4.part"
+    done = threading.Event()
+
+    def writer():
+        with open(path, "wb") as f:
+            for i in range(5):
+                f.write(bytes([i]) * 1000)
+                f.flush()
+                time.sleep(0.02)
+        done.set()
+
+    threading.Thread(target=writer).start()
+    reader = HashingReader(GrowingFileReader(str(path), done.is_set, poll_interval=0.01))
+    chunks = []
+    while True:
+        data = reader.read(1500)
+        if not data:
+            break
+        chunks.append(data)
+
+    expected = b"".join(bytes([i]) * 1000 for i in range(5))
+    assert b"".join(chunks) == expected
+    assert reader.hexdigest() == hashlib.sha256(expected).hexdigest()
+
+
+def test_growing_file_reader_reads_renamed_file_when_started_late(tmp_path):
+    """Upload bắt đầu sau khi yt-dlp đã rename .part -> .mp4: đọc file cuối, không chờ timeout"""
+    from ingestion.clients.minio_kafka_clients import GrowingFileReader
+
+    (tmp_path / "v.mp4").write_bytes(b"video")
+    reader = GrowingFileReader(
+        str(tmp_path / "v.mp4.part"), lambda: True, timeout=0.05, final_path=str(tmp_path / "v.mp4")
+    )
+    assert reader.read() == b"video"
+
+    gone = GrowingFileReader(str(tmp_path / "x.part"), lambda: True, timeout=60)
+    with pytest.raises(IOError):
+        gone.read()
+
+
+def test_minio_upload_stream_dedups_after_upload():
+    """Stream upload: hash chỉ biết sau khi upload -> trùng nội dung thì xoá object mới"""
+    import io
+    from ingestion.clients.minio_kafka_clients import MinioClient
+
+    client = MinioClient(retries=1, delay=0)
+    client.client = MagicMock()
+    client.client.stat_object.return_value.metadata = {"x-amz-meta-path": "raw/safe/old.mp4"}
+
+    path = client.upload_stream(io.BytesIO(b"same-bytes"), "raw/safe/new.mp4")
+
+    assert path == f"{config.MINIO_BUCKET}/raw/safe/old.mp4"
+    client.client.remove_object.assert_called_once_with(config.MINIO_BUCKET, "raw/safe/new.mp4")
+
+
+# --- TEST INGESTION LEDGER ---
+def test_ledger_only_returns_new_or_retryable_urls(tmp_path):
+    """URL published không chạy lại; failed chạy lại tới khi hết retry; resume sau crash"""
+    from ingestion.ledger import IngestionLedger
+
+    ledger = IngestionLedger(str(tmp_path / "ledger.sqlite"), max_retries=2)
+    assert ledger.enqueue([("u1", "safe"), ("u2", "harmful"), ("u3", "safe")]) == 3
+    assert ledger.enqueue([("u1", "safe"), ("u4", "safe")]) == 1  # u1 đã có
+
+    ledger.mark_downloaded("u1", "v1", ["text 1"])
+    ledger.mark_uploaded("u1", "bucket/raw/safe/v1.mp4", None)
+    ledger.mark_published_video("v1")  # Kafka ack
+    ledger.mark_downloaded("u2", "v2", ["text 2"])
+    ledger.mark_uploaded("u2", "bucket/raw/harmful/v2.mp4", None)  # crash trước khi publish
+    ledger.mark_failed("u3", "download failed")
+    ledger.mark_failed("u3", "download failed")  # hết retry
+
+    pending = {item["url"]: item for item in IngestionLedger(ledger.path, max_retries=2).pending()}
+    assert set(pending) == {"u2", "u4"}
+    assert pending["u2"]["raw_comments"] == ["text 2"]
+    assert pending["u2"]["minio_video_path"] == "bucket/raw/harmful/v2.mp4"
+    assert ledger.stats() == {"published": 1, "uploaded": 1, "failed": 1, "queued": 1}
+
+    ledger.mark_skipped("u4", "duration 3600s > 600s")  # lọc theo metadata, không retry
+    assert {item["url"] for item in ledger.pending()} == {"u2"}
+    assert ledger.is_done(ledger.get("u4"))
+
+
+def test_resume_uploaded_publishes_without_download(mock_kafka_client):
+    """Item đã upload -> publish lại ngay, item khác vẫn chạy pipeline"""
+    from ingestion.main_worker import resume_uploaded
+
+    items = [
+        {"url": "u2", "label": "harmful", "video_id": "v2", "state": "uploaded",
+         "raw_comments": ["text"], "minio_video_path": "b/v2.mp4", "minio_audio_path": None},
+        {"url": "u4", "label": "safe", "video_id": None, "state": "queued",
+         "raw_comments": None, "minio_video_path": None, "minio_audio_path": None},
+    ]
+    remaining = resume_uploaded(items, mock_kafka_client)
+
+    assert [item["url"] for item in remaining] == ["u4"]
+    assert mock_kafka_client.send.call_args[0][0]["minio_video_path"] == "b/v2.mp4"
+
+
+# --- TEST URL WORK QUEUE (consumer group) ---
+def test_offset_tracker_commits_only_contiguous_done_offsets():
+    """Offset chỉ commit khi mọi offset trước nó trong partition đã xong"""
+    from ingestion.url_queue import OffsetTracker
+
+    tracker = OffsetTracker()
+    for offset in (10, 11, 12):
+        tracker.add(("urls", 0), offset)
+    tracker.add(("urls", 1), 5)
+
+    tracker.done(("urls", 0), 11)
+    tracker.done(("urls", 1), 5)
+    assert tracker.committable() == {("urls", 1): 6}  # partition 0 còn chờ offset 10
+    tracker.done(("urls", 0), 10)
+    assert tracker.committable() == {("urls", 0): 12}
+    assert tracker.in_flight() == 1
+
+    tracker.forget([("urls", 0)])  # revoke -> bỏ qua kết quả muộn
+    tracker.done(("urls", 0), 12)
+    assert tracker.committable() == {}
+
+
+@patch("ingestion.main_worker.ProcessPoolExecutor")
+@patch("ingestion.main_worker.download_video_to_temp_mobile")
+@patch("os.path.exists", return_value=True)
+@patch("os.remove")
+def test_run_consumer_commits_after_publish_and_requeues_failures(
+    mock_remove, mock_exists, mock_download, mock_pool, mock_minio_client, mock_kafka_client,
+    monkeypatch, tmp_path
+):
+    """URL topic -> pipeline; commit sau khi Kafka ack; URL lỗi được requeue; URL trùng bị bỏ qua"""
+    from types import SimpleNamespace
+    from ingestion import main_worker
+    from ingestion import url_queue as url_queue_module
+    from ingestion.ledger import IngestionLedger
+
+    monkeypatch.setattr(main_worker.config, "PIPELINE_DOWNLOAD_RATE_PER_MIN", 0)
+    monkeypatch.setattr(main_worker.config, "ADAPTIVE_STATE_PATH", None)
+    monkeypatch.setattr(main_worker.config, "MINIO_STREAM_UPLOAD", False)
+    monkeypatch.setattr(url_queue_module, "TopicPartition", lambda topic, partition: (topic, partition))
+    monkeypatch.setattr(url_queue_module, "OffsetAndMetadata", lambda offset, metadata: offset)
+    mock_download.side_effect = lambda url, **kw: (
+        (None, None, []) if url.endswith("bad") else (url[-1], f"/tmp/{url[-1]}.mp4", ["text"])
+    )
+    mock_pool.return_value.submit.return_value.result.return_value = {
+        "audio": True, "thumbnails": ["/tmp/thumb_01.jpg"], "proxy": None
+    }
+    # Broker ack ngay khi send
+    mock_kafka_client.send.side_effect = lambda msg: mock_kafka_client.on_delivered(msg["video_id"])
+
+    ledger = IngestionLedger(str(tmp_path / "ledger.sqlite"))
+    ledger.enqueue([("http://tiktok.com/video/0", "safe")])
+    ledger.mark_downloaded("http://tiktok.com/video/0", "0", ["text"])
+    ledger.mark_published("http://tiktok.com/video/0")  # đã xử lý ở lần trước
+
+    urls = ["http://tiktok.com/video/0", "http://tiktok.com/video/1", "http://tiktok.com/video/bad",
+            "http://tiktok.com/video/3"]
+    records = [
+        SimpleNamespace(topic="urls", partition=0, offset=i, value={"url": url, "label": "safe"})
+        for i, url in enumerate(urls)
+    ]
+    consumer = MagicMock()
+    queue = url_queue_module.UrlQueueConsumer(consumer=consumer, max_in_flight=8)
+
+    def poll(timeout_ms):
+        if consumer.poll.call_count == 1:
+            return {("urls", 0): records}
+        queue.stop()
+        return {}
+
+    consumer.poll.side_effect = poll
+    requeue = MagicMock()
+    main_worker.run_consumer(mock_minio_client, mock_kafka_client, ledger, url_queue=queue, requeue=requeue)
+
+    assert mock_download.call_count == 3  # URL 0 đã published -> không tải lại
+    assert mock_kafka_client.send.call_count == 2
+    assert requeue.send.call_args[0][0]["url"] == "http://tiktok.com/video/bad"
+    assert consumer.commit.call_args_list[-1][1]["offsets"] == {("urls", 0): 4}
+    consumer.close.assert_called_once_with(autocommit=False)
+    assert ledger.stats() == {"published": 3, "failed": 1}
+
+
+# --- TEST ADAPTIVE CONCURRENCY (AIMD) ---
+def test_aimd_controller_increases_on_success_and_backs_off_on_block(tmp_path):
+    """Thành công đủ window -> +1; bị chặn -> giảm một nửa + cooldown; state được lưu lại"""
+    from ingestion import concurrency
+
+    state_path = str(tmp_path / "adaptive.json")
+    controller = concurrency.AIMDController(
+        "download", initial_limit=2, max_limit=6, initial_rate=60000, max_rate=120000,
+        window=3, cooldown_sec=60, state_path=state_path,
+    )
+    for _ in range(6):
+        controller.acquire()
+        controller.release(concurrency.OK)
+    assert controller.limit == 4
+
+    controller.acquire()
+    controller.release(concurrency.classify_error("HTTP Error 429: Too Many Requests"))
+    assert controller.limit == 2
+    assert controller.cooldown_until > time.time() + 50
+
+    resumed = concurrency.AIMDController("download", max_limit=6, state_path=state_path)
+    assert resumed.limit == 2
+    crawler = concurrency.AIMDController("crawler", max_limit=1, state_path=state_path)
+    assert crawler.cooldown_until == controller.cooldown_until  # cùng IP -> cùng nghỉ
+
+    assert concurrency.classify_error("Video unavailable") == concurrency.ERROR
+
+    unlimited = concurrency.AIMDController("x", initial_rate=0, min_rate=2, window=1)
+    unlimited.acquire()
+    unlimited.release(concurrency.OK)
+    assert unlimited.rate_per_min == 0  # 0 = không giới hạn nhịp, không bị tăng thành 1/min
+
+
+def test_crawl_controller_state_is_kept_per_shard(tmp_path, monkeypatch):
+    """Mỗi shard 1 key trong state file: shard này giảm nhịp không ghi đè shard kia"""
+    from ingestion import concurrency
+
+    monkeypatch.setattr(concurrency.config, "ADAPTIVE_STATE_PATH", str(tmp_path / "adaptive.json"))
+    monkeypatch.setattr(concurrency.config, "CRAWL_RATE_PER_MIN", 60000)
+    monkeypatch.setattr(concurrency.config, "CRAWL_MAX_RATE_PER_MIN", 120000)
+
+    shard_0 = concurrency.crawl_controller("crawler-0")
+    shard_1 = concurrency.crawl_controller("crawler-1")
+    for _ in range(4):
+        shard_1.acquire()
+        shard_1.release(concurrency.OK)
+    shard_0.acquire()
+    shard_0.release(concurrency.ERROR)
+    assert shard_0.rate_per_min < shard_1.rate_per_min
+
+    assert concurrency.crawl_controller("crawler-0").rate_per_min == shard_0.rate_per_min
+    assert concurrency.crawl_controller("crawler-1").rate_per_min == shard_1.rate_per_min
+
+
+@patch("ingestion.downloader.yt_dlp.YoutubeDL")
+def test_downloader_reports_block_to_controller(mock_ydl, tmp_path):
+    """Lỗi yt-dlp có 403/captcha -> controller nhận BLOCKED"""
+    from ingestion import downloader
+
+    def make_ydl(opts):
+        ydl = MagicMock()
+        ydl.__enter__.return_value = ydl
+
+        def extract_info(url, download):
+            opts["logger"].error("ERROR: [TikTok] 123: HTTP Error 403: Forbidden")
+            return None
+
+        ydl.extract_info.side_effect = extract_info
+        return ydl
+
+    mock_ydl.side_effect = make_ydl
+    controller = MagicMock()
+    tiktok = downloader.TikTokDownloader(temp_root=str(tmp_path))
+    assert downloader.download_video_to_temp_mobile(
+        "http://tiktok.com/video/123", controller=controller, downloader=tiktok
+    ) == (None, None, [])
+    controller.acquire.assert_called_once()
+    controller.release.assert_called_once_with("blocked")
+
+
+@patch("ingestion.downloader.yt_dlp.YoutubeDL")
+def test_downloader_reuses_session_and_prefetch_filters(mock_ydl, tmp_path):
+    """1 YoutubeDL / thread cho mọi URL, thư mục tạm riêng mỗi task, lọc theo metadata"""
+    from ingestion import downloader
+
+    ydl = MagicMock()
+    ydl.params = {}
+    infos = {
+        "http://tiktok.com/video/1": {"id": "1", "title": "a", "duration": 30},
+        "http://tiktok.com/video/2": {"id": "2", "title": "b", "duration": 3600},
+    }
+    ydl.extract_info.side_effect = lambda url, download: infos[url]
+
+    def process_ie_result(info, download):
+        path = os.path.join(ydl.params["paths"]["home"], f"{info['id']}.mp4")
+        with open(path, "wb") as f:
+            f.write(b"x" * 2000)
+        return dict(info, requested_downloads=[{"filepath": path}])
+
+    ydl.process_ie_result.side_effect = process_ie_result
+    mock_ydl.return_value = ydl
+
+    tiktok = downloader.TikTokDownloader(temp_root=str(tmp_path), max_duration_sec=600)
+    vid, path, comments = tiktok.download("http://tiktok.com/video/1")
+    assert (vid, comments) == ("1", ["a"])
+    assert os.path.dirname(os.path.dirname(path)) == str(tmp_path)  # thư mục riêng của task
+
+    with pytest.raises(downloader.VideoRejected):
+        tiktok.download("http://tiktok.com/video/2")
+    ydl.process_ie_result.assert_called_once()  # video dài không bị tải
+    ydl.extract_info.assert_called_with("http://tiktok.com/video/2", download=False)
+    assert mock_ydl.call_count == 1  # YoutubeDL dùng lại
+
+    tiktok.remove_task_dir(path)
+    assert os.listdir(tmp_path) == []
+    tiktok.remove_task_dir("/tmp/video.mp4")  # ngoài temp_root -> không đụng tới
+
+
+# --- TEST MEDIA EXTRACT (1 lần ffmpeg) ---
+@pytest.mark.skipif(__import__("shutil").which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_extract_media_single_pass_outputs(tmp_path, monkeypatch):
+    """1 lệnh ffmpeg -> WAV + thumbnails + proxy; video không có audio vẫn ra thumbnails"""
+    import subprocess
+    from ingestion import audio_processor
+
+    def make_clip(path, with_audio):
+        cmd = ["ffmpeg", "-loglevel", "error", "-y",
+               "-f", "lavfi", "-i", "testsrc=duration=3:size=320x240:rate=10"]
+        if with_audio:
+            cmd += ["-f", "lavfi", "-i", "sine=duration=3", "-shortest"]
+        subprocess.run(cmd + [str(path)], check=True)
+
+    make_clip(tmp_path / "av.mp4", True)
+    make_clip(tmp_path / "v.mp4", False)
+
+    calls = []
+    real_run = subprocess.run
+    monkeypatch.setattr(
+        audio_processor.subprocess, "run",
+        lambda cmd, **kw: calls.append(cmd) or real_run(cmd, **kw),
+    )
+    media = audio_processor.extract_media(
+        str(tmp_path / "av.mp4"), str(tmp_path / "av.wav"), str(tmp_path),
+        str(tmp_path / "av_proxy.mp4"), thumb_count=2,
+    )
+    assert media["audio"] and media["proxy"] and len(media["thumbnails"]) == 2
+    assert sum("-y" in cmd for cmd in calls) == 1  # 1 lần decode cho cả 3 output
+
+    video_only = tmp_path / "video_only"
+    video_only.mkdir()
+    media = audio_processor.extract_media(
+        str(tmp_path / "v.mp4"), str(video_only / "v.wav"), str(video_only), thumb_count=2
+    )
+    assert not media["audio"] and len(media["thumbnails"]) == 2 and media["proxy"] is None
+
+
+@pytest.mark.skipif(__import__("shutil").which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_thumbnails_skip_first_frame(tmp_path):
+    """Thumbnail k lấy tại k * duration / (count + 1): không lấy frame đen ở t=0"""
+    import subprocess
+    from ingestion import audio_processor
+
+    # Độ sáng tăng theo thời gian (40 / giây) -> đọc lại được timestamp của từng ảnh
+    clip = tmp_path / "ramp.mp4"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i",
+                    "color=c=black:s=64x64:r=10:d=6,format=gray,geq=lum='N*4'", str(clip)], check=True)
+
+    media = audio_processor.extract_media(str(clip), str(tmp_path / "x.wav"), str(tmp_path), thumb_count=2)
+    seconds = []
+    for thumb in media["thumbnails"]:
+        gray = subprocess.run(["ffmpeg", "-loglevel", "error", "-i", thumb, "-f", "rawvideo",
+                               "-pix_fmt", "gray", "-"], capture_output=True, check=True).stdout
+        seconds.append(sum(gray) / len(gray) / 40)
+    assert seconds == pytest.approx([2.0, 4.0], abs=0.15)
+
+
+@pytest.mark.skipif(__import__("shutil").which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_extract_media_keeps_audio_when_optional_output_fails(tmp_path, monkeypatch):
+    """Proxy lỗi (vd thiếu encoder) -> vẫn tách được audio như trước khi gộp output"""
+    import subprocess
+    from ingestion import audio_processor
+
+    clip = tmp_path / "clip.mp4"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i", "testsrc=duration=2:size=160x120",
+                    "-f", "lavfi", "-i", "sine=duration=2", "-shortest", str(clip)], check=True)
+    monkeypatch.setattr(
+        audio_processor, "_proxy_output",
+        lambda path, has_audio: ["-map", "0:v:0", "-c:v", "no_such_encoder", path],
+    )
+
+    media = audio_processor.extract_media(
+        str(clip), str(tmp_path / "clip.wav"), str(tmp_path), str(tmp_path / "proxy.mp4"), thumb_count=2
+    )
+    assert media["audio"] and media["proxy"] is None and media["thumbnails"] == []
+
+
+@pytest.mark.skipif(__import__("shutil").which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_compressed_audio_decodes_like_wav(tmp_path):
+    """AUDIO_FORMAT=flac/opus: nhỏ hơn WAV, decode (shared_utils.audio_io) ra cùng 16kHz mono"""
+    import subprocess
+    import sys
+    from ingestion import audio_processor
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "train_eval_module"))
+    from shared_utils.audio_io import decode_audio
+
+    clip = tmp_path / "clip.mp4"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi", "-i", "testsrc=duration=3:size=160x120",
+                    "-f", "lavfi", "-i", "sine=frequency=440:duration=3", "-shortest", str(clip)], check=True)
+
+    decoded = {}
+    for ext in (".wav", ".flac", ".opus"):
+        out = tmp_path / f"clip{ext}"
+        assert audio_processor.extract_media(str(clip), str(out), thumb_count=0)["audio"]
+        decoded[ext] = (out.stat().st_size, decode_audio(str(out)))
+    assert decoded[".flac"][0] < decoded[".wav"][0] and decoded[".opus"][0] < decoded[".flac"][0]
+    assert (decoded[".flac"][1] == decoded[".wav"][1]).all()  # lossless
+    assert abs(len(decoded[".opus"][1]) - len(decoded[".wav"][1])) < 16000 * 0.1
+    assert audio_processor.audio_content_type("x.opus") == "audio/ogg"
+
+
+# --- TEST TEXT NORMALIZATION (shared_utils.text_normalize) ---
+def test_text_profiles_match_legacy_cleaners(tmp_path):
+    """3 profile giữ đúng output cleaner cũ; clean_batch giữ thứ tự; clean_split cache theo split"""
+    from ingestion.clients.data_cleaner import clean_batch, clean_text_advanced
+    from shared_utils import text_normalize
+
+    cases = [
+        "Ko biết @an.nguyen http://t.co/x đẹppppp quá!!! #xuhuong",
+        "mn ơi   vcl...  k  xem dc",
+        "Sđt 0912345678 [SEP] hay lắm???",
+        "@a.http://x ​zero‍width ﬁle 12345",
+        "nan",
+    ]
+    expected = {
+        "ingestion": ["không biết .nguyen đẹpp quá!! xuhuong", "mọi người ơi vcl.. không xem được",
+                      "sđt 0912345678 sep hay lắm??", ". zero width ﬁle 12345", ""],
+        "text": ["Ko biết đẹpp quá! xuhuong", "mn ơi vcl. k xem dc", "Sđt [SEP] hay lắm?",
+                 "zerowidth ﬁle 12345", "nan"],
+        "fusion": ["ko biết [user] [url] đẹpp quá!! xuhuong", "mn ơi vcl.. k xem dc",
+                   "sđt [num] [sep] hay lắm??", "[user] [url] zerowidth file [num]", "nan"],
+    }
+    for profile, outputs in expected.items():
+        assert [text_normalize.normalize(c, profile) for c in cases] == outputs
+        assert text_normalize.clean_batch(cases + cases[:2], profile) == outputs + outputs[:2]
+    assert clean_text_advanced(None) == "" and clean_batch(cases) == expected["ingestion"]
+
+    first = text_normalize.clean_split(cases, "text", str(tmp_path))
+    assert first == expected["text"] and len(os.listdir(tmp_path)) == 1
+    with patch.object(text_normalize, "clean_batch") as mock_batch:
+        assert text_normalize.clean_split(cases, "text", str(tmp_path)) == first  # đọc cache
+        mock_batch.assert_not_called()
+
+
+def test_ai_labeler_batches_by_length_and_caches(tmp_path):
+    from ingestion.clients import ai_labeler
+
+    labeler = ai_labeler.AILabeler(cache_path=str(tmp_path / "cache.sqlite"))
+    labeler._encode = lambda texts: [[0] * len(t) for t in texts]
+    batches = []
+
+    def score(input_ids):
+        batches.append([len(ids) for ids in input_ids])
+        return [0.9 if len(ids) > 3 else 0.2 for ids in input_ids]
+
+    labeler._score_batch = score
+    texts = ["abcdef", "ab", "abcd", "ab", "", "abc"]
+    results = labeler.predict_batch(texts, batch_size=2)
+
+    # Text trùng chạy 1 lần, batch theo thứ tự độ dài prompt
+    assert batches == [[2, 3], [4, 6]]
+    assert [r["label"] for r in results] == [
+        "harmful", "safe", "harmful", "safe", "safe", "safe"
+    ]
+    assert results[0]["confidence"] == 0.9 and results[4]["confidence"] == 0.0
+
+    # Chạy lại: chỉ text mới tốn forward pass
+    batches.clear()
+    assert labeler.predict_batch(["abcd", "xyzxyz"])[0]["label"] == "harmful"
+    assert batches == [[6]]
+    labeler.cache.close()
+
+
+def test_label_csv_resumes_from_checkpoint(tmp_path):
+    import json
+    import pandas as pd
+    from ingestion.clients import ai_labeler
+
+    src, out = tmp_path / "crawl.csv", tmp_path / "labeled.csv"
+    pd.DataFrame({"link": range(5), "description": list("abcde")}).to_csv(
+        src, index=False, encoding="utf-8-sig"
+    )
+    labeler = MagicMock()
+    labeler.predict_batch.side_effect = lambda texts: [
+        {"label": "safe", "confidence": 1.0} for _ in texts
+    ]
+
+    # Lần trước dừng sau 2 dòng, kèm 1 dòng ghi dở sau checkpoint
+    header = "link,description,ai_label,ai_confidence\n0,a,safe,1.0\n1,b,safe,1.0\n"
+    out.write_bytes(header.encode("utf-8-sig") + b"2,c,sa")
+    with open(str(out) + ".progress", "w") as f:
+        json.dump({"rows": 2, "bytes": len(header.encode("utf-8-sig"))}, f)
+
+    assert ai_labeler.label_csv(str(src), str(out), labeler, chunk_rows=2) == 5
+    df = pd.read_csv(out, encoding="utf-8-sig")
+    assert df["link"].tolist() == [0, 1, 2, 3, 4]
+    assert set(df["ai_label"]) == {"safe"}
+    assert [c.args[0] for c in labeler.predict_batch.call_args_list] == [["c", "d"], ["e"]]
+    assert not os.path.exists(str(out) + ".progress")
+
+
+def test_crawl_store_upserts_by_video_id_and_exports_csv(tmp_path):
+    import pandas as pd
+    from ingestion.crawl_store import CrawlStore
+
+    store = CrawlStore(str(tmp_path / "crawl.sqlite"))
+    link = "https://www.tiktok.com/@a/video/111"
+    assert store.upsert("tag1", [{"link": link, "desc": "x\ny", "video_id": "111"}], "harmful") == 1
+    # Crawl lại cùng video (khác hashtag, không có id): không thêm dòng
+    assert store.upsert("tag2", [{"link": link, "desc": ""}], "safe") == 0
+    assert store.upsert("tag2", [{"link": "https://www.tiktok.com/@b/video/222"}], "safe") == 1
+
+    row = store.get("111")
+    assert row["hashtag"] == "tag1" and row["label"] == "harmful"
+    assert row["description"] == "x y" and row["seen_count"] == 2
+    assert "222" in store and "333" not in store
+
+    out = tmp_path / "links.csv"
+    assert store.export_csv(str(out)) == 2
+    df = pd.read_csv(out, encoding="utf-8-sig")
+    assert list(df.columns) == ["hashtag", "link", "description", "label"]
+
+    # Nạp lại CSV đã export vào store mới: cùng dữ liệu
+    other = CrawlStore(str(tmp_path / "other.sqlite"))
+    assert other.import_csv(str(out)) == 2
+    assert other.links() == store.links()
+    store.close()
+    other.close()
+
+
+def test_crawl_store_counts_new_videos_across_processes(tmp_path):
+    from ingestion.crawl_store import CrawlStore
+
+    # 2 shard cùng ghi 1 file: video shard kia đã ghi không tính là mới
+    path = str(tmp_path / "crawl.sqlite")
+    shard_a, shard_b = CrawlStore(path), CrawlStore(path)
+    link = "https://www.tiktok.com/@a/video/{}"
+    assert shard_b.upsert("tag", [{"link": link.format(1)}], "safe") == 1
+    batch = [{"link": link.format(1)}, {"link": link.format(2)}, {"link": link.format(2)}]
+    assert shard_a.upsert("tag", batch, "safe") == 1
+    assert shard_b.get("2")["seen_count"] == 2  # trùng trong batch vẫn là 1 dòng
+    shard_a.close()
+    shard_b.close()
+
+
+def test_item_list_capture_parses_each_response_once():
+    import json
+    from ingestion.item_list import ItemListCapture
+
+    def request(rid, status=200, items=(), url="https://www.tiktok.com/api/challenge/item_list/"):
+        req = MagicMock(id=rid, url=url)
+        if status is None:
+            req.response = None
+        else:
+            req.response.status_code = status
+            body = {"itemList": [{"id": i, "author": {"uniqueId": "u"}, "desc": "d"} for i in items]}
+            req.response.body = json.dumps(body).encode("utf-8")
+        return req
+
+    class FakeDriver:
+        def __init__(self):
+            self.captured, self.purges = [], 0
+
+        @property
+        def requests(self):
+            return list(self.captured)
+
+        @requests.deleter
+        def requests(self):
+            self.captured, self.purges = [], self.purges + 1
+
+    driver = FakeDriver()
+    capture = ItemListCapture(driver)
+    capture.reset()
+    slow = request("r1", status=None)
+    driver.captured = [slow, request("r2", items=["1", "2"])]
+    assert capture.poll() == 2
+    assert capture.responses == 1 and driver.purges == 1  # r1 chưa có response -> chưa xóa
+
+    slow.response = request("x", items=["2", "3"]).response
+    driver.captured.append(request("r3", status=429))
+    assert capture.poll() == 3
+    assert capture.responses == 3 and capture.blocked_status == 429
+    assert driver.captured == [] and driver.purges == 2  # đọc hết -> xóa
+
+    assert capture.poll() == 3 and capture.responses == 3
+
+
+def test_shard_and_session_pool_keeps_warm_spare():
+    import itertools
+    import threading
+    from ingestion.sessions import SessionPool, shard
+
+    assert shard(list("abcde"), 2) == [["a", "c", "e"], ["b", "d"]]
+    assert shard(list("ab"), 3) == [["a"], ["b"], []]
+
+    counter = itertools.count(1)
+    started = []
+    lock = threading.Lock()
+
+    def factory():
+        with lock:
+            session = MagicMock(name=f"s{next(counter)}")
+            started.append(session)
+            return session
+
+    pool = SessionPool(factory, spares=1)
+    first = pool.get()
+    second = pool.get()  # đổi session: lấy cái đã warm sẵn, cái bù khởi động ngay
+    assert first is started[0] and second is started[1]
+    pool._ready[0].result()  # chờ spare khởi động xong
+    pool.close()
+    assert len(started) == 3
+    started[2].quit.assert_called_once()  # spare chưa dùng được đóng
+    first.quit.assert_not_called()
+
+    # spares=0 (API mode): không khởi động browser thừa
+    started.clear()
+    pool = SessionPool(factory, spares=0)
+    assert pool.get() is started[0]
+    pool.close()
+    assert len(started) == 1
+
+
+def test_api_crawler_paginates_local_item_list_and_refreshes_template():
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+    from ingestion.api_crawler import ApiCrawler, ItemListTemplate
+
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "item_list")
+    seen = []
+
+    class ItemListHandler(BaseHTTPRequestHandler):
+        """Stand-in cho API item_list: trả fixture theo cursor, signature cũ -> 403."""
+
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            seen.append((query["challengeID"][0], query["cursor"][0], self.headers.get("Cookie")))
+            path = os.path.join(fixtures, f"page_{query['cursor'][0]}.json")
+            if query["X-Bogus"][0] == "expired" or not os.path.exists(path):
+                self.send_response(403)
+                self.end_headers()
+                return
+            with open(path, "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ItemListHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/api/challenge/item_list/"
+    signatures = {"a": ["expired", "ok"], "b": ["ok"]}
+
+    def provider(tag):
+        sig = signatures[tag].pop(0)
+        return ItemListTemplate(
+            f"{base}?challengeID={tag}&count=2&cursor=0&X-Bogus={sig}",
+            {"Cookie": "sessionid=x", "Host": "www.tiktok.com", "Content-Length": "0"},
+        )
+
+    pages = []
+    crawler = ApiCrawler(provider, workers=2, max_pages=5)
+    try:
+        results = crawler.crawl(
+            [("a", "safe"), ("b", "safe")],
+            on_videos=lambda tag, videos, label: pages.append((tag, len(videos))),
+        )
+    finally:
+        crawler.close()
+        server.shutdown()
+
+    # 3 video mỗi tag (trùng giữa 2 trang, item thiếu author bị bỏ)
+    assert results == {"a": 3, "b": 3}
+    assert sorted(pages) == [("a", 1), ("a", 2), ("b", 1), ("b", 2)]
+    assert crawler.templates_fetched == 3  # tag a lấy lại template 1 lần
+    assert ("a", "0", "sessionid=x") in seen and ("b", "2", "sessionid=x") in seen
+
+
+def test_comment_crawler_resumes_from_checkpoint_without_duplicates(tmp_path):
+    """Checkpoint chỉ ghi sau khi flush Parquet: lỗi giữa chừng rồi chạy lại không trùng dòng"""
+    import asyncio
+    import contextlib
+    import json
+    import sys
+
+    pytest.importorskip("aiohttp")
+    pq = pytest.importorskip("pyarrow.parquet")
+    sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "crawl_scripts"))
+    from comment_crawler import HostRateLimiter, ParquetSink, crawl_video_comments_async
+
+    def comment(cid, replies=0):
+        return {"cid": cid, "text": cid, "user": {"nickname": "u"}, "create_time": 1,
+                "digg_count": 0, "reply_comment_total": replies}
+
+    pages = {0: {"comments": [comment("c1", 1), comment("c2")], "has_more": True, "cursor": 2},
+             2: {"comments": [comment("c3")], "has_more": False, "cursor": 3}}
+    failing = {2}  # trang cursor=2 lỗi ở lần chạy đầu
+    requests_made = []
+
+    class FakeHttp:
+        """Stand-in aiohttp.ClientSession: comment list theo cursor, 1 reply cho c1."""
+
+        @contextlib.asynccontextmanager
+        async def get(self, url, params, timeout):
+            requests_made.append((url.rsplit("/", 2)[-2], params["cursor"]))
+            response = MagicMock(status=200)
+            if "reply" in url:
+                data = {"comments": [comment("r1")], "has_more": False}
+            elif params["cursor"] in failing:
+                response.status = 500
+                data = None
+            else:
+                data = pages[params["cursor"]]
+
+            async def json_body(content_type=None):
+                return data
+
+            response.json = json_body
+            yield response
+
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    dataset = str(tmp_path / "comments")
+
+    def run(flush_rows):
+        sink = ParquetSink(dataset, checkpoint_path, flush_rows=flush_rows)
+        limiter = HostRateLimiter(rate_per_sec=1000, max_concurrency=4)
+        fetched = asyncio.run(
+            crawl_video_comments_async(FakeHttp(), limiter, sink, sink.checkpoint, "v1", "safe")
+        )
+        return sink, fetched
+
+    # Rows chưa flush -> checkpoint chưa có cursor (dừng lúc này: chạy lại từ đầu)
+    sink, _ = run(flush_rows=1000)
+    assert sink.rows and not os.path.exists(checkpoint_path)
+
+    # flush sau mỗi trang: trang 1 ghi ra Parquet rồi mới lưu cursor, trang 2 lỗi
+    requests_made.clear()
+    _, fetched = run(flush_rows=1)
+    assert fetched == 2
+    with open(checkpoint_path, encoding="utf-8") as f:
+        assert json.load(f)["v1"] == {"cursor": 2, "fetched": 2, "done": False}
+    assert sorted(pq.read_table(dataset).column("cid").to_pylist()) == ["c1", "c2", "r1"]
+    assert ("reply", 0) in requests_made and len(requests_made) == 3  # c2 không có reply -> không gọi
+
+    # Chạy lại: tiếp từ cursor 2, không đọc lại trang đầu
+    failing.clear()
+    requests_made.clear()
+    sink, fetched = run(flush_rows=1)
+    assert requests_made == [("list", 2)] and fetched == 3
+    cids = pq.read_table(dataset).column("cid").to_pylist()
+    assert sorted(cids) == ["c1", "c2", "c3", "r1"]
+    assert sink.checkpoint["v1"]["done"]
+
+    # Video đã xong: không request thêm
+    requests_made.clear()
+    assert run(flush_rows=1)[1] == 0 and requests_made == []
+
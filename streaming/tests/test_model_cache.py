@@ -0,0 +1,79 @@
+import hashlib
+import os
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from processing import model_cache
+
+
+def _fake_hub(tmp_path, repos):
+    """HfApi/hf_hub_download giả: repos = {repo_id: {filename: bytes}}"""
+    def model_info(repo_id, revision, files_metadata, token):
+        siblings = [
+            SimpleNamespace(
+                rfilename=name,
+                lfs=SimpleNamespace(sha256=hashlib.sha256(data).hexdigest())
+                if name.endswith(".safetensors") else None,
+            )
+            for name, data in repos[repo_id].items()
+        ]
+        return SimpleNamespace(sha="commit123", siblings=siblings)
+
+    def hf_hub_download(repo_id, filename, revision, token, cache_dir):
+        path = os.path.join(cache_dir, repo_id.replace("/", "_") + "_" + filename)
+        with open(path, "wb") as f:
+            f.write(repos[repo_id][filename])
+        return path
+
+    api = MagicMock()
+    api.return_value.model_info.side_effect = model_info
+    return patch("huggingface_hub.HfApi", api), patch("huggingface_hub.hf_hub_download", side_effect=hf_hub_download)
+
+
+def test_populate_then_offline_resolve(tmp_path):
+    """Populate 1 lần, sau đó offline mode load từ snapshot, blob trùng nội dung chỉ lưu 1 lần"""
+    repos = {
+        "org/text": {"config.json": b"{}", "model.safetensors": b"W" * 100, "pytorch_model.bin": b"old"},
+        "org/text-v2": {"config.json": b"{}", "model.safetensors": b"W" * 100},
+    }
+    api_patch, dl_patch = _fake_hub(tmp_path, repos)
+    cache = model_cache.ModelCache(root=str(tmp_path / "cache"), offline=False)
+    with api_patch, dl_patch as mock_download:
+        snapshot = cache.resolve("org/text")
+        cache.resolve("org/text-v2")
+        cache.resolve("org/text")  # đã cache -> không tải lại
+    assert mock_download.call_count == 4  # .bin bị bỏ qua vì đã có safetensors
+
+    with open(os.path.join(snapshot, "model.safetensors"), "rb") as f:
+        assert f.read() == b"W" * 100
+    assert not os.path.exists(os.path.join(snapshot, "pytorch_model.bin"))
+    assert len(os.listdir(tmp_path / "cache" / "blobs")) == 2
+
+    offline = model_cache.ModelCache(root=str(tmp_path / "cache"), offline=True)
+    assert offline.resolve("org/text") == snapshot
+    with pytest.raises(model_cache.ModelCacheMiss):
+        offline.resolve("org/unknown")
+
+
+def test_verify_detects_corruption_and_hub_mismatch(tmp_path):
+    """verify hash lại file; SHA256 lệch với LFS metadata của Hub thì không cache"""
+    repos = {"org/video": {"config.json": b"{}", "model.safetensors": b"V" * 10}}
+    api_patch, dl_patch = _fake_hub(tmp_path, repos)
+    cache = model_cache.ModelCache(root=str(tmp_path / "cache"), offline=False)
+    with api_patch, dl_patch:
+        snapshot = cache.resolve("org/video")
+    assert cache.verify() == []
+
+    blob = os.path.realpath(os.path.join(snapshot, "model.safetensors"))
+    with open(blob, "wb") as f:
+        f.write(b"X" * 10)  # cùng size, khác nội dung
+    assert cache.verify() == ["org/video@main"]
+
+    with pytest.raises(ValueError):
+        cache._store_blob(blob, expected_sha256="0" * 64)
+
+
+def test_resolve_model_path_keeps_local_dirs(tmp_path):
+    """Path local không đi qua cache"""
+    assert model_cache.resolve_model_path(str(tmp_path)) == str(tmp_path)
+    assert model_cache.resolve_model_path("/models/text/best_checkpoint") == "/models/text/best_checkpoint"
@@ -86,6 +86,30 @@ def test_process_video_logic_success(mock_remove, mock_vr, mock_boto, mock_get_m
     assert result["verdict"] == "harmful"
     assert result["risk_score"] == 0.9
     
+# --- TEST AUDIO LOGIC ---
+@patch("processing.spark_processor.get_audio_model")
+@patch("processing.spark_processor.boto3.client")
+@patch("processing.spark_processor.load_audio")
+def test_process_audio_logic_decodes_object_bytes(mock_load_audio, mock_boto, mock_get_model):
+    """Audio FLAC/Opus đọc thẳng từ MinIO (bytes) qua shared decode helper"""
+    from processing.spark_processor import process_audio_logic
+
+    mock_boto.return_value.get_object.return_value = {"Body": MagicMock(read=lambda: b"fLaC...")}
+    mock_get_model.return_value = (MagicMock(), MagicMock())
+    mock_tensor = MagicMock()
+    mock_tensor[0][1].item.return_value = 0.2
+
+    with patch("processing.spark_processor.torch.nn.functional.softmax", return_value=mock_tensor):
+        result = process_audio_logic("vid1", "tiktok-raw-audios/raw/safe/vid1.flac")
+
+    mock_boto.return_value.get_object.assert_called_once_with(
+        Bucket="tiktok-raw-audios", Key="raw/safe/vid1.flac"
+    )
+    mock_load_audio.assert_called_once_with(b"fLaC...", 16000)
+    assert result == {"risk_score": 0.2, "verdict": "safe", "status": "Success"}
+    assert process_audio_logic("vid1", None)["status"] == "Skip"
+
+
 # --- TEST FUSION LOGIC ---
 def test_process_fusion_logic_missing_data():
     """Test fusion logic with missing data"""
@@ -94,3 +118,224 @@ def test_process_fusion_logic_missing_data():
     
     result = process_fusion_logic("vid1", "path", None)
     assert result["verdict"] == "MissingData"
+
+# --- TEST MODEL MANAGER (RAM budget + LRU) ---
+class _FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+    def parameters(self):
+        return []
+
+
+def test_model_manager_evicts_least_recently_used():
+    """Load model mới vượt budget -> unload model ít dùng gần đây nhất"""
+    from processing.spark_processor import ModelManager
+
+    sizes_mb = {"text": 600, "video": 300, "fusion": 900}
+    size_fn = lambda modules: sum(sizes_mb[m.name] for m in modules) * 2**20
+    registry = MagicMock()
+    manager = ModelManager(registry, budget_mb=1500, size_fn=size_fn)
+
+    video = _FakeModel("video")
+    text_loader = MagicMock(return_value=("tok", _FakeModel("text")))
+    manager.get("text", text_loader, lambda: 600 * 2**20)
+    manager.get("video", lambda: ("proc", video), lambda: 300 * 2**20)
+    manager.get("text", text_loader)  # text dùng lại -> video thành LRU
+    manager.get("fusion", lambda: (_FakeModel("fusion"), "tok", "proc"), lambda: 900 * 2**20)
+
+    info = manager.residency()
+    assert list(info["models"]) == ["text", "fusion"]
+    assert info["total_mb"] == 1500
+    text_loader.assert_called_once()
+    assert registry.release.call_args[0][0] == [video]
+
+
+def test_fusion_estimate_excludes_resident_backbones(monkeypatch):
+    """Backbone text đã resident -> fusion chỉ cần thêm phần còn lại, không evict text"""
+    from processing import spark_processor as sp
+
+    text_backbone = _FakeModel("text_backbone")
+    monkeypatch.setattr(sp, "weights_nbytes", lambda path: 48 * 2**20)
+    monkeypatch.setattr(sp, "module_nbytes", lambda modules: 27 * 2**20 * len(modules))
+    monkeypatch.setattr(sp, "fusion_backbone_paths", lambda: ("/m/text", "/m/video"))
+    registry = sp.ModelRegistry()
+    registry.register_backbone("text", "/m/text", text_backbone)
+    monkeypatch.setattr(sp, "MODEL_REGISTRY", registry)
+
+    assert sp.estimate_fusion_nbytes() == 21 * 2**20
+    registry.register_backbone("video", "/m/video", _FakeModel("video_backbone"))
+    assert sp.estimate_fusion_nbytes() == 0
+
+
+# --- TEST MODEL REGISTRY (backbone dùng chung) ---
+class _FakeModule:
+    """Module giả: params có cờ is_meta, load_state_dict(assign=True) materialize theo key."""
+
+    def __init__(self, names, meta=False):
+        self.params = {n: MagicMock(is_meta=meta) for n in names}
+        self.loaded_keys = []
+
+    def parameters(self):
+        return list(self.params.values())
+
+    def named_parameters(self):
+        return list(self.params.items())
+
+    def state_dict(self):
+        return {}
+
+    def load_state_dict(self, state_dict, strict=True, assign=False):
+        params = dict(self.named_parameters())
+        for key in state_dict:
+            self.loaded_keys.append(key)
+            if key in params:
+                params[key].is_meta = False
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+
+def _fake_classifier(backbone=None):
+    model = MagicMock()
+    model.base_model = backbone or _FakeModule(["layer.w"])
+    return model
+
+
+def test_registry_reuses_classifier_backbone_and_pickles():
+    """Classifier load trước -> fusion dùng luôn classifier.base_model; registry pickle được"""
+    import pickle
+    from processing.spark_processor import ModelRegistry
+
+    registry = ModelRegistry()
+    model = _fake_classifier()
+    loader = MagicMock(return_value=model)
+    with patch.dict(ModelRegistry.LOADERS, {"text": loader}):
+        assert registry.classifier("text", "/m/text") is model
+        assert registry.classifier("text", "/m/text") is model
+        assert registry.backbone("text", "/m/text") is model.base_model
+    loader.assert_called_once_with("/m/text")
+    assert registry.peek_backbone("video", "/m/video") is None
+
+    restored = pickle.loads(pickle.dumps(ModelRegistry()))  # UDF gửi sang executor
+    assert restored.loaded() == []
+    restored.register_backbone("text", "/m/text", "bb")
+
+
+def test_classifier_builds_on_backbone_registered_by_fusion():
+    """Fusion load trước -> classifier chỉ dựng head; checkpoint khác backbone -> load riêng"""
+    from processing import spark_processor as sp
+
+    shared = _FakeModule(["layer.w"])
+    state_dict = {"bert.layer.w": MagicMock(), "classifier.w": MagicMock()}
+
+    def from_config(config):
+        head = _FakeModule(["classifier.w"], meta=True)
+        head.base_model_prefix = "bert"
+        return head
+
+    registry = sp.ModelRegistry()
+    registry.register_backbone("text", "/m/text", shared)
+    own_copy = _fake_classifier()
+    loader = MagicMock(return_value=own_copy)
+    with patch.dict(sp.ModelRegistry.LOADERS, {"text": loader}), \
+         patch.dict(sp.ModelRegistry.FROM_CONFIG, {"text": from_config}), \
+         patch.object(sp, "AutoConfig", MagicMock()), \
+         patch.object(sp, "resolve_weights_file", lambda path: path + "/model.safetensors"), \
+         patch.object(sp, "load_weights_mmap", return_value=state_dict):
+        model = registry.classifier("text", "/m/text")
+
+        assert model.bert is shared  # không load lại backbone
+        assert model.loaded_keys == ["classifier.w"]
+        loader.assert_not_called()
+
+        # Checkpoint classifier có backbone khác (fine-tune riêng) -> không dùng chung
+        other = sp.ModelRegistry()
+        other.register_backbone("text", "/m/text", shared)
+        with patch.object(sp, "_diverges", return_value=True):
+            assert other.classifier("text", "/m/text") is own_copy
+    loader.assert_called_once_with("/m/text")
+
+
+class _FakeFusion(_FakeModule):
+    def __init__(self, config, text_backbone=None, video_backbone=None):
+        super().__init__(["head.w"], meta=True)
+        self.text_backbone = text_backbone
+        self.video_backbone = video_backbone
+
+    def named_parameters(self):
+        items = list(self.params.items())
+        for prefix, module in (("text_backbone.", self.text_backbone), ("video_backbone.", self.video_backbone)):
+            items += [(prefix + n, p) for n, p in module.named_parameters()]
+        return items
+
+
+def test_build_fusion_model_materializes_every_parameter(monkeypatch):
+    """Backbone đã có -> dùng chung; backbone mới dựng trên meta rồi gán từ checkpoint fusion"""
+    from processing import spark_processor as sp
+
+    registry = sp.ModelRegistry()
+    text_backbone = _FakeModule(["layer.w"])
+    registry.register_backbone("text", "/m/text", text_backbone)
+    monkeypatch.setattr(sp, "MODEL_REGISTRY", registry)
+    monkeypatch.setattr(sp, "LateFusionModel", _FakeFusion)
+    monkeypatch.setattr(sp, "AutoConfig", MagicMock())
+    auto_model = MagicMock()
+    auto_model.from_config.side_effect = lambda config: _FakeModule(["layer.w"], meta=True)
+    monkeypatch.setattr(sp, "AutoModel", auto_model)
+    monkeypatch.setattr(sp, "load_weights_mmap", lambda path: {
+        "text_backbone.layer.w": MagicMock(),
+        "video_backbone.layer.w": MagicMock(),
+        "head.w": MagicMock(),
+    })
+
+    config = {"text_model_path": "/m/text", "video_model_path": "/m/video"}
+    model = sp.build_fusion_model(config, "/m/fusion/model.safetensors")
+
+    assert not [n for n, p in model.named_parameters() if p.is_meta]
+    assert model.text_backbone is text_backbone
+    assert "text_backbone.layer.w" not in model.loaded_keys  # không ghi đè backbone dùng chung
+    assert registry.peek_backbone("video", "/m/video") is model.video_backbone
+
+    # Checkpoint thiếu weights -> không để lại tham số meta âm thầm
+    monkeypatch.setattr(sp, "MODEL_REGISTRY", sp.ModelRegistry())
+    monkeypatch.setattr(sp, "load_weights_mmap", lambda path: {"head.w": MagicMock()})
+    with pytest.raises(KeyError):
+        sp.build_fusion_model(config, "/m/fusion/model.safetensors")
+
+
+# --- TEST LAZY IMPORTS + STARTUP PROFILE ---
+def test_lazy_import_resolves_on_first_use_and_pickles():
+    """Module chỉ được import khi dùng lần đầu; pickle giữ nguyên dạng proxy chưa import"""
+    import pickle
+    from processing import spark_processor as sp
+
+    proxy = sp._LazyImport("colorsys", "rgb_to_hsv")
+    assert "colorsys.rgb_to_hsv" not in sp.IMPORT_TIMES
+
+    clone = pickle.loads(pickle.dumps(proxy))  # gửi sang executor trước khi dùng
+    assert object.__getattribute__(clone, "_target") is None
+
+    assert proxy(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "colorsys.rgb_to_hsv" in sp.IMPORT_TIMES
+    assert clone(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+
+    module_proxy = sp._LazyImport("wave")
+    assert module_proxy.Error.__name__ == "Error"
+
+
+def test_profile_startup_reports_import_and_load_times(monkeypatch):
+    """--profile-startup: JSON gồm thời gian import, load từng model, residency"""
+    from processing import spark_processor as sp
+
+    monkeypatch.setattr(sp, "get_text_model", sp.timed_model_load("text")(lambda: ("tok", "model")))
+    monkeypatch.setattr(sp, "get_video_model", MagicMock(side_effect=RuntimeError("no weights")))
+
+    report = sp.profile_startup(["text", "video"])
+
+    assert set(report) == {"module_import_sec", "imports_sec", "model_load_sec", "residency", "total_sec"}
+    assert "text" in report["model_load_sec"]
+    assert report["total_sec"] >= report["module_import_sec"]
@@ -2,7 +2,6 @@ import torch
 from torch.utils.data import Dataset
 import os
 import json
-import torchaudio
 import random
 import sys
 
@@ -15,6 +14,7 @@ from configs.paths import (
     MASTER_TEST_INDEX,
     BASE_PROJECT_PATH,
 )
+from shared_utils.audio_io import load_audio
 
 
 def load_audio_data(split="train"):
@@ -29,6 +29,17 @@ def load_audio_data(split="train"):
         return json.load(f)
 
 
+def _find_audio(path):
+    """Index cũ trỏ tới .wav: thử thêm .flac / .opus cùng tên (audio đã nén)."""
+    if os.path.exists(path):
+        return path
+    stem = os.path.splitext(path)[0]
+    for ext in (".flac", ".opus"):
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return path
+
+
 class AudioDataset(Dataset):
     def __init__(
         self,
@@ -50,25 +61,14 @@ class AudioDataset(Dataset):
     def __getitem__(self, idx):
         item = self.data[idx]
         rel_audio_path = item.get("audio_path", item["path"].replace(".mp4", ".wav"))
-        full_audio_path = os.path.join(BASE_PROJECT_PATH, rel_audio_path)
+        full_audio_path = _find_audio(os.path.join(BASE_PROJECT_PATH, rel_audio_path))
 
         speech = torch.zeros(self.max_samples)  # Mặc định là im lặng
 
         if os.path.exists(full_audio_path):
             try:
-                waveform, sr = torchaudio.load(full_audio_path)
-
-                # Resample về 16k
-                if sr != self.sampling_rate:
-                    waveform = torchaudio.transforms.Resample(sr, self.sampling_rate)(
-                        waveform
-                    )
-
-                # Chuyển về Mono
-                if waveform.shape[0] > 1:
-                    waveform = waveform.mean(dim=0)
-                else:
-                    waveform = waveform.squeeze()
+                # WAV / FLAC / Opus -> mono float32 đã resample về sampling_rate
+                waveform = load_audio(full_audio_path, self.sampling_rate)
 
                 curr_len = waveform.size(0)
 
@@ -28,6 +28,8 @@ TEXT_PROCESSED_DIR = os.path.join(PROCESSED_DIR, "text")
 TEXT_TRAIN_CSV = os.path.join(TEXT_PROCESSED_DIR, "train_split.csv")
 TEXT_VAL_CSV = os.path.join(TEXT_PROCESSED_DIR, "eval_split.csv")  # eval = val
 TEXT_TEST_CSV = os.path.join(TEXT_PROCESSED_DIR, "test_split.csv")
+# Cache text đã làm sạch theo split (shared_utils.text_normalize.clean_split)
+TEXT_CLEAN_CACHE_DIR = os.path.join(TEXT_PROCESSED_DIR, "clean_cache")
 
 # 6. Master Index Splits (Video)
 SPLIT_DIR = os.path.join(CURRENT_DIR, "data_splits")
@@ -9,8 +9,6 @@ import sys
 import numpy as np
 import pandas as pd
 import json
-import re
-import unicodedata
 
 # Setup path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -26,26 +24,15 @@ from configs.paths import (
     TEXT_VAL_CSV,
     TEXT_TEST_CSV,
     BASE_PROJECT_PATH,
+    TEXT_CLEAN_CACHE_DIR,
 )
 from shared_utils.processing import extract_frames
+from shared_utils.text_normalize import clean_split, normalize
 
 
 def clean_text(text):
-    """Làm sạch text đã được concat."""
-    if not isinstance(text, str):
-        return ""
-    text = unicodedata.normalize("NFKC", text).lower()
-    text = re.sub(r"[\u200b\u200c\u200d\ufeff]", "", text)
-    text = re.sub(r"http\S+|www\S+|https\S+", " [url] ", text)
-    text = re.sub(r"#(\w+)", r"\1", text)
-    text = re.sub(r"(.)\1{2,}", r"\1\1", text)
-    text = re.sub(r"@\S+", " [user] ", text)
-    text = re.sub(r"\b\d{5,}\b", " [num] ", text)
-    text = re.sub(r"[\.]{3,}", "..", text)
-    text = re.sub(r"[!]{3,}", "!!", text)
-    text = re.sub(r"[?]{3,}", "??", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    """Làm sạch text đã được concat (profile "fusion" của shared_utils.text_normalize)."""
+    return normalize(text, "fusion")
 
 
 def load_fusion_data(split="train"):
@@ -109,12 +96,17 @@ class EnsembleDataset(Dataset):
         text_tokenizer,
         num_frames=16,
         max_len=512,
+        clean_cache_dir=TEXT_CLEAN_CACHE_DIR,
     ):
         self.data = data_list
         self.video_processor = video_processor
         self.text_tokenizer = text_tokenizer
         self.num_frames = num_frames
         self.max_len = max_len
+        # Làm sạch text cả split 1 lần (cache ra đĩa), không làm lại mỗi epoch
+        self.texts = clean_split(
+            [str(item["text"]) for item in data_list], "fusion", clean_cache_dir
+        )
 
     def __len__(self):
         return len(self.data)
@@ -136,9 +128,7 @@ class EnsembleDataset(Dataset):
         v_inputs = self.video_processor(list(frames), return_tensors="pt")
 
         # 2. Xử lý Text - Đơn giản, text đã concat
-        raw_text = str(item["text"])
-        cleaned_text = clean_text(raw_text)
-        
+        cleaned_text = self.texts[idx]  # đã clean ở __init__
         if not cleaned_text:
             cleaned_text = "[empty]"
 
@@ -0,0 +1,82 @@
+"""
+Decode audio (WAV / FLAC / Opus) thành waveform mono float32 tại 16 kHz.
+
+Dùng chung cho training (AudioDataset) và streaming (Spark audio UDF, mount
+train_eval_module tại /models): ingestion có thể lưu audio dạng FLAC/Opus
+(AUDIO_FORMAT) thay cho WAV PCM, phía đọc không cần biết định dạng.
+
+- soundfile (libsndfile) đọc trực tiếp WAV/FLAC/Ogg nếu đã đúng sampling rate.
+- Còn lại (Opus trên libsndfile cũ, sai sampling rate, không có soundfile)
+  -> ffmpeg decode + resample + downmix ra float32 qua pipe.
+"""
+
+import io
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+try:
+    import soundfile as sf
+except ImportError:  # soundfile là tuỳ chọn, ffmpeg luôn dùng được
+    sf = None
+
+SAMPLING_RATE = 16000
+
+
+def _decode_soundfile(source, sampling_rate):
+    if sf is None:
+        return None
+    try:
+        data, sr = sf.read(
+            io.BytesIO(source) if isinstance(source, bytes) else source,
+            dtype="float32",
+            always_2d=True,
+        )
+    except Exception:
+        return None
+    if sr != sampling_rate:
+        return None  # để ffmpeg resample
+    return data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+
+
+def _decode_ffmpeg(source, sampling_rate):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("Không tìm thấy ffmpeg để decode audio")
+    from_pipe = isinstance(source, bytes)
+    cmd = [
+        ffmpeg, "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0" if from_pipe else source,
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", "1", "-ar", str(sampling_rate),
+        "pipe:1",
+    ]
+    result = subprocess.run(
+        cmd, input=source if from_pipe else None, capture_output=True, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def decode_audio(source, sampling_rate=SAMPLING_RATE):
+    """
+    Args:
+        source: path file audio hoặc bytes (object tải từ MinIO)
+        sampling_rate: sampling rate đầu ra
+    Returns:
+        np.ndarray float32 1 chiều (mono), giá trị trong [-1, 1]
+    """
+    if not isinstance(source, bytes) and not os.path.exists(source):
+        raise FileNotFoundError(source)
+    data = _decode_soundfile(source, sampling_rate)
+    if data is None:
+        data = _decode_ffmpeg(source, sampling_rate)
+    return np.ascontiguousarray(data, dtype=np.float32)
+
+
+def load_audio(source, sampling_rate=SAMPLING_RATE):
+    """Như decode_audio nhưng trả về torch.FloatTensor [samples]."""
+    import torch
+
+    return torch.from_numpy(decode_audio(source, sampling_rate))
@@ -0,0 +1,198 @@
+"""
+Chuẩn hoá text dùng chung (ingestion, text training, fusion training).
+
+Mỗi profile giữ đúng output của cleaner cũ tương ứng:
+- "ingestion": clients/data_cleaner.clean_text_advanced (có teencode)
+- "text":      text/src/dataset.clean_text (giữ [SEP])
+- "fusion":    fusion/src/dataset.clean_text ([url] / [user] / [num])
+
+Khác cleaner cũ:
+- Pattern compile 1 lần ở module level, các bước độc lập được gộp
+  (dấu câu lặp -> 1 pattern, \\s+ -> split/join).
+- Teencode thay 1 lượt bằng 1 regex (thay vì split + tra dict từng từ).
+- clean_batch(list[str]): text trùng chỉ làm sạch 1 lần; clean_split() cache kết quả
+  của cả split ra đĩa -> training không làm sạch lại mỗi epoch / mỗi lần chạy.
+"""
+
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+# Tăng khi đổi logic của bất kỳ profile nào -> cache cũ tự hết hiệu lực
+VERSION = 1
+
+# Từ điển Teencode đầy đủ (từ preprocess_new.py)
+TEENCODE_DICT = {
+    "ko": "không",
+    "k": "không",
+    "kh": "không",
+    "dc": "được",
+    "đc": "được",
+    "t": "tôi",
+    "tao": "tôi",
+    "nt": "nhắn tin",
+    "fb": "facebook",
+    "hnay": "hôm nay",
+    "ng": "người",
+    "mn": "mọi người",
+    "ae": "anh em",
+    "v": "vậy",
+    "add": "thêm",
+    "ib": "inbox",
+    "fuck": "địt",
+    "đm": "địt mẹ",
+    "vcl": "vãi cả lồn",
+    "dell": "đéo",
+    "éo": "đéo",
+    "clgt": "cái lồn gì thế",
+    "vkl": "vãi cả lồn",
+}
+
+# --- PATTERNS (compile 1 lần) ---
+_REPEAT = re.compile(r"(.)\1{2,}")  # "đẹpppp" -> "đẹpp"
+
+# ingestion
+_ING_DROP = re.compile(r"http\S+|www\.\S+|\S+@\S+|@\w+")  # URL, email, mention
+_ING_SPECIAL = re.compile(r"[^\w\s.,?!:;'\"]")
+# Cả token (phân tách bởi whitespace như str.split), key dài trước
+_TEENCODE = re.compile(
+    r"(?<!\S)(?:"
+    + "|".join(re.escape(k) for k in sorted(TEENCODE_DICT, key=len, reverse=True))
+    + r")(?!\S)"
+)
+
+# text
+_TEXT_ZERO_WIDTH = re.compile(r"[\u200b\u200c\u200d\ufeff\u00ad]")
+_TEXT_URL = re.compile(r"https?://\S+|www\.\S+")
+_TEXT_MENTION = re.compile(r"@[\w\.]+")
+_TEXT_HASHTAG = re.compile(r"#(\w+)")
+_TEXT_PUNCT = re.compile(r"([.!?])\1+")  # "..", "!!", "??" -> 1 ký tự
+_TEXT_LONG_NUMBER = re.compile(r"\b\d{7,}\b")  # số điện thoại, ID
+_TEXT_SEP = re.compile(r"\s*\[SEP\]\s*")
+_TEXT_SPECIAL = re.compile(r"[\_\-\=\+\*\~\`\|\\\<\>]+")
+
+# fusion
+_FUSION_ZERO_WIDTH = re.compile(r"[\u200b\u200c\u200d\ufeff]")
+_FUSION_URL = re.compile(r"http\S+|www\S+")
+_FUSION_HASHTAG = _TEXT_HASHTAG
+_FUSION_MENTION = re.compile(r"@\S+")
+_FUSION_NUMBER = re.compile(r"\b\d{5,}\b")
+
+
+def _teencode(match):
+    return TEENCODE_DICT[match.group(0)]
+
+
+# --- PROFILES ---
+def clean_ingestion(text):
+    """
+    - Xóa URL, mentions, email
+    - Xóa ký tự đặc biệt (giữ lại dấu câu cơ bản)
+    - Chuyển teencode
+    - Xóa ký tự lặp quá 2 lần
+    """
+    if not text or str(text) == "nan":
+        return ""
+    text = _ING_DROP.sub("", str(text).lower())
+    text = _ING_SPECIAL.sub(" ", text)
+    text = " ".join(_TEENCODE.sub(_teencode, text).split())
+    return _REPEAT.sub(r"\1\1", text)
+
+
+def clean_text(text):
+    """Text TikTok tiếng Việt trước khi tokenize, giữ nguyên [SEP]."""
+    if not isinstance(text, str) or not text.strip():
+        return ""
+    text = _TEXT_ZERO_WIDTH.sub("", unicodedata.normalize("NFC", text))
+    text = _TEXT_URL.sub(" ", text)
+    text = _TEXT_MENTION.sub(" ", text)
+    text = _TEXT_HASHTAG.sub(r" \1 ", text)
+    # Emoji giữ nguyên (mang ý nghĩa), tokenizer tự xử lý
+    text = _REPEAT.sub(r"\1\1", text)
+    text = _TEXT_PUNCT.sub(r"\1", text)
+    text = _TEXT_LONG_NUMBER.sub(" ", text)
+    text = _TEXT_SEP.sub(" [SEP] ", text)
+    text = " ".join(_TEXT_SPECIAL.sub(" ", text).split())
+    # Text quá ngắn hoặc chỉ có [SEP]
+    if len(text.replace("[SEP]", "").strip()) < 2:
+        return ""
+    return text
+
+
+def clean_fusion(text):
+    """Text đã concat cho fusion model."""
+    if not isinstance(text, str):
+        return ""
+    text = _FUSION_ZERO_WIDTH.sub("", unicodedata.normalize("NFKC", text).lower())
+    text = _FUSION_URL.sub(" [url] ", text)
+    text = _FUSION_HASHTAG.sub(r"\1", text)
+    text = _REPEAT.sub(r"\1\1", text)
+    text = _FUSION_MENTION.sub(" [user] ", text)
+    text = _FUSION_NUMBER.sub(" [num] ", text)
+    # Cleaner cũ còn thay "..." / "!!!" / "???" ở đây: sau _REPEAT không còn chuỗi
+    # lặp >= 3 và các token chèn vào đều có khoảng trắng 2 bên -> bỏ được.
+    return " ".join(text.split())
+
+
+PROFILES = {
+    "ingestion": clean_ingestion,
+    "text": clean_text,
+    "fusion": clean_fusion,
+}
+
+
+def normalize(text, profile="ingestion"):
+    return PROFILES[profile](text)
+
+
+def clean_batch(texts, profile="ingestion"):
+    """Làm sạch cả list; text trùng (comment copy-paste, spam) chỉ xử lý 1 lần.
+
+    Returns:
+        list[str]: cùng thứ tự / độ dài với texts
+    """
+    clean = PROFILES[profile]
+    seen = {}
+    out = []
+    for text in texts:
+        try:
+            cleaned = seen[text]
+        except KeyError:
+            cleaned = seen[text] = clean(text)
+        except TypeError:  # không hash được (list, dict...)
+            cleaned = clean(text)
+        out.append(cleaned)
+    return out
+
+
+def clean_split(texts, profile, cache_dir=None):
+    """clean_batch cho cả 1 split, cache ra cache_dir/<profile>_<hash>.json.
+
+    Key = hash(nội dung texts, profile, VERSION): split đổi dữ liệu hoặc đổi logic
+    -> tự làm sạch lại.
+    """
+    texts = list(texts)
+    if not cache_dir:
+        return clean_batch(texts, profile)
+
+    digest = hashlib.sha1(f"{profile}:{VERSION}".encode("utf-8"))
+    for text in texts:
+        digest.update(repr(text).encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    path = os.path.join(cache_dir, f"{profile}_{digest.hexdigest()[:16]}.json")
+
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            cleaned = json.load(f)
+        if len(cleaned) == len(texts):
+            return cleaned
+
+    cleaned = clean_batch(texts, profile)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cleaned, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return cleaned